@@ -0,0 +1,82 @@
+import asyncio
+import logging
+from datetime import date
+from decimal import Decimal
+
+from aiogram import BaseMiddleware
+
+import db
+
+
+class ActivityTracker(BaseMiddleware):
+    """Зовнішній middleware на update: збирає id активних користувачів у пам'яті.
+
+    Раз на interval секунд множина пишеться в базу одним запитом, тож
+    апдейт коштує лише додавання в set. Нові за день користувачі додаються
+    до daily_stats.active_users. Незаписане на момент падіння губиться.
+    """
+
+    def __init__(self, interval: float = 60):
+        self.interval = interval
+        self.seen: set[int] = set()
+        self._pruned: date | None = None
+        self._task: asyncio.Task | None = None
+
+    async def __call__(self, handler, event, data):
+        user = data.get('event_from_user')
+        if user is not None:
+            self.seen.add(user.id)
+        return await handler(event, data)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def flush(self):
+        seen, self.seen = self.seen, set()
+        try:
+            await db.record_activity(list(seen))
+            if self._pruned != date.today():
+                await db.prune_activity()
+                self._pruned = date.today()
+        except Exception as e:
+            logging.error(f"Не вдалося записати активність: {e}")
+            # Спробуємо з наступною порцією; повторний запис відсіче user_activity
+            self.seen |= seen
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+
+def stats_text(stats: dict) -> str:
+    lines = ['📊 Статистика', '']
+    lines.append('Дата · активні · нові · з них оплатили · поповнення')
+    registrations = converted = 0
+    for row in stats['days']:
+        registrations += row['registrations']
+        converted += row['converted']
+        lines.append(
+            f"{row['day']:%d.%m} · {row['active_users']} · {row['registrations']} · {row['converted']} · "
+            f"{row['topups']} на {row['topup_total']:.2f} USDT"
+        )
+    if not stats['days']:
+        lines.append('даних ще немає')
+    lines.append('')
+    if registrations:
+        lines.append(f"Конверсія в перший платіж: {converted / registrations:.1%} ({converted} з {registrations})")
+    users = stats['users']
+    average = stats['balance'] / users if users else Decimal(0)
+    lines.append(f"Користувачів: {users}, середній баланс: {average:.2f} USDT")
+    return '\n'.join(lines)
@@ -0,0 +1,228 @@
+import asyncio
+import logging
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+import db
+import metrics
+from outbox import TokenBucket
+
+DELIVERIES = metrics.Counter('broadcast_messages_total', 'Broadcast deliveries by result', ('result',))
+
+CREATE_SQL = "INSERT INTO broadcasts(text, created_by) VALUES ($1, $2) RETURNING id"
+
+RUNNING_SQL = "SELECT id FROM broadcasts WHERE status = 'running' ORDER BY id"
+
+# Оренда розсилки: інший процес не підхопить її, поки власник оновлює heartbeat_at
+CLAIM_SQL = """
+UPDATE broadcasts SET heartbeat_at = now()
+WHERE id = $1
+  AND status = 'running'
+  AND (heartbeat_at IS NULL OR heartbeat_at < now() - make_interval(secs => $2))
+RETURNING text, created_by, last_user_id
+"""
+
+RELEASE_SQL = "UPDATE broadcasts SET heartbeat_at = NULL WHERE id = $1"
+
+# Наступна пачка отримувачів за первинним ключем, без довгої транзакції
+RECIPIENTS_SQL = """
+SELECT user_id FROM users
+WHERE user_id > $1 AND NOT is_blocked
+ORDER BY user_id
+LIMIT $2
+"""
+
+# Прогрес і заблоковані користувачі однією транзакцією; без рядка у відповіді — розсилку скасовано
+CHECKPOINT_SQL = """
+WITH blocked AS (
+    UPDATE users SET is_blocked = true WHERE user_id = ANY($5::bigint[])
+)
+UPDATE broadcasts
+SET last_user_id = $2,
+    sent = sent + $3,
+    failed = failed + $4,
+    blocked = blocked + cardinality($5::bigint[]),
+    heartbeat_at = now()
+WHERE id = $1 AND status = 'running'
+RETURNING id
+"""
+
+FINISH_SQL = """
+UPDATE broadcasts SET status = 'done', finished_at = now()
+WHERE id = $1 AND status = 'running'
+RETURNING sent, failed, blocked
+"""
+
+# Після max_attempts помилок поспіль: resume() її вже не підхопить, адмін бачить статус
+FAIL_SQL = """
+UPDATE broadcasts SET status = 'failed', finished_at = now()
+WHERE id = $1 AND status = 'running'
+RETURNING sent, failed, blocked
+"""
+
+CANCEL_SQL = """
+UPDATE broadcasts SET status = 'cancelled', finished_at = now()
+WHERE id = $1 AND status = 'running'
+RETURNING sent, failed, blocked
+"""
+
+
+class Broadcaster:
+    """Розсилка повідомлення всім користувачам з відновленням після перезапуску.
+
+    Отримувачі читаються пачками по batch_size за user_id. Після кожної пачки
+    в broadcasts зберігається останній user_id, тож після збою повторно
+    можуть отримати повідомлення не більше ніж batch_size користувачів.
+    Темп — не більше rate повідомлень на секунду, щоб лишити частину
+    глобального ліміту Telegram звичайним відповідям бота. Помилку бази чи
+    мережі розсилка переживає повторами з паузою, що подвоюється; після
+    max_attempts невдач поспіль вона отримує статус 'failed'.
+    """
+
+    def __init__(
+        self,
+        bot,
+        rate: float = 20,
+        concurrency: int = 25,
+        batch_size: int = 500,
+        lease: float = 120,
+        retry_delay: float = 5,
+        max_attempts: int = 5,
+    ):
+        self.bot = bot
+        self.bucket = TokenBucket(rate, rate)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.batch_size = batch_size
+        self.lease = lease
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self._tasks: dict[int, asyncio.Task] = {}
+
+    async def create(self, text: str, admin_id: int) -> int:
+        async with db.pool.acquire() as conn:
+            broadcast_id = await conn.fetchval(CREATE_SQL, text, admin_id)
+        self.start(broadcast_id)
+        return broadcast_id
+
+    def start(self, broadcast_id: int):
+        if broadcast_id not in self._tasks:
+            task = asyncio.create_task(self._run(broadcast_id))
+            self._tasks[broadcast_id] = task
+            task.add_done_callback(lambda _: self._tasks.pop(broadcast_id, None))
+
+    async def resume(self):
+        """Підхоплює розсилки, перервані зупинкою бота."""
+        async with db.pool.acquire() as conn:
+            rows = await conn.fetch(RUNNING_SQL)
+        for row in rows:
+            self.start(row['id'])
+
+    async def cancel(self, broadcast_id: int):
+        async with db.pool.acquire() as conn:
+            row = await conn.fetchrow(CANCEL_SQL, broadcast_id)
+        task = self._tasks.get(broadcast_id)
+        if task is not None:
+            task.cancel()
+        return dict(row) if row else None
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, broadcast_id: int):
+        async with db.pool.acquire() as conn:
+            claimed = await conn.fetchrow(CLAIM_SQL, broadcast_id, float(self.lease))
+        if claimed is None:
+            # Завершена, скасована або її веде інший процес
+            return
+        text, admin_id, last_user_id = claimed['text'], claimed['created_by'], claimed['last_user_id']
+        totals = error = None
+        attempt = 0
+        try:
+            while True:
+                try:
+                    async with db.pool.acquire() as conn:
+                        rows = await conn.fetch(RECIPIENTS_SQL, last_user_id, self.batch_size)
+                    if not rows:
+                        async with db.pool.acquire() as conn:
+                            totals = await conn.fetchrow(FINISH_SQL, broadcast_id)
+                        break
+                    user_ids = [row['user_id'] for row in rows]
+                    results = await asyncio.gather(*(self._send(user_id, text) for user_id in user_ids))
+                    blocked = [user_id for user_id, result in zip(user_ids, results) if result == 'blocked']
+                    async with db.pool.acquire() as conn:
+                        still_running = await conn.fetchval(
+                            CHECKPOINT_SQL,
+                            broadcast_id,
+                            user_ids[-1],
+                            results.count('sent'),
+                            results.count('failed'),
+                            blocked,
+                        )
+                    if still_running is None:
+                        return
+                    # Профіль у кеші має бачити is_blocked, інакше /start не поверне в розсилки
+                    for user_id in blocked:
+                        await db.invalidate_user(user_id)
+                    # Лише після збереженого прогресу: незбережену пачку повтор надішле ще раз
+                    last_user_id = user_ids[-1]
+                    attempt = 0
+                except Exception as e:
+                    attempt += 1
+                    if attempt >= self.max_attempts:
+                        error = e
+                        logging.error(f"Розсилку №{broadcast_id} зупинено після {attempt} помилок: {e}")
+                        async with db.pool.acquire() as conn:
+                            totals = await conn.fetchrow(FAIL_SQL, broadcast_id)
+                        break
+                    # Пауза коротша за оренду, інакше розсилку підхопить інший процес
+                    delay = min(self.retry_delay * 2 ** (attempt - 1), self.lease / 2)
+                    logging.warning(f"Помилка розсилки №{broadcast_id}, повтор через {delay:.0f} с: {e}")
+                    await asyncio.sleep(delay)
+        except Exception as e:
+            logging.error(f"Не вдалося позначити розсилку №{broadcast_id} як невдалу: {e}")
+            return
+        finally:
+            # Прогрес уже збережено; знімаємо оренду, щоб наступний запуск продовжив одразу
+            try:
+                async with db.pool.acquire() as conn:
+                    await conn.execute(RELEASE_SQL, broadcast_id)
+            except Exception as e:
+                logging.error(f"Не вдалося зняти оренду розсилки №{broadcast_id}: {e}")
+        if totals is None:
+            return
+        if error is None:
+            title = f"📣 Розсилку №{broadcast_id} завершено"
+        else:
+            title = f"⚠️ Розсилку №{broadcast_id} зупинено через помилку: {error}"
+        try:
+            await self.bot.send_message(
+                admin_id,
+                f"{title}\n"
+                f"Надіслано: {totals['sent']}\n"
+                f"Заблокували бота: {totals['blocked']}\n"
+                f"Помилок: {totals['failed']}",
+            )
+        except Exception as e:
+            logging.error(f"Не вдалося повідомити адміна про розсилку №{broadcast_id}: {e}")
+
+    async def _send(self, user_id: int, text: str) -> str:
+        async with self.semaphore:
+            delay = self.bucket.reserve()
+            if delay:
+                await asyncio.sleep(delay)
+            try:
+                await self.bot.send_message(user_id, text)
+                result = 'sent'
+            except TelegramForbiddenError:
+                # Бота заблоковано або акаунт видалено
+                result = 'blocked'
+            except TelegramBadRequest as e:
+                result = 'blocked' if 'chat not found' in str(e) else 'failed'
+            except Exception as e:
+                logging.warning(f"Розсилка: не вдалося надіслати {user_id}: {e}")
+                result = 'failed'
+        DELIVERIES.inc(result)
+        return result
@@ -0,0 +1,56 @@
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """LRU-кеш з обмеженим часом життя записів.
+
+    generation збільшується при кожній інвалідації: читач, що почав запит
+    до бази до інвалідації, не покладе в кеш застаріле значення.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._data: OrderedDict = OrderedDict()
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        value, expires_at = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, generation: int | None = None):
+        if self.maxsize <= 0:
+            return
+        if generation is not None and generation != self.generation:
+            return
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        self.generation += 1
+        self._data.pop(key, None)
+
+    def clear(self):
+        self.generation += 1
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
+
+    def __len__(self):
+        return len(self._data)
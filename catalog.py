@@ -0,0 +1,115 @@
+from dataclasses import dataclass
+
+from aiogram.types import InlineKeyboardMarkup
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from config import ITEM_INITIAL_STOCK, ITEM_PRICES
+
+BACK_TEXT = '⬅️ НАЗАД'
+BUY_PREFIX = 'buy:'
+# Кнопка "НАЗАД" з кореня каталогу веде в кабінет (окремий хендлер)
+ROOT_BACK = 'back_to_cabinet'
+
+# Дерево каталогу: категорії -> речі. Ключ вузла — його callback_data.
+# Вузол без children — товар; ціна й початковий склад задаються в config.py
+# (ITEM_PRICES, ITEM_INITIAL_STOCK), склад далі поповнює адмін через /restock.
+CATALOG = {
+    'id': 'buy_loot',
+    'text': 'Виберіть що хочете придбати',
+    'children': [
+        {
+            'id': '6_level',
+            'title': 'Речі 6-го рівня вищої якості',
+            'text': 'Виберіть річ',
+            'children': [
+                {'id': 'mk14_6', 'title': 'Mk14 6-го рівня'},
+                {'id': 'js9_6', 'title': 'JS9 6-го рівня'},
+                {'id': 'cobrar_6', 'title': 'Бронижелет("Кобра",6-го рівня)'},
+            ],
+        },
+        {
+            'id': 'gold_stuff',
+            'title': 'Золоті речі',
+            'text': 'Виберіть річ',
+            'children': [
+                {'id': 'mk14_gold', 'title': 'Mk14 золота'},
+                {'id': 'js9_gold', 'title': 'JS9 золота'},
+                {'id': 'cobrar_gold', 'title': 'Бронижелет("Кобра",золотий)'},
+            ],
+        },
+    ],
+}
+
+# Старі callback_data, що можуть лишатись на кнопках уже надісланих повідомлень
+ALIASES = {'back_to_stuff': 'buy_loot'}
+
+
+@dataclass(frozen=True)
+class Node:
+    id: str
+    title: str
+    text: str
+    parent: str | None
+    children: tuple[str, ...]
+    price: float | None
+    stock: int
+    markup: InlineKeyboardMarkup
+
+    @property
+    def is_item(self) -> bool:
+        return self.price is not None
+
+
+def _item_text(spec: dict, price: float) -> str:
+    return f"{spec['title']}\nЦіна: {price} USDT"
+
+
+def _build_markup(spec: dict, back: str, price: float | None) -> InlineKeyboardMarkup:
+    kb = InlineKeyboardBuilder()
+    if price is not None:
+        kb.button(text=f"🛒 Купити за {price} USDT", callback_data=BUY_PREFIX + spec['id'])
+    for child in spec.get('children', []):
+        kb.button(text=child['title'], callback_data=child['id'])
+    kb.button(text=BACK_TEXT, callback_data=back)
+    kb.adjust(1)
+    return kb.as_markup()
+
+
+def build(tree: dict, aliases: dict, prices: dict[str, float], initial_stock: int = 0) -> dict[str, Node]:
+    """Розгортає дерево в словник callback_data -> Node з готовими клавіатурами."""
+    nodes = {}
+
+    def walk(spec: dict, parent: str | None):
+        if spec['id'] in nodes:
+            raise ValueError(f"Duplicate catalog id: {spec['id']}")
+        price = None
+        if 'children' not in spec:
+            if spec['id'] not in prices:
+                raise ValueError(f"No price for catalog item: {spec['id']}")
+            price = prices[spec['id']]
+        nodes[spec['id']] = Node(
+            id=spec['id'],
+            title=spec.get('title', ''),
+            text=_item_text(spec, price) if price is not None else spec['text'],
+            parent=parent,
+            children=tuple(child['id'] for child in spec.get('children', [])),
+            price=price,
+            stock=initial_stock if price is not None else 0,
+            markup=_build_markup(spec, parent or ROOT_BACK, price),
+        )
+        for child in spec.get('children', []):
+            walk(child, spec['id'])
+
+    walk(tree, None)
+    for alias, target in aliases.items():
+        nodes[alias] = nodes[target]
+    return nodes
+
+
+NODES = build(CATALOG, ALIASES, ITEM_PRICES, ITEM_INITIAL_STOCK)
+ITEMS = {node.id: node for node in NODES.values() if node.is_item}
+
+
+def item_rows() -> list[tuple]:
+    """Рядки для db.sync_items."""
+    return [(node.id, node.title, node.price, node.stock) for node in ITEMS.values()]
@@ -7,3 +7,128 @@ DB_PORT = 5432
 DB_NAME = 'shop'
 DB_USER = 'shop_user'
 DB_PASSWORD = 'shop_pass'
+DB_POOL_MIN_SIZE = 5
+DB_POOL_MAX_SIZE = 20
+# Seconds to establish a connection / to run one query
+DB_CONNECT_TIMEOUT = 10
+DB_COMMAND_TIMEOUT = 10
+# Close pooled connections idle for this many seconds
+DB_MAX_INACTIVE_LIFETIME = 300
+DB_STATEMENT_CACHE_SIZE = 256
+# Query timeout for schema migrations (index builds can take long)
+DB_MIGRATION_TIMEOUT = 3600
+
+# get_user profile cache
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 30
+# Invalidate caches of other bot processes via Postgres LISTEN/NOTIFY
+USER_CACHE_PG_NOTIFY = False
+
+# CryptoPay invoice polling
+PAYMENT_POLL_INTERVAL = 3
+PAYMENT_TIMEOUT = 90
+
+# Assets accepted for top-ups; balances are kept in USDT
+PAYMENT_ASSETS = ['USDT', 'TON', 'BTC']
+# Exchange rate refresh period and the oldest rate still used (seconds)
+RATES_REFRESH_INTERVAL = 60
+RATES_MAX_AGE = 300
+
+# Payment confirmation mode: 'polling' or 'webhook'
+PAYMENT_MODE = 'polling'
+CRYPTO_WEBHOOK_HOST = '0.0.0.0'
+CRYPTO_WEBHOOK_PORT = 8081
+CRYPTO_WEBHOOK_PATH = '/cryptopay'
+
+# Telegram updates: 'polling' or 'webhook'
+BOT_MODE = 'polling'
+WEBHOOK_BASE_URL = 'https://example.com'
+WEBHOOK_PATH = '/telegram'
+WEBHOOK_SECRET = ''
+WEBHOOK_HOST = '0.0.0.0'
+WEBHOOK_PORT = 8080
+# Max updates handled at once (both modes)
+MAX_CONCURRENT_UPDATES = 100
+# Seconds to wait for in-flight handlers on shutdown
+SHUTDOWN_TIMEOUT = 30
+
+# How many recent top-ups to show after a successful payment
+PAYMENT_HISTORY_LIMIT = 10
+
+# Catalog prices in USDT by item id. PLACEHOLDERS: set the real prices before launch
+ITEM_PRICES = {
+    'mk14_6': 1.0,
+    'js9_6': 1.0,
+    'cobrar_6': 1.0,
+    'mk14_gold': 2.0,
+    'js9_gold': 2.0,
+    'cobrar_gold': 2.0,
+}
+# Stock a new catalog item starts with; admins add more with /restock
+ITEM_INITIAL_STOCK = 0
+
+# FSM storage: 'memory' (one process only) or 'postgres'
+FSM_STORAGE = 'memory'
+FSM_FLUSH_INTERVAL = 0.05
+# Drop states untouched for this many seconds
+FSM_STATE_TTL = 7 * 24 * 3600
+FSM_SWEEP_INTERVAL = 3600
+# Seconds the fsm_states metric reuses its last count
+FSM_COUNTS_TTL = 60
+
+# Prometheus /metrics endpoint (separate port, 0 disables)
+METRICS_HOST = '0.0.0.0'
+METRICS_PORT = 9090
+METRICS_PATH = '/metrics'
+
+# Outbound Telegram queue (requests per second)
+OUTBOX_ENABLED = True
+OUTBOX_GLOBAL_RATE = 30
+OUTBOX_CHAT_RATE = 1
+OUTBOX_CHAT_BURST = 5
+# Retries of one request after 429 retry_after
+OUTBOX_MAX_RETRIES = 3
+
+# Reconciliation of paid but uncredited invoices (seconds, 0 disables)
+RECONCILE_INTERVAL = 300
+# How far back to look at paid invoices
+RECONCILE_LOOKBACK = 7 * 24 * 3600
+RECONCILE_MAX_PAGES = 50
+
+# Telegram ids allowed to run admin commands (/broadcast, /restock, /stats)
+ADMIN_IDS = []
+# Broadcast messages per second (keep below OUTBOX_GLOBAL_RATE)
+BROADCAST_RATE = 20
+BROADCAST_CONCURRENCY = 25
+BROADCAST_BATCH_SIZE = 500
+
+# Support tickets: operator Telegram ids, relay workers, open tickets per operator
+SUPPORT_OPERATOR_IDS = []
+SUPPORT_WORKERS = 4
+SUPPORT_MAX_TICKETS = 5
+# Seconds between queue checks when nothing wakes the workers
+SUPPORT_POLL_INTERVAL = 2
+
+# Player marketplace: listings per page
+MARKET_PAGE_SIZE = 8
+
+# Per-user anti-spam: updates per second and burst (0 disables)
+THROTTLE_RATE = 2
+THROTTLE_BURST = 8
+# Ignore the same inline button pressed again within this many seconds
+CALLBACK_DEBOUNCE = 0.7
+
+# Logging: level, 'json' or 'text', records buffered for the writer thread
+LOG_LEVEL = 'INFO'
+LOG_FORMAT = 'json'
+LOG_QUEUE_SIZE = 10000
+# Warnings and errors kept per code line per window (0 disables the limit)
+LOG_RATE_BURST = 10
+LOG_RATE_WINDOW = 60
+
+# Append incoming updates to this file for tools/replay ('' disables, .gz compresses)
+UPDATES_RECORD_PATH = ''
+
+# /stats: days shown, seconds between writes of active users
+STATS_DAYS = 7
+STATS_ACTIVITY_FLUSH_INTERVAL = 60
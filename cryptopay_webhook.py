@@ -0,0 +1,44 @@
+import hashlib
+import hmac
+import logging
+
+from aiohttp import web
+from aiocryptopay.models.update import Update
+
+SIGNATURE_HEADER = 'Crypto-Pay-Api-Signature'
+
+
+def sign_body(token: str, body: str) -> str:
+    # https://help.crypt.bot/crypto-pay-api#verifying-webhook-updates
+    secret = hashlib.sha256(token.encode('utf-8')).digest()
+    return hmac.new(secret, body.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def verify_signature(token: str, body: str, signature: str) -> bool:
+    return hmac.compare_digest(sign_body(token, body), signature)
+
+
+def setup_cryptopay_webhook(app: web.Application, token: str, poller, path: str):
+    """Реєструє маршрут для оновлень CryptoPay (invoice_paid)."""
+
+    async def handle(request: web.Request) -> web.Response:
+        body = await request.text()
+        if not verify_signature(token, body, request.headers.get(SIGNATURE_HEADER, '')):
+            return web.Response(status=401, text='Invalid signature')
+
+        try:
+            update = Update.model_validate_json(body)
+        except ValueError:
+            return web.Response(status=400, text='Bad update')
+
+        if update.update_type == 'invoice_paid':
+            try:
+                await poller.handle_paid(update.payload)
+            except Exception as e:
+                # Не 200 — CryptoPay повторить доставку, add_payment ідемпотентний
+                logging.error(f"Помилка зарахування інвойсу {update.payload.invoice_id}: {e}")
+                return web.Response(status=500, text='Retry later')
+
+        return web.Response(text='OK')
+
+    app.router.add_post(path, handle)
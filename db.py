@@ -1,69 +1,232 @@
+import json
+import logging
+
 import asyncpg
-from config import DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD
+from config import (
+    DB_HOST,
+    DB_PORT,
+    DB_NAME,
+    DB_USER,
+    DB_PASSWORD,
+    DB_POOL_MIN_SIZE,
+    DB_POOL_MAX_SIZE,
+    DB_CONNECT_TIMEOUT,
+    DB_COMMAND_TIMEOUT,
+    DB_MAX_INACTIVE_LIFETIME,
+    DB_STATEMENT_CACHE_SIZE,
+    DB_MIGRATION_TIMEOUT,
+    USER_CACHE_SIZE,
+    USER_CACHE_TTL,
+)
+import migrations
+from cache import TTLCache
 
 pool: asyncpg.Pool | None = None
 
+# Кеш профілів get_user; будь-який запис у users його інвалідує
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+_invalidation_hooks = []
+_listen_conn: asyncpg.Connection | None = None
+USER_CACHE_CHANNEL = 'user_cache_invalidate'
+STATS_SHARDS = migrations.STATS_SHARDS
+
+def _connection_params():
+    return dict(
+        host=DB_HOST,
+        port=DB_PORT,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        database=DB_NAME,
+    )
+
+class ShopConnection(asyncpg.Connection):
+    """З'єднання пулу без запиту RESET при поверненні в пул.
+
+    Інваріант: через пул не встановлюється сесійний стан — SET без LOCAL,
+    LISTEN, advisory lock, тимчасові таблиці без ON COMMIT DROP. Інакше він
+    перейде до наступного власника з'єднання, бо RESET ALL / UNLISTEN * /
+    pg_advisory_unlock_all() не виконуються. Що потребує сесії, відкриває
+    окреме з'єднання: lock міграцій (migrations.upgrade) і LISTEN інвалідації
+    кешу (enable_pg_invalidation). Незавершену транзакцію asyncpg відкочує
+    все одно. Перевірка: python -m tools.check_pool_session.
+    """
+
+    def get_reset_query(self):
+        return ''
+
 async def init_pool():
     global pool
     if pool is None:
         pool = await asyncpg.create_pool(
-            host=DB_HOST,
-            port=DB_PORT,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            database=DB_NAME,
+            **_connection_params(),
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            timeout=DB_CONNECT_TIMEOUT,
+            command_timeout=DB_COMMAND_TIMEOUT,
+            max_inactive_connection_lifetime=DB_MAX_INACTIVE_LIFETIME,
+            statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+            connection_class=ShopConnection,
         )
-        async with pool.acquire() as conn:
-            await conn.execute(
-                """
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id BIGINT PRIMARY KEY,
-                    game_id TEXT NOT NULL,
-                    balance NUMERIC DEFAULT 0
-                )
-                """
-            )
-            await conn.execute(
-                """
-                CREATE TABLE IF NOT EXISTS payments (
-                    id SERIAL PRIMARY KEY,
-                    user_id BIGINT REFERENCES users(user_id) ON DELETE CASCADE,
-                    amount NUMERIC NOT NULL,
-                    invoice_id BIGINT UNIQUE
-                )
-                """
-            )
+        # Звичайний старт — одна перевірка версії схеми
+        await migrations.upgrade(pool, _connection_params(), DB_MIGRATION_TIMEOUT)
+
+def add_invalidation_hook(hook):
+    """hook(user_id) викликається після кожної локальної інвалідації.
+
+    Потрібен, щоб повідомити інші процеси бота про зміну користувача.
+    """
+    _invalidation_hooks.append(hook)
+
+def user_cache_stats() -> dict:
+    return user_cache.stats()
+
+async def invalidate_user(user_id: int):
+    user_cache.invalidate(user_id)
+    for hook in _invalidation_hooks:
+        try:
+            await hook(user_id)
+        except Exception as e:
+            logging.error(f"Помилка хука інвалідації кешу: {e}")
+
+def _on_invalidate_notify(conn, pid, channel, payload):
+    user_cache.invalidate(int(payload))
+
+async def _notify_invalidation(user_id: int):
+    async with pool.acquire() as conn:
+        await conn.execute("SELECT pg_notify($1, $2)", USER_CACHE_CHANNEL, str(user_id))
+
+async def enable_pg_invalidation():
+    """Інвалідація кешу між процесами через Postgres LISTEN/NOTIFY.
+
+    Якщо з'єднання LISTEN обірветься, застарілі записи живуть не довше
+    за USER_CACHE_TTL.
+    """
+    global _listen_conn
+    if _listen_conn is not None:
+        return
+    _listen_conn = await asyncpg.connect(**_connection_params())
+    await _listen_conn.add_listener(USER_CACHE_CHANNEL, _on_invalidate_notify)
+    add_invalidation_hook(_notify_invalidation)
+
+async def close_pool():
+    global pool, _listen_conn
+    if _listen_conn is not None:
+        await _listen_conn.close()
+        _listen_conn = None
+    if pool is not None:
+        await pool.close()
+        pool = None
+
+# Гарячі запити — константи модуля: asyncpg готує кожен один раз на
+# з'єднання і далі бере з кешу statement'ів (DB_STATEMENT_CACHE_SIZE).
+GET_USER_SQL = """
+SELECT game_id, balance, payments_count, payments_total, is_blocked
+FROM users WHERE user_id=$1
+"""
+
+GET_USER_WITH_PAYMENTS_SQL = """
+SELECT u.game_id, u.balance, u.payments_count, u.payments_total, u.is_blocked,
+       COALESCE(
+           (SELECT json_agg(json_build_object(
+                       'id', p.id, 'amount', p.amount, 'invoice_id', p.invoice_id
+                   ) ORDER BY p.id DESC)
+            FROM (
+                SELECT id, amount, invoice_id FROM payments
+                WHERE user_id = u.user_id
+                ORDER BY id DESC
+                LIMIT $2
+            ) p),
+           '[]'
+       ) AS payments
+FROM users u WHERE u.user_id=$1
+"""
+
+GET_PAYMENTS_SQL = """
+SELECT id, amount, invoice_id FROM payments
+WHERE user_id=$1 AND ($2::integer IS NULL OR id < $2)
+ORDER BY id DESC
+LIMIT $3
+"""
+
+def _profile(user) -> dict:
+    return {
+        "game_id": user["game_id"],
+        "balance": float(user["balance"]),
+        "payments_count": user["payments_count"],
+        "payments_total": float(user["payments_total"]),
+        "is_blocked": user["is_blocked"],
+    }
 
 async def get_user(user_id: int):
+    """Профіль без історії поповнень — одна вибірка за первинним ключем."""
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return dict(cached)
     if pool is None:
         raise RuntimeError("Pool is not initialized")
+    generation = user_cache.generation
     async with pool.acquire() as conn:
-        user = await conn.fetchrow(
-            "SELECT game_id, balance FROM users WHERE user_id=$1", user_id
-        )
-        if not user:
-            return None
-        payments = await conn.fetch(
-            "SELECT amount, invoice_id FROM payments WHERE user_id=$1", user_id
-        )
-        return {
-            "game_id": user["game_id"],
-            "balance": float(user["balance"]),
-            "payments": [dict(p) for p in payments],
-        }
+        user = await conn.fetchrow(GET_USER_SQL, user_id)
+    if not user:
+        return None
+    user_data = _profile(user)
+    user_cache.set(user_id, user_data, generation)
+    return dict(user_data)
+
+async def get_user_with_payments(user_id: int, limit: int = 10):
+    """Профіль разом з останніми limit поповненнями за один запит."""
+    if pool is None:
+        raise RuntimeError("Pool is not initialized")
+    generation = user_cache.generation
+    async with pool.acquire() as conn:
+        user = await conn.fetchrow(GET_USER_WITH_PAYMENTS_SQL, user_id, limit)
+    if not user:
+        return None
+    user_data = _profile(user)
+    user_cache.set(user_id, user_data, generation)
+    user_data["payments"] = [
+        {"id": p["id"], "amount": float(p["amount"]), "invoice_id": p["invoice_id"]}
+        for p in json.loads(user["payments"])
+    ]
+    return user_data
+
+async def get_payments(user_id: int, limit: int = 10, before_id: int | None = None):
+    """Сторінка історії поповнень, від новіших до старіших.
+
+    Наступну сторінку беремо з before_id = id останнього елемента попередньої.
+    """
+    if pool is None:
+        raise RuntimeError("Pool is not initialized")
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(GET_PAYMENTS_SQL, user_id, before_id, limit)
+    return [
+        {"id": r["id"], "amount": float(r["amount"]), "invoice_id": r["invoice_id"]}
+        for r in rows
+    ]
+
+# Реєстрація разом з денним зведенням і кількістю користувачів
+CREATE_USER_SQL = f"""
+WITH ins AS (
+    INSERT INTO users(user_id, game_id) VALUES ($1, $2)
+    ON CONFLICT (user_id) DO NOTHING
+    RETURNING user_id
+),
+registered AS (
+    INSERT INTO daily_stats(day, shard, registrations)
+    SELECT current_date, user_id % {STATS_SHARDS}, 1 FROM ins
+    ON CONFLICT (day, shard) DO UPDATE SET registrations = daily_stats.registrations + 1
+)
+INSERT INTO stats_totals(shard, users)
+SELECT user_id % {STATS_SHARDS}, 1 FROM ins
+ON CONFLICT (shard) DO UPDATE SET users = stats_totals.users + 1
+"""
 
 async def create_user(user_id: int, game_id: str):
     if pool is None:
         raise RuntimeError("Pool is not initialized")
     async with pool.acquire() as conn:
-        await conn.execute(
-            """
-            INSERT INTO users(user_id, game_id) VALUES ($1, $2)
-            ON CONFLICT (user_id) DO NOTHING
-            """,
-            user_id,
-            game_id,
-        )
+        await conn.execute(CREATE_USER_SQL, user_id, game_id)
+    await invalidate_user(user_id)
 
 async def update_game_id(user_id: int, game_id: str):
     if pool is None:
@@ -74,26 +237,532 @@ async def update_game_id(user_id: int, game_id: str):
             user_id,
             game_id,
         )
+    await invalidate_user(user_id)
+
+# Зведення для зарахованих платежів. Запит, що зараховує, дає CTE
+# credited(user_id, count, total, first, created_at). Денний рядок
+# змінюється одним INSERT: два CTE, що чіпають той самий рядок в одному
+# запиті, дають непередбачуваний результат. ORDER BY — щоб пачки брали
+# блокування рядків у тому самому порядку.
+CREDIT_STATS_CTE = f"""
+credit_daily AS (
+    INSERT INTO daily_stats(day, shard, topups, topup_total, converted)
+    SELECT day, shard, sum(topups), sum(total), sum(converted) FROM (
+        SELECT current_date AS day, user_id % {STATS_SHARDS} AS shard, count AS topups, total, 0 AS converted
+        FROM credited
+        UNION ALL
+        SELECT created_at::date, user_id % {STATS_SHARDS}, 0, 0, 1
+        FROM credited WHERE first AND created_at IS NOT NULL
+    ) t
+    GROUP BY day, shard
+    ORDER BY day, shard
+    ON CONFLICT (day, shard) DO UPDATE
+    SET topups = daily_stats.topups + EXCLUDED.topups,
+        topup_total = daily_stats.topup_total + EXCLUDED.topup_total,
+        converted = daily_stats.converted + EXCLUDED.converted
+),
+credit_totals AS (
+    INSERT INTO stats_totals(shard, balance)
+    SELECT user_id % {STATS_SHARDS}, sum(total) FROM credited
+    GROUP BY 1
+    ORDER BY 1
+    ON CONFLICT (shard) DO UPDATE SET balance = stats_totals.balance + EXCLUDED.balance
+)
+"""
 
-async def add_payment(user_id: int, amount: float, invoice_id: int):
+# Вставка платежу, поповнення балансу і зведення одним запитом. Якщо
+# invoice_id уже є (повтор вебхука, опитування після рестарту), ins
+# порожній і нічого не змінюється.
+ADD_PAYMENT_SQL = f"""
+WITH ins AS (
+    INSERT INTO payments(user_id, amount, invoice_id)
+    VALUES ($1, $2, $3)
+    ON CONFLICT (invoice_id) DO NOTHING
+    RETURNING user_id, amount
+),
+upd AS (
+    UPDATE users u
+    SET balance = u.balance + ins.amount,
+        payments_count = u.payments_count + 1,
+        payments_total = u.payments_total + ins.amount
+    FROM ins
+    WHERE u.user_id = ins.user_id
+    RETURNING u.user_id, u.balance, u.payments_count, u.created_at, ins.amount
+),
+credited AS (
+    SELECT user_id, 1 AS count, amount AS total, payments_count = 1 AS first, created_at FROM upd
+),
+{CREDIT_STATS_CTE}
+SELECT balance FROM upd
+"""
+
+async def add_payment(user_id: int, amount: float, invoice_id: int) -> bool:
+    """Повертає True, якщо платіж записано і баланс поповнено."""
     if pool is None:
         raise RuntimeError("Pool is not initialized")
     async with pool.acquire() as conn:
-        async with conn.transaction():
-            await conn.execute(
+        balance = await conn.fetchval(ADD_PAYMENT_SQL, user_id, amount, invoice_id)
+    if balance is None:
+        return False
+    await invalidate_user(user_id)
+    return True
+
+async def unblock_user(user_id: int):
+    """Користувач знову пише боту — повертаємо його в розсилки."""
+    if pool is None:
+        raise RuntimeError("Pool is not initialized")
+    async with pool.acquire() as conn:
+        result = await conn.execute("UPDATE users SET is_blocked = false WHERE user_id=$1 AND is_blocked", user_id)
+    if result != 'UPDATE 0':
+        await invalidate_user(user_id)
+
+# Які з інвойсів ще не записані в payments — один запит на всю сторінку
+FIND_MISSING_INVOICES_SQL = """
+SELECT t.invoice_id
+FROM unnest($1::bigint[]) AS t(invoice_id)
+WHERE NOT EXISTS (SELECT 1 FROM payments p WHERE p.invoice_id = t.invoice_id)
+"""
+
+# Пакетне зарахування: ті самі гарантії, що й у ADD_PAYMENT_SQL, але для
+# багатьох інвойсів одразу. Інвойси невідомих користувачів відкидаються.
+ADD_PAYMENTS_SQL = f"""
+WITH t AS (
+    SELECT DISTINCT ON (invoice_id) user_id, amount, invoice_id
+    FROM unnest($1::bigint[], $2::numeric[], $3::bigint[]) AS t(user_id, amount, invoice_id)
+    WHERE EXISTS (SELECT 1 FROM users u WHERE u.user_id = t.user_id)
+    ORDER BY invoice_id
+),
+ins AS (
+    INSERT INTO payments(user_id, amount, invoice_id)
+    SELECT user_id, amount, invoice_id FROM t
+    ON CONFLICT (invoice_id) DO NOTHING
+    RETURNING user_id, amount, invoice_id
+),
+totals AS (
+    SELECT user_id, count(*) AS count, sum(amount) AS total FROM ins GROUP BY user_id
+),
+upd AS (
+    UPDATE users u
+    SET balance = u.balance + totals.total,
+        payments_count = u.payments_count + totals.count,
+        payments_total = u.payments_total + totals.total
+    FROM totals
+    WHERE u.user_id = totals.user_id
+    RETURNING u.user_id, u.balance, u.payments_count, u.created_at, totals.count, totals.total
+),
+credited AS (
+    SELECT user_id, count, total, payments_count = count AS first, created_at FROM upd
+),
+{CREDIT_STATS_CTE}
+SELECT ins.invoice_id, ins.user_id, ins.amount, upd.balance
+FROM ins JOIN upd USING (user_id)
+"""
+
+async def find_missing_invoices(invoice_ids: list[int]) -> list[int]:
+    """Інвойси зі списку, яких ще немає в payments."""
+    if pool is None:
+        raise RuntimeError("Pool is not initialized")
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(FIND_MISSING_INVOICES_SQL, invoice_ids)
+    return [row['invoice_id'] for row in rows]
+
+async def add_payments(payments: list[tuple[int, float, int]]) -> list[dict]:
+    """Зараховує пачку (user_id, amount, invoice_id) одним запитом.
+
+    Повертає лише реально зараховані: invoice_id, user_id, amount і новий баланс.
+    """
+    if pool is None:
+        raise RuntimeError("Pool is not initialized")
+    if not payments:
+        return []
+    user_ids, amounts, invoice_ids = zip(*payments)
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(ADD_PAYMENTS_SQL, user_ids, amounts, invoice_ids)
+    for user_id in {row['user_id'] for row in rows}:
+        await invalidate_user(user_id)
+    return [dict(row) for row in rows]
+
+# Покупка за один запит: списання складу, списання балансу, замовлення
+# і підсумок балансів для /stats.
+# Рядок items блокується UPDATE'ом, тож конкуренти за той самий товар
+# проходять по черзі й бачать актуальний stock. Якщо паралельна покупка
+# того ж користувача зменшила баланс, CHECK (balance >= 0) відкотить
+# увесь запит разом зі списаним складом.
+PURCHASE_SQL = f"""
+WITH item AS (
+    UPDATE items SET stock = stock - 1
+    WHERE item_id = $2
+      AND stock > 0
+      AND EXISTS (SELECT 1 FROM users WHERE user_id = $1 AND balance >= items.price)
+    RETURNING item_id, price
+),
+debit AS (
+    UPDATE users u SET balance = u.balance - item.price
+    FROM item
+    WHERE u.user_id = $1
+    RETURNING u.balance
+),
+new_order AS (
+    INSERT INTO orders(user_id, item_id, price)
+    SELECT $1, item.item_id, item.price FROM item
+    RETURNING id
+),
+spent AS (
+    INSERT INTO stats_totals(shard, balance)
+    SELECT $1 % {STATS_SHARDS}, -item.price FROM item
+    ON CONFLICT (shard) DO UPDATE SET balance = stats_totals.balance + EXCLUDED.balance
+)
+SELECT new_order.id AS order_id, debit.balance FROM new_order, debit
+"""
+
+async def sync_items(items):
+    """Додає товари каталогу в items; ціну й назву оновлює, склад — ні.
+
+    items: список (item_id, title, price, initial_stock).
+    """
+    if pool is None:
+        raise RuntimeError("Pool is not initialized")
+    async with pool.acquire() as conn:
+        # Незмінені рядки не переписуються — повторний старт не плодить версій рядків
+        await conn.executemany(
+            """
+            INSERT INTO items(item_id, title, price, stock) VALUES ($1, $2, $3, $4)
+            ON CONFLICT (item_id) DO UPDATE SET title = EXCLUDED.title, price = EXCLUDED.price
+            WHERE (items.title, items.price) IS DISTINCT FROM (EXCLUDED.title, EXCLUDED.price)
+            """,
+            items,
+        )
+
+async def restock_item(item_id: str, quantity: int) -> int | None:
+    """Додає quantity одиниць на склад; повертає новий залишок або None, якщо товару немає."""
+    if pool is None:
+        raise RuntimeError("Pool is not initialized")
+    async with pool.acquire() as conn:
+        return await conn.fetchval(
+            "UPDATE items SET stock = stock + $2 WHERE item_id = $1 RETURNING stock", item_id, quantity
+        )
+
+async def purchase(user_id: int, item_id: str) -> dict:
+    """Купує одну одиницю товару.
+
+    Повертає {"status": "ok", "order_id", "balance"} або статус помилки:
+    "out_of_stock", "insufficient_funds", "no_user", "unknown_item".
+    """
+    if pool is None:
+        raise RuntimeError("Pool is not initialized")
+    async with pool.acquire() as conn:
+        try:
+            row = await conn.fetchrow(PURCHASE_SQL, user_id, item_id)
+        except asyncpg.CheckViolationError:
+            row = None
+        if row is None:
+            # Повільний шлях лише для відмов: з'ясовуємо причину
+            info = await conn.fetchrow(
                 """
-                INSERT INTO payments(user_id, amount, invoice_id)
-                VALUES ($1, $2, $3)
-                ON CONFLICT (invoice_id) DO NOTHING
+                SELECT i.stock, i.price, u.balance
+                FROM (SELECT 1) one
+                LEFT JOIN items i ON i.item_id = $2
+                LEFT JOIN users u ON u.user_id = $1
                 """,
                 user_id,
-                amount,
-                invoice_id,
+                item_id,
             )
-            await conn.execute(
-                "UPDATE users SET balance = balance + $2 WHERE user_id=$1",
-                user_id,
-                amount,
+    if row is not None:
+        await invalidate_user(user_id)
+        return {"status": "ok", "order_id": row["order_id"], "balance": float(row["balance"])}
+    if info["stock"] is None:
+        return {"status": "unknown_item"}
+    if info["balance"] is None:
+        return {"status": "no_user"}
+    if info["stock"] <= 0:
+        return {"status": "out_of_stock"}
+    return {"status": "insufficient_funds"}
+
+# Ринок гравців: спершу блокуються рядки покупця й продавця за зростанням
+# user_id. Інакше зустрічні покупки (A купує в B, B — в A) беруть ті самі два
+# рядки в різному порядку і ловлять deadlock.
+LOCK_LISTING_PARTIES_SQL = """
+SELECT user_id FROM users
+WHERE user_id = $1 OR user_id = (SELECT seller_id FROM listings WHERE id = $2)
+ORDER BY user_id
+FOR UPDATE
+"""
+
+# Далі продаж одним запитом. Рядок оголошення блокується UPDATE'ом, тож
+# паралельний покупець побачить status='sold' і нічого не змінить.
+BUY_LISTING_SQL = """
+WITH listing AS (
+    UPDATE listings l SET status = 'sold', buyer_id = $1, sold_at = now()
+    WHERE l.id = $2
+      AND l.status = 'active'
+      AND l.seller_id <> $1
+      AND EXISTS (SELECT 1 FROM users WHERE user_id = $1 AND balance >= l.price)
+    RETURNING l.id, l.seller_id, l.title, l.price
+),
+debit AS (
+    UPDATE users u SET balance = u.balance - listing.price
+    FROM listing
+    WHERE u.user_id = $1
+    RETURNING u.balance
+),
+credit AS (
+    UPDATE users u SET balance = u.balance + listing.price
+    FROM listing
+    WHERE u.user_id = listing.seller_id
+)
+SELECT listing.seller_id, listing.title, listing.price, debit.balance FROM listing, debit
+"""
+
+LISTING_COLUMNS = "id, seller_id, category, title, price"
+
+async def create_listing(seller_id: int, category: str, title: str, price) -> int | None:
+    """Повертає id оголошення або None, якщо продавця немає в базі."""
+    if pool is None:
+        raise RuntimeError("Pool is not initialized")
+    async with pool.acquire() as conn:
+        try:
+            return await conn.fetchval(
+                "INSERT INTO listings(seller_id, category, title, price) VALUES ($1, $2, $3, $4) RETURNING id",
+                seller_id,
+                category,
+                title,
+                price,
+            )
+        except asyncpg.ForeignKeyViolationError:
+            return None
+
+async def search_listings(
+    category: str | None = None,
+    query: str | None = None,
+    max_price=None,
+    cursor: tuple | None = None,
+    direction: str = 'after',
+    limit: int = 8,
+) -> list[dict]:
+    """Сторінка активних оголошень від дешевших до дорожчих.
+
+    Пагінація за ключем (price, id): cursor — рядок-межа, direction —
+    'after' (наступна сторінка), 'from' (сторінка, що з нього починається)
+    або 'before' (попередня). Сторінка N коштує стільки ж, скільки перша.
+    query — рядок для to_tsquery('simple', ...).
+    Повертає до limit + 1 рядків у порядку зростання: зайвий рядок означає,
+    що в напрямку direction є ще сторінка.
+    """
+    if pool is None:
+        raise RuntimeError("Pool is not initialized")
+    # Умови збираються лише з потрібних фільтрів: на кожну комбінацію свій
+    # план з відповідним індексом, а не загальний з "$1 IS NULL OR ..."
+    conditions = ["status = 'active'"]
+    args = []
+    if category is not None:
+        args.append(category)
+        conditions.append(f"category = ${len(args)}")
+    if query is not None:
+        args.append(query)
+        conditions.append(f"search @@ to_tsquery('simple', ${len(args)})")
+    if max_price is not None:
+        args.append(max_price)
+        conditions.append(f"price <= ${len(args)}")
+    backward = direction == 'before'
+    if cursor is not None:
+        args.extend(cursor)
+        op = {'after': '>', 'from': '>=', 'before': '<'}[direction]
+        conditions.append(f"(price, id) {op} (${len(args) - 1}, ${len(args)})")
+    args.append(limit + 1)
+    order = "price DESC, id DESC" if backward else "price, id"
+    sql = (
+        f"SELECT {LISTING_COLUMNS} FROM listings WHERE {' AND '.join(conditions)} "
+        f"ORDER BY {order} LIMIT ${len(args)}"
+    )
+    async with pool.acquire() as conn:
+        rows = [dict(row) for row in await conn.fetch(sql, *args)]
+    if backward:
+        rows.reverse()
+    return rows
+
+async def get_listing(listing_id: int):
+    if pool is None:
+        raise RuntimeError("Pool is not initialized")
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow(
+            f"SELECT {LISTING_COLUMNS} FROM listings WHERE id=$1 AND status='active'", listing_id
+        )
+    return dict(row) if row else None
+
+async def seller_listings(seller_id: int, limit: int = 20) -> list[dict]:
+    if pool is None:
+        raise RuntimeError("Pool is not initialized")
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            f"""
+            SELECT {LISTING_COLUMNS} FROM listings
+            WHERE seller_id=$1 AND status='active'
+            ORDER BY id DESC LIMIT $2
+            """,
+            seller_id,
+            limit,
+        )
+    return [dict(row) for row in rows]
+
+async def cancel_listing(seller_id: int, listing_id: int) -> bool:
+    if pool is None:
+        raise RuntimeError("Pool is not initialized")
+    async with pool.acquire() as conn:
+        result = await conn.execute(
+            "UPDATE listings SET status='cancelled' WHERE id=$1 AND seller_id=$2 AND status='active'",
+            listing_id,
+            seller_id,
+        )
+    return result != 'UPDATE 0'
+
+async def buy_listing(buyer_id: int, listing_id: int) -> dict:
+    """Купує оголошення: гроші переходять від покупця до продавця.
+
+    Повертає {"status": "ok", "seller_id", "title", "price", "balance"} або
+    статус помилки: "not_available", "own_listing", "insufficient_funds", "no_user".
+    """
+    if pool is None:
+        raise RuntimeError("Pool is not initialized")
+    async with pool.acquire() as conn:
+        try:
+            async with conn.transaction():
+                await conn.execute(LOCK_LISTING_PARTIES_SQL, buyer_id, listing_id)
+                row = await conn.fetchrow(BUY_LISTING_SQL, buyer_id, listing_id)
+        except asyncpg.CheckViolationError:
+            row = None
+        if row is None:
+            info = await conn.fetchrow(
+                """
+                SELECT l.status, l.seller_id, u.balance
+                FROM (SELECT 1) one
+                LEFT JOIN listings l ON l.id = $2
+                LEFT JOIN users u ON u.user_id = $1
+                """,
+                buyer_id,
+                listing_id,
             )
+    if row is not None:
+        await invalidate_user(buyer_id)
+        await invalidate_user(row['seller_id'])
+        return {
+            "status": "ok",
+            "seller_id": row['seller_id'],
+            "title": row['title'],
+            "price": row['price'],
+            "balance": float(row['balance']),
+        }
+    if info['status'] != 'active':
+        return {"status": "not_available"}
+    if info['balance'] is None:
+        return {"status": "no_user"}
+    if info['seller_id'] == buyer_id:
+        return {"status": "own_listing"}
+    return {"status": "insufficient_funds"}
+
+# Нові за сьогодні активні користувачі: user_activity відсікає вже врахованих
+RECORD_ACTIVITY_SQL = f"""
+WITH seen AS (
+    INSERT INTO user_activity(day, user_id)
+    SELECT current_date, user_id FROM unnest($1::bigint[]) AS t(user_id)
+    ON CONFLICT (day, user_id) DO NOTHING
+    RETURNING user_id
+)
+INSERT INTO daily_stats(day, shard, active_users)
+SELECT current_date, user_id % {STATS_SHARDS}, count(*) FROM seen
+GROUP BY 2
+ORDER BY 2
+ON CONFLICT (day, shard) DO UPDATE SET active_users = daily_stats.active_users + EXCLUDED.active_users
+"""
+
+DAILY_STATS_SQL = """
+SELECT day,
+       sum(registrations)::int AS registrations,
+       sum(converted)::int AS converted,
+       sum(topups)::int AS topups,
+       sum(topup_total) AS topup_total,
+       sum(active_users)::int AS active_users
+FROM daily_stats
+WHERE day > current_date - $1::int
+GROUP BY day
+ORDER BY day DESC
+"""
+
+# Повний прохід по users — лише на вимогу адміна після ручних правок у базі
+REBUILD_STATS_TOTALS_SQL = f"""
+WITH actual AS (
+    SELECT s.shard, count(u.user_id) AS users, coalesce(sum(u.balance), 0) AS balance
+    FROM generate_series(0, {STATS_SHARDS} - 1) AS s(shard)
+    LEFT JOIN users u ON u.user_id % {STATS_SHARDS} = s.shard
+    GROUP BY s.shard
+)
+INSERT INTO stats_totals(shard, users, balance)
+SELECT shard, users, balance FROM actual
+ON CONFLICT (shard) DO UPDATE SET users = EXCLUDED.users, balance = EXCLUDED.balance
+"""
 
+# Останні дні зведень заново з users, payments і user_activity. Старші дні не
+# чіпає: user_activity для них уже видалено, і active_users не відновити.
+# Рядки з created_at NULL (перенесені з db.json, дата невідома) не рахуються,
+# як і в інкрементальних зведеннях
+REBUILD_DAILY_STATS_SQL = f"""
+INSERT INTO daily_stats(day, shard, registrations, converted, topups, topup_total, active_users)
+SELECT day, shard, sum(registrations), sum(converted), sum(topups), sum(topup_total), sum(active_users) FROM (
+    SELECT created_at::date AS day, user_id % {STATS_SHARDS} AS shard, 1 AS registrations,
+           (payments_count > 0)::int AS converted, 0 AS topups, 0 AS topup_total, 0 AS active_users
+    FROM users WHERE created_at IS NOT NULL AND created_at >= current_date - $1::int
+    UNION ALL
+    SELECT created_at::date, user_id % {STATS_SHARDS}, 0, 0, 1, amount, 0
+    FROM payments WHERE created_at IS NOT NULL AND created_at >= current_date - $1::int
+    UNION ALL
+    SELECT day, user_id % {STATS_SHARDS}, 0, 0, 0, 0, 1
+    FROM user_activity WHERE day >= current_date - $1::int
+) t
+GROUP BY day, shard
+"""
+
+async def record_activity(user_ids: list[int]):
+    if pool is None:
+        raise RuntimeError("Pool is not initialized")
+    if not user_ids:
+        return
+    async with pool.acquire() as conn:
+        await conn.execute(RECORD_ACTIVITY_SQL, user_ids)
 
+async def prune_activity():
+    """Позавчорашні й старіші дні для дедуплікації вже не потрібні."""
+    if pool is None:
+        raise RuntimeError("Pool is not initialized")
+    async with pool.acquire() as conn:
+        await conn.execute("DELETE FROM user_activity WHERE day < current_date - 1")
+
+async def get_stats(days: int = 7) -> dict:
+    """Зведення за останні days днів і поточні підсумки; лише з таблиць зведень."""
+    if pool is None:
+        raise RuntimeError("Pool is not initialized")
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(DAILY_STATS_SQL, days)
+        totals = await conn.fetchrow(
+            "SELECT coalesce(sum(users), 0)::bigint AS users, coalesce(sum(balance), 0) AS balance FROM stats_totals"
+        )
+    return {"days": [dict(row) for row in rows], "users": totals["users"], "balance": totals["balance"]}
+
+async def rebuild_stats_totals():
+    if pool is None:
+        raise RuntimeError("Pool is not initialized")
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            # Платежі й покупки, що ще не дописали підсумок, чекають на lock і
+            # додадуть свою частку вже після перерахунку — нічого не губиться
+            await conn.execute("LOCK TABLE stats_totals IN EXCLUSIVE MODE")
+            await conn.execute(REBUILD_STATS_TOTALS_SQL)
+
+async def rebuild_daily_stats(days: int = 1):
+    """Перераховує daily_stats за сьогодні й days попередніх днів (не більше, ніж тримає user_activity)."""
+    if pool is None:
+        raise RuntimeError("Pool is not initialized")
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            # Як і в rebuild_stats_totals: незавершені записи дочекаються lock
+            await conn.execute("LOCK TABLE daily_stats IN EXCLUSIVE MODE")
+            await conn.execute("DELETE FROM daily_stats WHERE day >= current_date - $1::int", days)
+            await conn.execute(REBUILD_DAILY_STATS_SQL, days)
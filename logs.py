@@ -0,0 +1,170 @@
+"""Структуровані JSON-логи, які пишуться у фоновому потоці.
+
+Виклик logging.* на циклі подій лише кладе запис у чергу разом з
+контекстом апдейту (user_id, хендлер, стан FSM). Форматування винятків,
+JSON і запис у stderr робить QueueListener у своєму потоці. Повторювані
+WARNING/ERROR з одного рядка коду обмежуються: burst записів за вікно,
+решта лише рахується, і кількість пропущених додається до наступного
+запису з того ж місця.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from datetime import datetime, timezone
+
+from aiogram import BaseMiddleware
+
+import metrics
+
+DROPPED = metrics.Counter('log_records_dropped_total', 'Log records not written', ('reason',))
+
+user_id_var = contextvars.ContextVar('log_user_id', default=None)
+update_id_var = contextvars.ContextVar('log_update_id', default=None)
+state_var = contextvars.ContextVar('log_state', default=None)
+handler_var = contextvars.ContextVar('log_handler', default=None)
+
+# Поле JSON -> змінна контексту
+CONTEXT = {
+    'user_id': user_id_var,
+    'update_id': update_id_var,
+    'state': state_var,
+    'handler': handler_var,
+}
+
+
+class RateLimitFilter(logging.Filter):
+    """Не більше burst записів рівня level і вище з одного рядка коду за window секунд."""
+
+    def __init__(self, burst: int = 10, window: float = 60, level: int = logging.WARNING, maxsize: int = 10000):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.level = level
+        self.maxsize = maxsize
+        # (файл, рядок) -> [початок вікна, записано, пропущено]
+        self._windows: dict[tuple, list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.level:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.window:
+            if window is None and len(self._windows) >= self.maxsize:
+                self._windows.clear()
+            if window is not None and window[2]:
+                record.suppressed = window[2]
+            self._windows[key] = [now, 1, 0]
+            return True
+        if window[1] < self.burst:
+            window[1] += 1
+            return True
+        window[2] += 1
+        DROPPED.inc('rate_limit')
+        return False
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """Кладе запис у чергу з контекстом; якщо черга повна — відкидає, а не чекає."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Контекст читається тут, у задачі апдейту: потік-слухач його не бачить
+        for name, var in CONTEXT.items():
+            if not hasattr(record, name):
+                setattr(record, name, var.get())
+        # Аргументи підставляємо одразу, поки їх ніхто не змінив; traceback — у потоці
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED.inc('queue_full')
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for name in CONTEXT:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        suppressed = getattr(record, 'suppressed', None)
+        if suppressed:
+            entry['suppressed'] = suppressed
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(
+    level: str | int = logging.INFO,
+    fmt: str = 'json',
+    queue_size: int = 10000,
+    burst: int = 10,
+    window: float = 60,
+) -> logging.handlers.QueueListener:
+    """Кореневий логер пише через чергу; потік-слухач зупиняється при виході."""
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == 'json' else logging.Formatter(logging.BASIC_FORMAT))
+    log_queue = queue.Queue(queue_size)
+    handler = ContextQueueHandler(log_queue)
+    if burst:
+        handler.addFilter(RateLimitFilter(burst, window))
+    logging.basicConfig(level=level, handlers=[handler], force=True)
+    listener = logging.handlers.QueueListener(log_queue, output)
+    listener.start()
+    # Дописати чергу до виходу; реєструється після logging, тож спрацює раніше за logging.shutdown
+    atexit.register(stop_listener, listener)
+    return listener
+
+
+def stop_listener(listener: logging.handlers.QueueListener):
+    """Дописує чергу й зупиняє потік; повторний виклик нічого не робить."""
+    if listener._thread is not None:
+        listener.stop()
+
+
+class UpdateContextMiddleware(BaseMiddleware):
+    """Зовнішній middleware на update: user_id, update_id і стан FSM для логів.
+
+    Кожен апдейт обробляється у своїй задачі, тож значення не перетікають
+    між апдейтами; скидаємо їх, щоб не залишити в задачі після обробки.
+    """
+
+    async def __call__(self, handler, event, data):
+        user = data.get('event_from_user')
+        tokens = [
+            (user_id_var, user_id_var.set(user.id if user else None)),
+            (update_id_var, update_id_var.set(event.update_id)),
+            (state_var, state_var.set(data.get('raw_state'))),
+        ]
+        try:
+            return await handler(event, data)
+        finally:
+            for var, token in reversed(tokens):
+                var.reset(token)
+
+
+class HandlerContextMiddleware(BaseMiddleware):
+    """Внутрішній middleware: ім'я хендлера для логів."""
+
+    async def __call__(self, handler, event, data):
+        token = handler_var.set(data['handler'].callback.__name__)
+        try:
+            return await handler(event, data)
+        finally:
+            handler_var.reset(token)
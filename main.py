@@ -1,30 +1,155 @@
+import time
+
+# Відлік часу старту — до важких імпортів
+STARTED_AT = time.perf_counter()
+
 import asyncio
+import html
 import logging
 
-from aiogram import Bot, Dispatcher, types
+from aiogram import Bot, Dispatcher, F, types
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
-from aiogram.filters import Command, StateFilter
+from aiogram.filters import Command, CommandObject, StateFilter
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.utils.keyboard import ReplyKeyboardBuilder, InlineKeyboardBuilder
 
-from aiocryptopay import AioCryptoPay, Networks
+from decimal import Decimal
 
-from config import TOKEN, CRYPTO_TOKEN
+from aiocryptopay import AioCryptoPay, Networks
+from aiohttp import web
+
+from config import (
+    TOKEN,
+    CRYPTO_TOKEN,
+    PAYMENT_POLL_INTERVAL,
+    PAYMENT_TIMEOUT,
+    PAYMENT_HISTORY_LIMIT,
+    PAYMENT_MODE,
+    PAYMENT_ASSETS,
+    RATES_REFRESH_INTERVAL,
+    RATES_MAX_AGE,
+    CRYPTO_WEBHOOK_HOST,
+    CRYPTO_WEBHOOK_PORT,
+    CRYPTO_WEBHOOK_PATH,
+    BOT_MODE,
+    WEBHOOK_BASE_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    MAX_CONCURRENT_UPDATES,
+    SHUTDOWN_TIMEOUT,
+    USER_CACHE_PG_NOTIFY,
+    FSM_STORAGE,
+    FSM_FLUSH_INTERVAL,
+    FSM_STATE_TTL,
+    FSM_SWEEP_INTERVAL,
+    FSM_COUNTS_TTL,
+    METRICS_HOST,
+    METRICS_PORT,
+    METRICS_PATH,
+    OUTBOX_ENABLED,
+    OUTBOX_GLOBAL_RATE,
+    OUTBOX_CHAT_RATE,
+    OUTBOX_CHAT_BURST,
+    OUTBOX_MAX_RETRIES,
+    RECONCILE_INTERVAL,
+    RECONCILE_LOOKBACK,
+    RECONCILE_MAX_PAGES,
+    ADMIN_IDS,
+    BROADCAST_RATE,
+    BROADCAST_CONCURRENCY,
+    BROADCAST_BATCH_SIZE,
+    MARKET_PAGE_SIZE,
+    SUPPORT_OPERATOR_IDS,
+    SUPPORT_WORKERS,
+    SUPPORT_MAX_TICKETS,
+    SUPPORT_POLL_INTERVAL,
+    THROTTLE_RATE,
+    THROTTLE_BURST,
+    CALLBACK_DEBOUNCE,
+    LOG_LEVEL,
+    LOG_FORMAT,
+    LOG_QUEUE_SIZE,
+    LOG_RATE_BURST,
+    LOG_RATE_WINDOW,
+    UPDATES_RECORD_PATH,
+    STATS_DAYS,
+    STATS_ACTIVITY_FLUSH_INTERVAL,
+)
+import analytics
 import db
-
-# Налаштування логів
-logging.basicConfig(level=logging.INFO)
+import catalog
+import logs
+import market
+import metrics
+from broadcast import Broadcaster
+from outbox import Outbox
+from pg_storage import PostgresStorage
+from payments import InvoicePoller, make_payload
+from rates import RateCache, StaleRatesError
+from recorder import UpdateRecorder
+from reconcile import Reconciler
+from support import SupportDesk
+from throttling import PaymentGuardMiddleware, ThrottlingMiddleware
+from cryptopay_webhook import setup_cryptopay_webhook
+from webhook import run_webhook
+
+# Налаштування логів: JSON у фоновому потоці, без I/O на циклі подій
+logs.setup_logging(
+    level=LOG_LEVEL,
+    fmt=LOG_FORMAT,
+    queue_size=LOG_QUEUE_SIZE,
+    burst=LOG_RATE_BURST,
+    window=LOG_RATE_WINDOW,
+)
 
 # Telegram bot
 bot = Bot(token=TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-dp = Dispatcher(storage=MemoryStorage())
+# Усі повідомлення йдуть через чергу з лімітами Telegram
+outbox = Outbox(
+    global_rate=OUTBOX_GLOBAL_RATE,
+    chat_rate=OUTBOX_CHAT_RATE,
+    chat_burst=OUTBOX_CHAT_BURST,
+    max_retries=OUTBOX_MAX_RETRIES,
+)
+if OUTBOX_ENABLED:
+    bot.session.middleware(outbox)
+if FSM_STORAGE == 'postgres':
+    storage = PostgresStorage(
+        flush_interval=FSM_FLUSH_INTERVAL,
+        state_ttl=FSM_STATE_TTL,
+        sweep_interval=FSM_SWEEP_INTERVAL,
+        counts_ttl=FSM_COUNTS_TTL,
+    )
+else:
+    storage = MemoryStorage()
+dp = Dispatcher(storage=storage)
+# Запис вхідних апдейтів для відтворення (tools/replay)
+recorder = None
+if UPDATES_RECORD_PATH:
+    recorder = UpdateRecorder(UPDATES_RECORD_PATH)
+    dp.update.outer_middleware(recorder)
+# Контекст апдейту (користувач, стан, хендлер) у кожному записі логів
+dp.update.outer_middleware(logs.UpdateContextMiddleware())
+dp.message.middleware(logs.HandlerContextMiddleware())
+dp.callback_query.middleware(logs.HandlerContextMiddleware())
+# Активні користувачі для /stats
+activity = analytics.ActivityTracker(interval=STATS_ACTIVITY_FLUSH_INTERVAL)
+dp.update.outer_middleware(activity)
 
 # CryptoBot API
 crypto = AioCryptoPay(token=CRYPTO_TOKEN, network=Networks.MAIN_NET)
 
+# Метрики: час хендлерів, викликів бази й CryptoPay
+dp.message.middleware(metrics.MetricsMiddleware())
+dp.callback_query.middleware(metrics.MetricsMiddleware())
+metrics.instrument(db, metrics.DB_SECONDS, metrics.DB_ERRORS)
+metrics.instrument(crypto, metrics.CRYPTO_SECONDS, metrics.CRYPTO_ERRORS)
+
 #@dp.message(lambda m: m.sticker is not None)
 #async def get_sticker_id(message: types.Message):
 #    await message.answer(f"file_id цього стікера:\n<code>{message.sticker.file_id}</code>", parse_mode='HTML')
@@ -36,27 +161,95 @@ class Shop(StatesGroup):
     payment = State()
     buy_thing = State()
 
+# Ринок гравців
+class Market(StatesGroup):
+    search = State()
+    listing_title = State()
+    listing_price = State()
+
+# Звернення в підтримку
+class Support(StatesGroup):
+    chat = State()
+
 # Reply-клавіатура тільки з "МІЙ КАБІНЕТ"
 reply_bt = ReplyKeyboardBuilder()
 reply_bt.button(text='🖥 Головне меню')
 reply_bt.adjust(1)
 REPLY_BT = reply_bt.as_markup(resize_keyboard=True)
 
+# Спільний фоновий перевіряльник інвойсів
+poller = InvoicePoller(
+    bot,
+    crypto,
+    interval=PAYMENT_POLL_INTERVAL,
+    timeout=PAYMENT_TIMEOUT,
+    reply_markup=REPLY_BT,
+    poll=PAYMENT_MODE == 'polling',
+    history_limit=PAYMENT_HISTORY_LIMIT,
+)
+# Курси активів до USDT, які тримає в пам'яті фонова задача
+rates = RateCache(crypto, PAYMENT_ASSETS, interval=RATES_REFRESH_INTERVAL, max_age=RATES_MAX_AGE)
+# Антиспам до фільтрів і один інвойс на користувача за раз
+throttling = ThrottlingMiddleware(rate=THROTTLE_RATE, burst=THROTTLE_BURST, debounce=CALLBACK_DEBOUNCE)
+dp.message.outer_middleware(throttling)
+dp.callback_query.outer_middleware(throttling)
+payment_guard = PaymentGuardMiddleware(poller)
+dp.message.middleware(payment_guard)
+dp.callback_query.middleware(payment_guard)
+# Фонова звірка оплат, які не зарахували poller чи вебхук
+reconciler = Reconciler(
+    bot,
+    crypto,
+    poller,
+    interval=RECONCILE_INTERVAL,
+    lookback=RECONCILE_LOOKBACK,
+    max_pages=RECONCILE_MAX_PAGES,
+)
+broadcaster = Broadcaster(
+    bot,
+    rate=BROADCAST_RATE,
+    concurrency=BROADCAST_CONCURRENCY,
+    batch_size=BROADCAST_BATCH_SIZE,
+)
+# Черга звернень у підтримку з воркерами-пересильниками
+support_desk = SupportDesk(
+    bot,
+    SUPPORT_OPERATOR_IDS,
+    workers=SUPPORT_WORKERS,
+    max_tickets=SUPPORT_MAX_TICKETS,
+    poll_interval=SUPPORT_POLL_INTERVAL,
+)
+web_runner: web.AppRunner | None = None
+# Тривалість етапів старту, секунди
+startup_seconds: dict[str, float] = {}
+metrics_runner: web.AppRunner | None = None
+
 # Inline-клавіатура для кабінету
-def get_cabinet_inline():
-    kb = InlineKeyboardBuilder()
-    kb.button(text='💰 ПОПОВНИТИ БАЛАНС', callback_data='topup')
-    kb.button(text='🎁 ПРИДБАТИ ЛУТ(METRO)', callback_data='buy_loot')
-    kb.button(text='🔄 Змінити ігрове ID', callback_data='change_game_id')
-    kb.button(text='💬 Тех підтримка', callback_data='tech_support')
-    kb.button(text='💵 Продати лут/Стати продавцем', callback_data='become_seller')
-    kb.adjust(1)
-    return kb.as_markup()
-
-# Заглушка для неактивних кнопок
-@dp.callback_query(lambda c: c.data in ['tech_support', 'become_seller'])
-async def not_implemented(callback: types.CallbackQuery, state: FSMContext):
-    await callback.answer("Функція в розробці", show_alert=True)
+cabinet_kb = InlineKeyboardBuilder()
+cabinet_kb.button(text='💰 ПОПОВНИТИ БАЛАНС', callback_data='topup')
+cabinet_kb.button(text='🎁 ПРИДБАТИ ЛУТ(METRO)', callback_data='buy_loot')
+cabinet_kb.button(text='🔄 Змінити ігрове ID', callback_data='change_game_id')
+cabinet_kb.button(text='💬 Тех підтримка', callback_data='tech_support')
+cabinet_kb.button(text='💵 Продати лут/Стати продавцем', callback_data='become_seller')
+cabinet_kb.adjust(1)
+CABINET_INLINE = cabinet_kb.as_markup()
+
+# Клавіатура з кнопкою назад до кабінету
+back_kb = InlineKeyboardBuilder()
+back_kb.button(text='⬅️ НАЗАД', callback_data='back_to_cabinet')
+back_kb.adjust(1)
+BACK_TO_CABINET = back_kb.as_markup()
+
+# Вибір способу поповнення
+topup_kb = InlineKeyboardBuilder()
+topup_kb.button(text='CryptoBot', callback_data='button_pressed')
+TOPUP_METHODS = topup_kb.as_markup()
+
+PAY_ASSET_PREFIX = 'pay_asset:'
+
+support_kb = InlineKeyboardBuilder()
+support_kb.button(text='✅ Завершити звернення', callback_data='support_close')
+SUPPORT_CLOSE = support_kb.as_markup()
 
 # Команда старт
 @dp.message(Command('start'))
@@ -67,6 +260,9 @@ async def cmd_start(message: types.Message, state: FSMContext):
     user_data = await db.get_user(int(user_key))
 
     if user_data:
+        if user_data['is_blocked']:
+            # Повернувся після блокування — знову отримуватиме розсилки
+            await db.unblock_user(int(user_key))
         game_id = user_data['game_id']
         balance = user_data.get('balance', 0)
         await state.update_data(id=game_id)
@@ -77,6 +273,73 @@ async def cmd_start(message: types.Message, state: FSMContext):
         await message.answer('Привіт! Уведи своє ігрове ID:', reply_markup=REPLY_BT)
         await state.set_state(Shop.id)
 
+# Розсилка всім користувачам (лише для адмінів)
+@dp.message(Command('broadcast'), F.from_user.id.in_(ADMIN_IDS))
+async def cmd_broadcast(message: types.Message, command: CommandObject):
+    if not command.args:
+        await message.answer('Використання: /broadcast текст повідомлення')
+        return
+    broadcast_id = await broadcaster.create(command.args, message.from_user.id)
+    await message.answer(f'📣 Розсилку №{broadcast_id} запущено. Зупинити: /broadcast_stop {broadcast_id}')
+
+@dp.message(Command('broadcast_stop'), F.from_user.id.in_(ADMIN_IDS))
+async def cmd_broadcast_stop(message: types.Message, command: CommandObject):
+    if not command.args or not command.args.strip().isdigit():
+        await message.answer('Використання: /broadcast_stop номер')
+        return
+    totals = await broadcaster.cancel(int(command.args))
+    if totals is None:
+        await message.answer('Такої активної розсилки немає')
+    else:
+        await message.answer(f"Розсилку зупинено. Надіслано: {totals['sent']}, заблокували бота: {totals['blocked']}")
+
+# Поповнення складу товару з каталогу (лише для адмінів)
+@dp.message(Command('restock'), F.from_user.id.in_(ADMIN_IDS))
+async def cmd_restock(message: types.Message, command: CommandObject):
+    parts = (command.args or '').split()
+    if len(parts) != 2 or parts[0] not in catalog.ITEMS or not parts[1].isdigit():
+        await message.answer('Використання: /restock id_товару кількість\nТовари: ' + ', '.join(catalog.ITEMS))
+        return
+    item = catalog.ITEMS[parts[0]]
+    stock = await db.restock_item(item.id, int(parts[1]))
+    if stock is None:
+        await message.answer('Товару ще немає в базі')
+    else:
+        await message.answer(f'{item.title}: на складі {stock}')
+
+# Статистика з таблиць зведень (лише для адмінів); /stats rebuild перераховує підсумки балансів
+@dp.message(Command('stats'), F.from_user.id.in_(ADMIN_IDS))
+async def cmd_stats(message: types.Message, command: CommandObject):
+    if command.args and command.args.strip() == 'rebuild':
+        await db.rebuild_stats_totals()
+    await activity.flush()
+    await message.answer(analytics.stats_text(await db.get_stats(STATS_DAYS)))
+
+# Оператор підтримки закриває звернення
+@dp.message(Command('close'), F.from_user.id.in_(SUPPORT_OPERATOR_IDS))
+async def cmd_support_close(message: types.Message, command: CommandObject):
+    if not command.args or not command.args.strip().isdigit():
+        await message.answer('Використання: /close номер')
+        return
+    ticket = await support_desk.close_by_operator(message.from_user.id, int(command.args))
+    if ticket is None:
+        await message.answer('Такого відкритого звернення у вас немає')
+        return
+    await message.answer(f"Звернення №{ticket['id']} закрито")
+    await bot.send_message(ticket['user_id'], '✅ Звернення закрито оператором. Дякуємо!', reply_markup=REPLY_BT)
+
+# Реплай оператора на переслане звернення — відповідь користувачу
+async def relayed_ticket(message: types.Message):
+    if message.reply_to_message is None or not message.text:
+        return False
+    ticket_id = await support_desk.ticket_for_relay(message.from_user.id, message.reply_to_message.message_id)
+    return {'ticket_id': ticket_id} if ticket_id else False
+
+@dp.message(F.from_user.id.in_(SUPPORT_OPERATOR_IDS), relayed_ticket)
+async def process_operator_reply(message: types.Message, ticket_id: int):
+    if not await support_desk.reply(message.from_user.id, ticket_id, message.text):
+        await message.answer('Звернення вже закрито')
+
 # Обробка ID
 @dp.message(Command('change_id'))
 async def change_id(message: types.Message, state: FSMContext):
@@ -127,11 +390,9 @@ async def process_id(message: types.Message, state: FSMContext):
         await db.create_user(int(user_key), game_id)
 
     await state.update_data(id=game_id)
-    kb = InlineKeyboardBuilder()
-    kb.button(text='CryptoBot', callback_data='button_pressed')
     await message.answer('Успішно зареєстровано!')
     await message.answer(f'Ваш баланс: 0', reply_markup=REPLY_BT)
-    await message.answer('Виберіть спосіб поповнення', reply_markup=kb.as_markup())
+    await message.answer('Виберіть спосіб поповнення', reply_markup=TOPUP_METHODS)
     await state.set_state(Shop.balance)
 
 # Обробка reply-кнопки "МІЙ КАБІНЕТ"
@@ -143,14 +404,11 @@ async def process_balance(message: types.Message, state: FSMContext):
         if user_data:
             game_id = user_data['game_id']
             balance = user_data.get('balance', 0)
-            payment_history = "\n".join([f"Поповнення: {p['amount']} USDT" for p in user_data.get('payments', [])])
-            if not payment_history:
-                payment_history = "Поповнень ще не було"
-            
+
             cabinet_message = await message.answer(
                 f"🎮 Ваш ігровий ID: {game_id}\n"
                 f"💰 Баланс: {balance} USDT",
-                reply_markup=get_cabinet_inline()
+                reply_markup=CABINET_INLINE
             )
             # Зберігаємо ID повідомлення для подальшого редагування
             await state.update_data(cabinet_message_id=cabinet_message.message_id)
@@ -165,20 +423,15 @@ async def handle_topup(callback: types.CallbackQuery, state: FSMContext):
     state_data = await state.get_data()
     cabinet_message_id = state_data.get('cabinet_message_id')
 
-    # Клавіатура з кнопкою назад
-    kb = InlineKeyboardBuilder()
-    kb.button(text='⬅️ НАЗАД', callback_data='back_to_cabinet')
-    kb.adjust(1)
-
     if cabinet_message_id:
         await bot.edit_message_text(
             chat_id=callback.from_user.id,
             message_id=cabinet_message_id,
             text='Введіть суму для поповнення:',
-            reply_markup=kb.as_markup()
+            reply_markup=BACK_TO_CABINET
         )
     else:
-        await callback.message.answer('Введіть суму для поповнення:', reply_markup=kb.as_markup())
+        await callback.message.answer('Введіть суму для поповнення:', reply_markup=BACK_TO_CABINET)
 
     await state.set_state(Shop.payment)
 
@@ -189,89 +442,338 @@ async def handle_button_pressed(callback: types.CallbackQuery, state: FSMContext
     await callback.message.answer("Напишіть сумму 💸")
     await state.set_state(Shop.payment)
 
+# Створення інвойсу в обраному активі; зараховується завжди amount USDT
+async def send_invoice(message: types.Message, state: FSMContext, user_id: int, amount: float, asset: str):
+    try:
+        asset_amount = rates.to_asset(amount, asset)
+    except StaleRatesError:
+        await message.answer(f"❌ Курс {asset} зараз недоступний, оберіть іншу валюту")
+        return
+
+    invoice = await crypto.create_invoice(
+        asset=asset,
+        amount=float(asset_amount),
+        payload=make_payload(user_id, amount),
+    )
+    invoice_url = invoice.bot_invoice_url
+    invoice_id = invoice.invoice_id
+
+    await message.answer(f"Перейдіть до оплати: {invoice_url}")
+    await message.answer("Після оплати зачекайте кілька секунд...")
+
+    # Оплату підтверджує фоновий poller або вебхук, хендлер одразу звільняється
+    poller.add(invoice_id, user_id, message.chat.id, amount, invoice_url)
+    await state.set_state(Shop.balance)
+
 # Обробка суми поповнення
-@dp.message(StateFilter(Shop.payment))
+@dp.message(StateFilter(Shop.payment), flags={'payment': True})
 async def process_payment(message: types.Message, state: FSMContext):
     try:
         amount = float(message.text)
-        user_key = str(message.from_user.id)
-        user_data = await db.get_user(int(user_key))
 
-        # Створення інвойсу
-        invoice = await crypto.create_invoice(asset='USDT', amount=amount)
-        invoice_url = invoice.bot_invoice_url
-        invoice_id = invoice.invoice_id
-
-        await message.answer(f"Перейдіть до оплати: {invoice_url}")
-        await message.answer("Після оплати зачекайте кілька секунд...")
-
-        # Чекаємо на оплату (до 90 сек)
-        for _ in range(30):
-            await asyncio.sleep(3)
-            try:
-                result = await crypto.get_invoices(invoice_ids=invoice_id)
-                if result.status == 'paid':
-                    # Додаємо платіж лише якщо такого invoice_id ще не було
-                    if user_data and not any(p.get('invoice_id') == invoice_id for p in user_data['payments']):
-                        await db.add_payment(int(user_key), amount, invoice_id)
-                        user_data = await db.get_user(int(user_key))
-
-                    await message.answer(f"✅ Оплата успішна!\nВаш новий баланс: {user_data['balance']}", reply_markup=REPLY_BT)
-                    payment_history = "\n".join([f"Поповнення: {p['amount']} USDT" for p in user_data['payments']])
-                    await message.answer(f"Історія поповнень:\n{payment_history}", reply_markup=REPLY_BT)
-
-                    await state.set_state(Shop.balance)
-                    return
-            except Exception as e:
-                logging.error(f"Помилка перевірки оплати: {e}")
-                continue
-
-        await message.answer("⏳ Час очікування вичерпано. Якщо ви вже оплатили — спробуйте пізніше /start")
-        await state.set_state(Shop.balance)
+        if len(PAYMENT_ASSETS) == 1:
+            await send_invoice(message, state, message.from_user.id, amount, PAYMENT_ASSETS[0])
+            return
+
+        # Суми в інших активах — з кешу курсів, без запиту до API
+        assets_kb = InlineKeyboardBuilder()
+        for asset, asset_amount in rates.quotes(amount).items():
+            assets_kb.button(text=f"{asset}: {asset_amount.normalize():f}", callback_data=f"{PAY_ASSET_PREFIX}{asset}")
+        assets_kb.adjust(1)
+        await state.update_data(payment_amount=amount)
+        await message.answer(f"Оберіть валюту оплати для {amount} USDT:", reply_markup=assets_kb.as_markup())
 
     except ValueError:
         await message.answer("Будь ласка, введіть коректну суму (число)", reply_markup=REPLY_BT)
     except Exception as e:
         await message.answer(f"❌ Помилка при створенні інвойсу: {str(e)}")
 
-# Закриття CryptoPay клієнта
-async def on_shutdown():
-    await crypto.close()
+# Вибір валюти оплати
+@dp.callback_query(F.data.startswith(PAY_ASSET_PREFIX), flags={'payment': True})
+async def handle_pay_asset(callback: types.CallbackQuery, state: FSMContext):
+    await callback.answer()
+    asset = callback.data[len(PAY_ASSET_PREFIX):]
+    amount = (await state.get_data()).get('payment_amount')
+    if asset not in PAYMENT_ASSETS or amount is None:
+        await callback.message.answer("Введіть суму для поповнення:")
+        return
+    try:
+        await send_invoice(callback.message, state, callback.from_user.id, amount, asset)
+    except Exception as e:
+        await callback.message.answer(f"❌ Помилка при створенні інвойсу: {str(e)}")
 
-# Callback-обробник для покупки луту
-@dp.callback_query(lambda c: c.data == 'buy_loot')
-async def handle_buy_loot(callback: types.CallbackQuery, state: FSMContext):
+# Навігація каталогом луту: один хендлер, вузол шукаємо за callback_data
+@dp.callback_query(F.data.in_(catalog.NODES))
+async def handle_catalog(callback: types.CallbackQuery, state: FSMContext):
     await callback.answer()
-    
+    node = catalog.NODES[callback.data]
+
     # Отримуємо ID повідомлення з кабінету
     state_data = await state.get_data()
     cabinet_message_id = state_data.get('cabinet_message_id')
-    
+
     if cabinet_message_id:
-        # Редагуємо повідомлення з кабінету
-        kb = InlineKeyboardBuilder()
-        kb.button(text='Речі 6-го рівня вищої якості', callback_data='6_level')
-        kb.button(text='Золоті речі', callback_data='gold_stuff')
-        kb.button(text='⬅️ НАЗАД', callback_data='back_to_cabinet')
-        kb.adjust(1)
-        
         await bot.edit_message_text(
             chat_id=callback.from_user.id,
             message_id=cabinet_message_id,
-            text='Виберіть що хочете придбати',
-            reply_markup=kb.as_markup()
+            text=node.text,
+            reply_markup=node.markup
         )
     else:
         # Якщо ID повідомлення не знайдено, надсилаємо нове
-        kb = InlineKeyboardBuilder()
-        kb.button(text='Речі 6-го рівня вищої якості', callback_data='6_level')
-        kb.button(text='Золоті речі', callback_data='gold_stuff')
-        kb.button(text='⬅️ НАЗАД', callback_data='back_to_cabinet')
-        kb.adjust(1)
-        await callback.message.answer('Виберіть що хочете придбати', reply_markup=kb.as_markup())
-    
+        await callback.message.answer(node.text, reply_markup=node.markup)
+
     await state.set_state(Shop.buy_thing)
 
+# Покупка речі з каталогу
+@dp.callback_query(F.data.startswith(catalog.BUY_PREFIX))
+async def handle_purchase(callback: types.CallbackQuery, state: FSMContext):
+    item = catalog.ITEMS.get(callback.data[len(catalog.BUY_PREFIX):])
+    if item is None:
+        await callback.answer()
+        return
+
+    result = await db.purchase(callback.from_user.id, item.id)
+    status = result['status']
+    if status == 'ok':
+        text = (
+            f"✅ Покупка успішна: {item.title}\n"
+            f"Замовлення №{result['order_id']}\n"
+            f"💰 Баланс: {result['balance']} USDT"
+        )
+    elif status == 'out_of_stock':
+        text = '❌ Цей товар закінчився'
+    elif status == 'insufficient_funds':
+        text = '❌ Недостатньо коштів. Поповніть баланс'
+    elif status == 'no_user':
+        text = 'Ви не зареєстровані в системі. Спробуйте /start'
+    else:
+        text = '❌ Товар недоступний'
+    await callback.answer(text, show_alert=True)
+
+# Ринок гравців: меню
+@dp.callback_query(F.data == market.MENU)
+async def handle_market_menu(callback: types.CallbackQuery, state: FSMContext):
+    await callback.answer()
+    await state.set_state(Shop.balance)
+    await callback.message.edit_text(market.MENU_TEXT, reply_markup=market.MENU_MARKUP)
+
+# Сторінка оголошень за фільтром із FSM; повертає текст і клавіатуру
+async def market_page(state: FSMContext, cursor=None, direction: str = 'after', has_prev: bool | None = None):
+    data = await state.get_data()
+    flt = data.get('market_filter', {})
+    max_price = Decimal(flt['max_price']) if flt.get('max_price') else None
+    rows = await db.search_listings(
+        flt.get('category'), flt.get('query'), max_price, cursor, direction, MARKET_PAGE_SIZE
+    )
+    more = len(rows) > MARKET_PAGE_SIZE
+    if direction == 'before':
+        if not rows:
+            # Попередні оголошення зникли — показуємо початок
+            return await market_page(state)
+        rows = rows[-MARKET_PAGE_SIZE:]
+        has_prev, has_next = more, True
+    else:
+        rows = rows[:MARKET_PAGE_SIZE]
+        has_next = more
+        if has_prev is None:
+            has_prev = cursor is not None
+    title = market.filter_text(flt.get('category'), flt.get('query'), max_price)
+    if not rows:
+        return f"{title}\nНічого не знайдено", market.page_markup([], False, False)
+    await state.update_data(market_page={'start': market.encode_cursor(rows[0]), 'has_prev': has_prev})
+    return f"{title}\nОберіть оголошення:", market.page_markup(rows, has_prev, has_next)
+
+# Поточна сторінка заново: після перегляду чи покупки оголошення
+async def current_market_page(state: FSMContext):
+    page = (await state.get_data()).get('market_page')
+    if page is None:
+        return await market_page(state)
+    return await market_page(state, market.decode_cursor(page['start']), 'from', page['has_prev'])
+
+@dp.callback_query(F.data.startswith(market.CATEGORY_PREFIX))
+async def handle_market_category(callback: types.CallbackQuery, state: FSMContext):
+    await callback.answer()
+    await state.set_state(Shop.balance)
+    category = callback.data[len(market.CATEGORY_PREFIX):]
+    category = category if category in market.CATEGORIES else None
+    await state.update_data(market_filter={'category': category})
+    text, markup = await market_page(state)
+    await callback.message.edit_text(text, reply_markup=markup)
+
+@dp.callback_query(F.data.startswith(market.PAGE_PREFIX))
+async def handle_market_page(callback: types.CallbackQuery, state: FSMContext):
+    await callback.answer()
+    await state.set_state(Shop.balance)
+    action = callback.data[len(market.PAGE_PREFIX):]
+    if action == 'c':
+        text, markup = await current_market_page(state)
+    else:
+        direction = 'before' if action.startswith('p:') else 'after'
+        text, markup = await market_page(state, market.decode_cursor(action[2:]), direction)
+    await callback.message.edit_text(text, reply_markup=markup)
+
+@dp.callback_query(F.data == market.SEARCH)
+async def handle_market_search(callback: types.CallbackQuery, state: FSMContext):
+    await callback.answer()
+    await callback.message.answer('Що шукаєте? Наприклад: mk14 до 5')
+    await state.set_state(Market.search)
+
+@dp.message(StateFilter(Market.search))
+async def process_market_search(message: types.Message, state: FSMContext):
+    if message.text == '🖥 Головне меню':
+        await state.set_state(Shop.balance)
+        await process_balance(message, state)
+        return
+    query, max_price = market.parse_search(message.text or '')
+    category = (await state.get_data()).get('market_filter', {}).get('category')
+    await state.update_data(market_filter={
+        'category': category,
+        'query': query,
+        'max_price': str(max_price) if max_price is not None else None,
+    })
+    await state.set_state(Shop.balance)
+    text, markup = await market_page(state)
+    await message.answer(text, reply_markup=markup)
+
+@dp.callback_query(F.data.startswith(market.ITEM_PREFIX))
+async def handle_market_item(callback: types.CallbackQuery, state: FSMContext):
+    listing = await db.get_listing(int(callback.data[len(market.ITEM_PREFIX):]))
+    if listing is None:
+        await callback.answer('Оголошення вже продано або знято', show_alert=True)
+        return
+    await callback.answer()
+    own = listing['seller_id'] == callback.from_user.id
+    await callback.message.edit_text(market.listing_text(listing), reply_markup=market.listing_markup(listing, own))
+
+@dp.callback_query(F.data.startswith(market.BUY_PREFIX))
+async def handle_market_buy(callback: types.CallbackQuery, state: FSMContext):
+    result = await db.buy_listing(callback.from_user.id, int(callback.data[len(market.BUY_PREFIX):]))
+    status = result['status']
+    if status == 'ok':
+        await callback.answer(
+            f"✅ Придбано: {result['title']}\n💰 Баланс: {result['balance']} USDT",
+            show_alert=True,
+        )
+        try:
+            await bot.send_message(
+                result['seller_id'],
+                f"💵 Ваше оголошення «{html.escape(result['title'])}» продано за {result['price']} USDT",
+            )
+        except Exception as e:
+            logging.warning(f"Не вдалося повідомити продавця {result['seller_id']}: {e}")
+        text, markup = await current_market_page(state)
+        await callback.message.edit_text(text, reply_markup=markup)
+        return
+    if status == 'not_available':
+        text = '❌ Оголошення вже продано або знято'
+    elif status == 'own_listing':
+        text = '❌ Це ваше оголошення'
+    elif status == 'insufficient_funds':
+        text = '❌ Недостатньо коштів. Поповніть баланс'
+    else:
+        text = 'Ви не зареєстровані в системі. Спробуйте /start'
+    await callback.answer(text, show_alert=True)
+
+# Продаж: категорія -> назва -> ціна
+@dp.callback_query(F.data == market.SELL)
+async def handle_market_sell(callback: types.CallbackQuery, state: FSMContext):
+    await callback.answer()
+    await callback.message.edit_text('Оберіть категорію луту:', reply_markup=market.NEW_LISTING_MARKUP)
+
+@dp.callback_query(F.data.startswith(market.NEW_PREFIX))
+async def handle_market_new(callback: types.CallbackQuery, state: FSMContext):
+    await callback.answer()
+    category = callback.data[len(market.NEW_PREFIX):]
+    if category not in market.CATEGORIES:
+        return
+    await state.update_data(new_listing_category=category)
+    await callback.message.answer(f'Введіть назву луту (до {market.TITLE_MAX_LENGTH} символів):')
+    await state.set_state(Market.listing_title)
+
+@dp.message(StateFilter(Market.listing_title))
+async def process_listing_title(message: types.Message, state: FSMContext):
+    if message.text == '🖥 Головне меню':
+        await state.set_state(Shop.balance)
+        await process_balance(message, state)
+        return
+    title = market.parse_title(message.text or '')
+    if title is None:
+        await message.answer(f'❌ Назва має містити від 1 до {market.TITLE_MAX_LENGTH} символів. Спробуйте ще раз:')
+        return
+    await state.update_data(new_listing_title=title)
+    await message.answer('Введіть ціну в USDT:')
+    await state.set_state(Market.listing_price)
+
+@dp.message(StateFilter(Market.listing_price))
+async def process_listing_price(message: types.Message, state: FSMContext):
+    if message.text == '🖥 Головне меню':
+        await state.set_state(Shop.balance)
+        await process_balance(message, state)
+        return
+    price = market.parse_price(message.text or '')
+    if price is None:
+        await message.answer(f'❌ Ціна має бути числом від 0.01 до {market.MAX_PRICE}. Спробуйте ще раз:')
+        return
+    data = await state.get_data()
+    listing_id = await db.create_listing(
+        message.from_user.id, data['new_listing_category'], data['new_listing_title'], price
+    )
+    await state.set_state(Shop.balance)
+    if listing_id is None:
+        await message.answer('Ви не зареєстровані в системі. Спробуйте /start')
+        return
+    await message.answer(
+        f"✅ Оголошення №{listing_id} опубліковано: {html.escape(data['new_listing_title'])} за {price} USDT",
+        reply_markup=market.MENU_MARKUP,
+    )
+
+@dp.callback_query(F.data == market.MINE)
+async def handle_market_mine(callback: types.CallbackQuery, state: FSMContext):
+    await callback.answer()
+    rows = await db.seller_listings(callback.from_user.id)
+    text = 'Ваші активні оголошення (натисніть, щоб зняти):' if rows else 'У вас немає активних оголошень'
+    await callback.message.edit_text(text, reply_markup=market.mine_markup(rows))
+
+@dp.callback_query(F.data.startswith(market.CANCEL_PREFIX))
+async def handle_market_cancel(callback: types.CallbackQuery, state: FSMContext):
+    cancelled = await db.cancel_listing(callback.from_user.id, int(callback.data[len(market.CANCEL_PREFIX):]))
+    await callback.answer('Оголошення знято' if cancelled else 'Оголошення вже продано або знято')
+    rows = await db.seller_listings(callback.from_user.id)
+    text = 'Ваші активні оголошення (натисніть, щоб зняти):' if rows else 'У вас немає активних оголошень'
+    await callback.message.edit_text(text, reply_markup=market.mine_markup(rows))
+
+# Підтримка: кожне повідомлення користувача йде в чергу звернень
+@dp.callback_query(F.data == 'tech_support')
+async def handle_tech_support(callback: types.CallbackQuery, state: FSMContext):
+    await callback.answer()
+    await callback.message.answer(
+        '💬 Опишіть проблему одним чи кількома повідомленнями — оператор відповість тут.',
+        reply_markup=SUPPORT_CLOSE,
+    )
+    await state.set_state(Support.chat)
+
+@dp.message(StateFilter(Support.chat))
+async def process_support_message(message: types.Message, state: FSMContext):
+    if message.text == '🖥 Головне меню':
+        await state.set_state(Shop.balance)
+        await process_balance(message, state)
+        return
+    if not message.text:
+        await message.answer('Поки що підтримка приймає лише текст')
+        return
+    ticket_id, created = await support_desk.submit(message.from_user.id, message.text)
+    if created:
+        await message.answer(f'📨 Звернення №{ticket_id} створено. Оператор скоро відповість', reply_markup=SUPPORT_CLOSE)
+
+@dp.callback_query(F.data == 'support_close')
+async def handle_support_close(callback: types.CallbackQuery, state: FSMContext):
+    ticket = await support_desk.close_by_user(callback.from_user.id)
+    await callback.answer('Звернення закрито' if ticket else 'Відкритих звернень немає')
+    await state.set_state(Shop.balance)
+    if ticket and ticket['operator_id']:
+        await bot.send_message(ticket['operator_id'], f"Користувач закрив звернення №{ticket['id']}")
+
 # Callback-обробник для кнопки "НАЗАД"
 @dp.callback_query(lambda c: c.data == 'back_to_cabinet')
 async def handle_back_to_cabinet(callback: types.CallbackQuery, state: FSMContext):
@@ -289,106 +791,10 @@ async def handle_back_to_cabinet(callback: types.CallbackQuery, state: FSMContex
                 chat_id=callback.from_user.id,
                 message_id=cabinet_message_id,
                 text=f"🎮 Ваш ігровий ID: {game_id}\n💰 Баланс: {balance} USDT",
-                reply_markup=get_cabinet_inline(),
+                reply_markup=CABINET_INLINE,
             )
     await state.set_state(Shop.balance)
 
-@dp.callback_query(lambda c: c.data == 'gold_stuff')
-async def handle_gold_stuff(callback: types.CallbackQuery, state: FSMContext):
-    await callback.answer()
-    
-    # Отримуємо ID повідомлення з кабінету
-    state_data = await state.get_data()
-    cabinet_message_id = state_data.get('cabinet_message_id')
-    
-    if cabinet_message_id:
-        # Редагуємо повідомлення з кабінету
-        kb = InlineKeyboardBuilder()
-        kb.button(text='Mk14 золота', callback_data='mk14_gold')
-        kb.button(text='JS9 золота', callback_data='js9_gold')
-        kb.button(text='Бронижелет("Кобра",золотий)', callback_data='cobrar_gold')
-        kb.button(text='⬅️ НАЗАД', callback_data='back_to_stuff')
-        kb.adjust(1)
-        
-        await bot.edit_message_text(
-            chat_id=callback.from_user.id,
-            message_id=cabinet_message_id,
-            text='Виберіть річ',
-            reply_markup=kb.as_markup()
-        )
-    else:
-        # Якщо ID повідомлення не знайдено, надсилаємо нове
-        kb = InlineKeyboardBuilder()
-        kb.button(text='Mk14 золота', callback_data='mk14_gold')
-        kb.button(text='JS9 золота', callback_data='js9_gold')
-        kb.button(text='Бронижелет("Кобра",золотий)', callback_data='cobrar_gold')
-        kb.button(text='⬅️ НАЗАД', callback_data='back_to_stuff')
-        kb.adjust(1)
-        await callback.message.answer('Виберіть річ', reply_markup=kb.as_markup())
-    
-    await state.set_state(Shop.buy_thing)
-
-# Callback-обробник для кнопки "НАЗАД"
-@dp.callback_query(lambda c: c.data == 'back_to_stuff')
-async def handle_back_to_stuff(callback: types.CallbackQuery, state: FSMContext):
-    await callback.answer()
-    
-    # Отримуємо ID повідомлення з кабінету
-    state_data = await state.get_data()
-    cabinet_message_id = state_data.get('cabinet_message_id')
-    
-    if cabinet_message_id:
-        # Повертаємося до списку товарів
-        kb = InlineKeyboardBuilder()
-        kb.button(text='Речі 6-го рівня вищої якості', callback_data='6_level')
-        kb.button(text='Золоті речі', callback_data='gold_stuff')
-        kb.button(text='⬅️ НАЗАД', callback_data='back_to_cabinet')
-        kb.adjust(1)
-        
-        await bot.edit_message_text(
-            chat_id=callback.from_user.id,
-            message_id=cabinet_message_id,
-            text='Виберіть що хочете придбати',
-            reply_markup=kb.as_markup()
-        )
-    
-    await state.set_state(Shop.buy_thing)
-
-@dp.callback_query(lambda c: c.data == '6_level')
-async def handle_gold_stuff(callback: types.CallbackQuery, state: FSMContext):
-    await callback.answer()
-    
-    # Отримуємо ID повідомлення з кабінету
-    state_data = await state.get_data()
-    cabinet_message_id = state_data.get('cabinet_message_id')
-    
-    if cabinet_message_id:
-        # Редагуємо повідомлення з кабінету
-        kb = InlineKeyboardBuilder()
-        kb.button(text='Mk14 6-го рівня', callback_data='mk14_6')
-        kb.button(text='JS9 6-го рівня', callback_data='js9_6')
-        kb.button(text='Бронижелет("Кобра",6-го рівня)', callback_data='cobrar_6')
-        kb.button(text='⬅️ НАЗАД', callback_data='back_to_stuff')
-        kb.adjust(1)
-        
-        await bot.edit_message_text(
-            chat_id=callback.from_user.id,
-            message_id=cabinet_message_id,
-            text='Виберіть річ',
-            reply_markup=kb.as_markup()
-        )
-    else:
-        # Якщо ID повідомлення не знайдено, надсилаємо нове
-        kb = InlineKeyboardBuilder()
-        kb.button(text='Mk14 золота', callback_data='mk14_gold')
-        kb.button(text='JS9 золота', callback_data='js9_gold')
-        kb.button(text='Бронижелет("Кобра",золотий)', callback_data='cobrar_gold')
-        kb.button(text='⬅️ НАЗАД', callback_data='back_to_stuff')
-        kb.adjust(1)
-        await callback.message.answer('Виберіть річ', reply_markup=kb.as_markup())
-    
-    await state.set_state(Shop.buy_thing)
-
 @dp.callback_query(lambda c: c.data == 'change_game_id')
 async def handle_change_game_id(callback: types.CallbackQuery, state: FSMContext):
     await callback.answer()
@@ -396,11 +802,6 @@ async def handle_change_game_id(callback: types.CallbackQuery, state: FSMContext
     cabinet_message_id = state_data.get('cabinet_message_id')
     user_key = str(callback.from_user.id)
     user_data = await db.get_user(int(user_key))
-    # Клавіатура з кнопкою назад
-    kb = InlineKeyboardBuilder()
-    kb.button(text='⬅️ НАЗАД', callback_data='back_to_cabinet')
-    kb.adjust(1)
-
     if user_data:
         await state.update_data(is_changing_id=True)
         if cabinet_message_id:
@@ -408,10 +809,10 @@ async def handle_change_game_id(callback: types.CallbackQuery, state: FSMContext
                 chat_id=callback.from_user.id,
                 message_id=cabinet_message_id,
                 text='Введіть нове ігрове ID:',
-                reply_markup=kb.as_markup()
+                reply_markup=BACK_TO_CABINET
             )
         else:
-            await callback.message.answer('Введіть нове ігрове ID:', reply_markup=kb.as_markup())
+            await callback.message.answer('Введіть нове ігрове ID:', reply_markup=BACK_TO_CABINET)
         await state.set_state(Shop.id)
     else:
         if cabinet_message_id:
@@ -419,19 +820,123 @@ async def handle_change_game_id(callback: types.CallbackQuery, state: FSMContext
                 chat_id=callback.from_user.id,
                 message_id=cabinet_message_id,
                 text='Ви не зареєстровані в системі. Спробуйте /start',
-                reply_markup=kb.as_markup()
+                reply_markup=BACK_TO_CABINET
             )
         else:
-            await callback.message.answer('Ви не зареєстровані в системі. Спробуйте /start', reply_markup=kb.as_markup())
-
-# Закриття CryptoPay клієнта
+            await callback.message.answer('Ви не зареєстровані в системі. Спробуйте /start', reply_markup=BACK_TO_CABINET)
+
+def setup_payment_routes(app: web.Application):
+    setup_cryptopay_webhook(app, CRYPTO_TOKEN, poller, CRYPTO_WEBHOOK_PATH)
+
+def pool_usage():
+    if db.pool is None:
+        return {}
+    size = db.pool.get_size()
+    idle = db.pool.get_idle_size()
+    return {'in_use': size - idle, 'idle': idle}
+
+async def fsm_state_counts():
+    if isinstance(storage, PostgresStorage):
+        return await storage.count_states()
+    counts = {}
+    for record in storage.storage.values():
+        if record.state is not None:
+            counts[record.state] = counts.get(record.state, 0) + 1
+    return counts
+
+metrics.Gauge('db_pool_connections', 'Pool connections by state', ('state',), pool_usage)
+metrics.Gauge('payments_pending_invoices', 'Invoices waiting for payment', function=lambda: len(poller.pending))
+metrics.Gauge('fsm_states', 'Users in each FSM state', ('state',), fsm_state_counts)
+metrics.Gauge('exchange_rates_age_seconds', 'Seconds since the last rate refresh', function=rates.age)
+metrics.Gauge('support_tickets', 'Open support tickets by status', ('status',), support_desk.counts)
+metrics.Gauge('bot_startup_seconds', 'Duration of startup phases', ('phase',), lambda: startup_seconds)
+metrics.Gauge('user_cache_entries', 'Cached user profiles', function=lambda: len(db.user_cache))
+metrics.Gauge('user_cache_hits', 'Profile lookups served from cache', function=lambda: db.user_cache_stats()['hits'])
+metrics.Gauge('user_cache_misses', 'Profile lookups that went to the database', function=lambda: db.user_cache_stats()['misses'])
+
+async def start_metrics_server():
+    global metrics_runner
+    app = web.Application()
+    metrics.setup_metrics_route(app, METRICS_PATH)
+    metrics_runner = web.AppRunner(app)
+    await metrics_runner.setup()
+    await web.TCPSite(metrics_runner, METRICS_HOST, METRICS_PORT).start()
+
+async def on_startup():
+    global web_runner
+    started = time.perf_counter()
+    poller.start()
+    if len(PAYMENT_ASSETS) > 1:
+        rates.start()
+    if RECONCILE_INTERVAL:
+        reconciler.start()
+    await broadcaster.resume()
+    support_desk.start()
+    activity.start()
+    if METRICS_PORT:
+        await start_metrics_server()
+    if isinstance(storage, PostgresStorage):
+        storage.start()
+    # У режимі вебхука Telegram маршрут CryptoPay живе на тому ж сервері
+    if PAYMENT_MODE == 'webhook' and BOT_MODE == 'polling':
+        app = web.Application()
+        setup_payment_routes(app)
+        web_runner = web.AppRunner(app)
+        await web_runner.setup()
+        await web.TCPSite(web_runner, CRYPTO_WEBHOOK_HOST, CRYPTO_WEBHOOK_PORT).start()
+    startup_seconds['on_startup'] = time.perf_counter() - started
+    startup_seconds['total'] = time.perf_counter() - STARTED_AT
+    logging.info(
+        f"Старт за {startup_seconds['total']:.2f} с: "
+        + ", ".join(f"{phase} {seconds:.2f}" for phase, seconds in startup_seconds.items() if phase != 'total')
+    )
+
+# Зупинка: вебсервери, poller, черга повідомлень, CryptoPay клієнт, пул бази
 async def on_shutdown():
+    if web_runner is not None:
+        await web_runner.cleanup()
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+    await poller.stop()
+    await rates.stop()
+    await reconciler.stop()
+    await broadcaster.stop()
+    await support_desk.stop()
+    await activity.stop()
+    if recorder is not None:
+        recorder.close()
+    await outbox.close(SHUTDOWN_TIMEOUT)
     await crypto.close()
+    await db.close_pool()
 
 # Запуск
 async def main():
+    startup_seconds['imports'] = time.perf_counter() - STARTED_AT
+    started = time.perf_counter()
     await db.init_pool()
-    await dp.start_polling(bot, shutdown=on_shutdown)
+    startup_seconds['db_pool'] = time.perf_counter() - started
+    started = time.perf_counter()
+    await db.sync_items(catalog.item_rows())
+    if USER_CACHE_PG_NOTIFY:
+        await db.enable_pg_invalidation()
+    startup_seconds['catalog'] = time.perf_counter() - started
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    if BOT_MODE == 'webhook':
+        await run_webhook(
+            dp,
+            bot,
+            base_url=WEBHOOK_BASE_URL,
+            path=WEBHOOK_PATH,
+            host=WEBHOOK_HOST,
+            port=WEBHOOK_PORT,
+            secret=WEBHOOK_SECRET or None,
+            max_concurrent=MAX_CONCURRENT_UPDATES,
+            shutdown_timeout=SHUTDOWN_TIMEOUT,
+            setup_routes=setup_payment_routes if PAYMENT_MODE == 'webhook' else None,
+        )
+    else:
+        await dp.start_polling(bot, tasks_concurrency_limit=MAX_CONCURRENT_UPDATES)
 
 if __name__ == '__main__':
     asyncio.run(main())
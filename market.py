@@ -0,0 +1,165 @@
+import html
+import re
+from decimal import Decimal, InvalidOperation
+
+from aiogram.types import InlineKeyboardMarkup
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+BACK_TEXT = '⬅️ НАЗАД'
+
+# callback_data ринку; усі починаються з mk_, щоб не перетинатися з каталогом
+MENU = 'become_seller'
+SEARCH = 'mk_search'
+SELL = 'mk_sell'
+MINE = 'mk_mine'
+CATEGORY_PREFIX = 'mk_cat:'
+NEW_PREFIX = 'mk_new:'
+ITEM_PREFIX = 'mk_item:'
+BUY_PREFIX = 'mk_buy:'
+CANCEL_PREFIX = 'mk_del:'
+# mk_pg:n:<price>:<id> — далі, mk_pg:p:<price>:<id> — назад, mk_pg:c — поточна сторінка
+PAGE_PREFIX = 'mk_pg:'
+ALL = 'all'
+
+CATEGORIES = {
+    'weapons': '🔫 Зброя',
+    'armor': '🦺 Броня',
+    'helmets': '⛑ Шоломи',
+    'other': '📦 Інше',
+}
+
+TITLE_MAX_LENGTH = 64
+MAX_PRICE = Decimal(100000)
+PRICE_PRECISION = Decimal('0.01')
+_WORD = re.compile(r'\w+')
+_TAG = re.compile(r'<[^<>]*>')
+# "до 5" або "<5" у пошуковому запиті — фільтр за ціною
+_MAX_PRICE = re.compile(r'(?:\bдо|<=?)\s*(\d+(?:[.,]\d+)?)', re.IGNORECASE)
+
+
+def parse_price(text: str) -> Decimal | None:
+    try:
+        price = Decimal(text.strip().replace(',', '.'))
+    except InvalidOperation:
+        return None
+    if not price.is_finite() or price <= 0 or price > MAX_PRICE:
+        return None
+    return price.quantize(PRICE_PRECISION)
+
+
+def parse_title(text: str) -> str | None:
+    """Назва без HTML-тегів і зайвих пробілів; None, якщо порожня чи задовга.
+
+    Решту ("<", "&") назва зберігає як є — при виводі її екранує listing_text.
+    """
+    title = ' '.join(_TAG.sub('', text).split())
+    if not title or len(title) > TITLE_MAX_LENGTH:
+        return None
+    return title
+
+
+def parse_search(text: str) -> tuple[str | None, Decimal | None]:
+    """Повертає (tsquery для to_tsquery('simple', ...), максимальна ціна)."""
+    max_price = None
+    match = _MAX_PRICE.search(text)
+    if match:
+        max_price = parse_price(match.group(1))
+        text = text[:match.start()] + text[match.end():]
+    # Лише літери й цифри: решта синтаксису tsquery від користувача не потрапляє
+    words = _WORD.findall(text.lower())[:8]
+    query = ' & '.join(f'{word}:*' for word in words) or None
+    return query, max_price
+
+
+def encode_cursor(row) -> str:
+    return f"{row['price']}:{row['id']}"
+
+
+def decode_cursor(text: str) -> tuple[Decimal, int] | None:
+    try:
+        price, listing_id = text.split(':')
+        return Decimal(price), int(listing_id)
+    except (ValueError, InvalidOperation):
+        return None
+
+
+def _menu_markup() -> InlineKeyboardMarkup:
+    kb = InlineKeyboardBuilder()
+    kb.button(text='🔎 Пошук', callback_data=SEARCH)
+    kb.button(text='🛍 Усі оголошення', callback_data=CATEGORY_PREFIX + ALL)
+    for key, title in CATEGORIES.items():
+        kb.button(text=title, callback_data=CATEGORY_PREFIX + key)
+    kb.button(text='➕ Продати лут', callback_data=SELL)
+    kb.button(text='📋 Мої оголошення', callback_data=MINE)
+    kb.button(text=BACK_TEXT, callback_data='back_to_cabinet')
+    kb.adjust(1, 1, 2, 2, 1, 1, 1)
+    return kb.as_markup()
+
+
+def _new_listing_markup() -> InlineKeyboardMarkup:
+    kb = InlineKeyboardBuilder()
+    for key, title in CATEGORIES.items():
+        kb.button(text=title, callback_data=NEW_PREFIX + key)
+    kb.button(text=BACK_TEXT, callback_data=MENU)
+    kb.adjust(2)
+    return kb.as_markup()
+
+
+MENU_TEXT = '🏪 Ринок гравців\nКупуйте лут в інших гравців або виставте свій'
+MENU_MARKUP = _menu_markup()
+NEW_LISTING_MARKUP = _new_listing_markup()
+
+
+def filter_text(category: str | None, query: str | None, max_price: Decimal | None) -> str:
+    parts = [CATEGORIES.get(category, '🛍 Усі оголошення')]
+    if query:
+        parts.append('🔎 ' + query.replace(':*', '').replace(' & ', ' '))
+    if max_price is not None:
+        parts.append(f'до {max_price} USDT')
+    return ' · '.join(parts)
+
+
+def page_markup(rows: list, has_prev: bool, has_next: bool) -> InlineKeyboardMarkup:
+    kb = InlineKeyboardBuilder()
+    for row in rows:
+        kb.button(text=f"{row['title']} — {row['price']} USDT", callback_data=f"{ITEM_PREFIX}{row['id']}")
+    nav = []
+    if has_prev:
+        kb.button(text='◀️', callback_data=f"{PAGE_PREFIX}p:{encode_cursor(rows[0])}")
+        nav.append(1)
+    if has_next:
+        kb.button(text='▶️', callback_data=f"{PAGE_PREFIX}n:{encode_cursor(rows[-1])}")
+        nav.append(1)
+    kb.button(text=BACK_TEXT, callback_data=MENU)
+    kb.adjust(*([1] * len(rows)), *([len(nav)] if nav else []), 1)
+    return kb.as_markup()
+
+
+def listing_text(row) -> str:
+    # Назву вводить продавець, а бот шле з parse_mode HTML
+    return (
+        f"{html.escape(row['title'])}\n"
+        f"{CATEGORIES.get(row['category'], row['category'])}\n"
+        f"Ціна: {row['price']} USDT\n"
+        f"Оголошення №{row['id']}"
+    )
+
+
+def listing_markup(row, own: bool) -> InlineKeyboardMarkup:
+    kb = InlineKeyboardBuilder()
+    if own:
+        kb.button(text='❌ Зняти з продажу', callback_data=f"{CANCEL_PREFIX}{row['id']}")
+    else:
+        kb.button(text=f"🛒 Купити за {row['price']} USDT", callback_data=f"{BUY_PREFIX}{row['id']}")
+    kb.button(text=BACK_TEXT, callback_data=PAGE_PREFIX + 'c')
+    kb.adjust(1)
+    return kb.as_markup()
+
+
+def mine_markup(rows: list) -> InlineKeyboardMarkup:
+    kb = InlineKeyboardBuilder()
+    for row in rows:
+        kb.button(text=f"❌ {row['title']} — {row['price']} USDT", callback_data=f"{CANCEL_PREFIX}{row['id']}")
+    kb.button(text=BACK_TEXT, callback_data=MENU)
+    kb.adjust(1)
+    return kb.as_markup()
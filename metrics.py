@@ -0,0 +1,206 @@
+"""Метрики бота у текстовому форматі Prometheus.
+
+Лічильники й гістограми оновлюються на гарячому шляху (лише арифметика
+в пам'яті), gauge-и рахуються під час запиту /metrics.
+"""
+import bisect
+import functools
+import inspect
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiohttp import web
+
+# Секунди; нижні бакети — для кешованих запитів і хендлерів без мережі
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry: list = []
+
+INF_LABEL = 'le="+Inf"'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values: dict[tuple, float] = {}
+        _registry.append(self)
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    async def collect(self) -> list[str]:
+        return [f'{self.name}{_labels(self.labelnames, k)} {_number(v)}' for k, v in self.values.items()]
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # labels -> [лічильники по бакетах..., сума, кількість]
+        self.values: dict[tuple, list] = {}
+        _registry.append(self)
+
+    def observe(self, value: float, *labels):
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [0] * len(self.buckets) + [0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    async def collect(self) -> list[str]:
+        lines = []
+        for labels, series in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, INF_LABEL)} {series[-1]}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(series[-2])}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {series[-1]}')
+        return lines
+
+
+class Gauge:
+    """Значення рахується функцією під час збору метрик.
+
+    Функція (звичайна чи async) повертає число або dict {мітки: число}.
+    """
+
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), function: Callable | None = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.function = function
+        self.value = 0
+        _registry.append(self)
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function: Callable):
+        self.function = function
+
+    async def collect(self) -> list[str]:
+        value = self.value
+        if self.function is not None:
+            value = self.function()
+            if inspect.isawaitable(value):
+                value = await value
+        if not isinstance(value, dict):
+            value = {(): value}
+        return [
+            f'{self.name}{_labels(self.labelnames, k if isinstance(k, tuple) else (k,))} {_number(v)}'
+            for k, v in value.items()
+        ]
+
+
+HANDLER_SECONDS = Histogram('bot_handler_seconds', 'Handler execution time', ('handler',))
+HANDLER_ERRORS = Counter('bot_handler_errors_total', 'Handler exceptions', ('handler',))
+DB_SECONDS = Histogram('db_call_seconds', 'db.* coroutine time', ('call',))
+DB_ERRORS = Counter('db_call_errors_total', 'db.* coroutine exceptions', ('call',))
+CRYPTO_SECONDS = Histogram('cryptopay_call_seconds', 'CryptoPay API call time', ('call',))
+CRYPTO_ERRORS = Counter('cryptopay_call_errors_total', 'CryptoPay API call exceptions', ('call',))
+SCRAPE_ERRORS = Counter('metrics_collect_errors_total', 'Metrics that failed to collect', ('metric',))
+
+
+async def render() -> str:
+    lines = []
+    for metric in _registry:
+        try:
+            samples = await metric.collect()
+        except Exception:
+            SCRAPE_ERRORS.inc(metric.name)
+            continue
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+
+def timed(function: Callable[..., Awaitable], seconds: Histogram, errors: Counter, label: str):
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await function(*args, **kwargs)
+        except Exception:
+            errors.inc(label)
+            raise
+        finally:
+            seconds.observe(time.perf_counter() - started, label)
+
+    wrapper.__wrapped_timed__ = True
+    return wrapper
+
+
+def instrument(target: Any, seconds: Histogram, errors: Counter):
+    """Обгортає всі публічні корутини модуля чи об'єкта таймером.
+
+    Виклики через атрибут (db.get_user, crypto.create_invoice) потрапляють
+    у метрики без змін у місцях виклику.
+    """
+    for name in dir(target):
+        if name.startswith('_'):
+            continue
+        attr = getattr(target, name)
+        if inspect.ismodule(target) and getattr(attr, '__module__', None) != target.__name__:
+            # Імпортовані в модуль чужі функції не чіпаємо
+            continue
+        if inspect.iscoroutinefunction(attr) and not getattr(attr, '__wrapped_timed__', False):
+            setattr(target, name, timed(attr, seconds, errors, name))
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Внутрішній middleware: час і помилки кожного хендлера."""
+
+    async def __call__(self, handler, event, data):
+        name = data['handler'].callback.__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=await render(), headers={'Content-Type': CONTENT_TYPE})
+
+
+def setup_metrics_route(app: web.Application, path: str = '/metrics'):
+    app.router.add_get(path, handle_metrics)
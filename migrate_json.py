@@ -0,0 +1,304 @@
+"""Перенесення старої бази db.json (прототипи) у Postgres.
+
+Файл читається потоково, по одному користувачу, і вантажиться пачками
+через COPY у тимчасові таблиці, звідки одним INSERT ... SELECT переходить
+у users і payments. Після кожної пачки в json_migrations фіксується
+байтовий зсув у файлі, тож перерваний запуск продовжується з місця зупинки,
+а повторний нічого не дублює: наявні користувачі не перезаписуються,
+платежі дедуплікуються за invoice_id.
+
+    python migrate_json.py db.json
+    python migrate_json.py db.json --restart
+"""
+import argparse
+import asyncio
+import codecs
+import json
+import logging
+import os
+import time
+from decimal import Decimal, InvalidOperation
+
+import db
+
+CHUNK_SIZE = 1 << 20
+BATCH_SIZE = 20000
+
+PROGRESS_DDL = """
+CREATE TABLE IF NOT EXISTS json_migrations (
+    source TEXT PRIMARY KEY,
+    size BIGINT NOT NULL,
+    byte_offset BIGINT NOT NULL DEFAULT 0,
+    users BIGINT NOT NULL DEFAULT 0,
+    payments BIGINT NOT NULL DEFAULT 0,
+    finished_at TIMESTAMPTZ
+)
+"""
+
+STAGING_DDL = """
+CREATE TEMP TABLE migrate_users (
+    user_id BIGINT, game_id TEXT, balance NUMERIC
+) ON COMMIT DROP;
+CREATE TEMP TABLE migrate_payments (
+    user_id BIGINT, amount NUMERIC, invoice_id BIGINT
+) ON COMMIT DROP;
+"""
+
+# Наявних користувачів не чіпаємо: у Postgres їхні дані новіші за експорт.
+# Дата реєстрації невідома, тож у конверсію /stats перенесені не потрапляють,
+# а до підсумків балансів додаються
+INSERT_USERS_SQL = f"""
+WITH ins AS (
+    INSERT INTO users(user_id, game_id, balance, created_at)
+    SELECT DISTINCT ON (user_id) user_id, game_id, balance, NULL FROM migrate_users
+    ON CONFLICT (user_id) DO NOTHING
+    RETURNING user_id, balance
+),
+totals AS (
+    INSERT INTO stats_totals(shard, users, balance)
+    SELECT user_id % {db.STATS_SHARDS}, count(*), sum(balance) FROM ins
+    GROUP BY 1
+    ORDER BY 1
+    ON CONFLICT (shard) DO UPDATE
+    SET users = stats_totals.users + EXCLUDED.users, balance = stats_totals.balance + EXCLUDED.balance
+)
+SELECT count(*) FROM ins
+"""
+
+# Лічильники з get_user збільшуються лише на реально вставлені платежі,
+# тож повтор пачки їх не подвоїть. Дати платежу в db.json немає: created_at
+# лишається NULL, інакше вся історія потрапила б у /stats як поповнення в
+# день перенесення
+INSERT_PAYMENTS_SQL = """
+WITH ins AS (
+    INSERT INTO payments(user_id, amount, invoice_id, created_at)
+    SELECT DISTINCT ON (invoice_id) user_id, amount, invoice_id, NULL::timestamptz FROM migrate_payments
+    ORDER BY invoice_id
+    ON CONFLICT (invoice_id) DO NOTHING
+    RETURNING user_id, amount
+),
+totals AS (
+    SELECT user_id, count(*) AS count, sum(amount) AS total FROM ins GROUP BY user_id
+),
+upd AS (
+    UPDATE users u
+    SET payments_count = u.payments_count + t.count,
+        payments_total = u.payments_total + t.total
+    FROM totals t
+    WHERE u.user_id = t.user_id
+)
+SELECT count(*) FROM ins
+"""
+
+SAVE_PROGRESS_SQL = """
+UPDATE json_migrations
+SET byte_offset = $2, users = users + $3, payments = payments + $4
+WHERE source = $1
+"""
+
+
+class JSONObjectStream:
+    """Ітерує пари (ключ, значення) верхнього об'єкта JSON, не читаючи файл цілком.
+
+    offset — байтова позиція у файлі, з якої почнеться наступна пара; з неї
+    можна продовжити, передавши resume_offset.
+    """
+
+    def __init__(self, f, resume_offset: int = 0, chunk_size: int = CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        # offset відповідає позиції mark у буфері
+        self.mark = 0
+        self.offset = resume_offset
+        self.eof = False
+        self.started = resume_offset > 0
+        f.seek(resume_offset)
+
+    def _advance(self):
+        self.offset += len(self.buf[self.mark:self.pos].encode('utf-8'))
+        self.mark = self.pos
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        self._advance()
+        chunk = self.f.read(self.chunk_size)
+        self.eof = not chunk
+        self.buf = self.buf[self.pos:] + self.utf8.decode(chunk, final=self.eof)
+        self.pos = self.mark = 0
+        return True
+
+    def _skip(self, chars: str = ' \t\r\n') -> str:
+        """Пропускає символи chars і повертає наступний символ ('' в кінці файлу)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in chars:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def _decode(self):
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # Значення обрізане кінцем буфера — дочитуємо; в кінці файлу це справжня помилка
+                if not self._fill():
+                    raise
+                continue
+            if end == len(self.buf) and self._fill():
+                # Число на межі буфера могло бути обрізане
+                continue
+            self.pos = end
+            return value
+
+    def __iter__(self):
+        if not self.started:
+            if self._skip(' \t\r\n\ufeff') != '{':
+                raise ValueError('Expected a JSON object at the top level')
+            self.pos += 1
+            self.started = True
+        while True:
+            char = self._skip(' \t\r\n,')
+            if char == '}':
+                return
+            if char != '"':
+                raise ValueError(f'Unexpected {char!r} near byte {self.offset}')
+            key = self._decode()
+            if self._skip() != ':':
+                raise ValueError(f'Expected ":" after key {key!r}')
+            self.pos += 1
+            self._skip()
+            value = self._decode()
+            self._skip(' \t\r\n,')
+            self._advance()
+            yield key, value
+
+
+def parse_user(key: str, value) -> tuple[tuple, list[tuple]] | None:
+    """Рядок users і рядки payments одного користувача або None, якщо запис битий."""
+    try:
+        user_id = int(key)
+        balance = Decimal(str(value.get('balance', 0) or 0))
+        game_id = str(value['game_id'])
+        payments = [
+            (user_id, Decimal(str(p['amount'])), int(p['invoice_id']))
+            for p in value.get('payments') or []
+            # Без invoice_id платіж не дедуплікувати — повтор міграції його б подвоїв
+            if p.get('invoice_id') is not None
+        ]
+    except (AttributeError, KeyError, TypeError, ValueError, InvalidOperation):
+        return None
+    if balance < 0:
+        return None
+    return (user_id, game_id, balance), payments
+
+
+def read_batch(records, batch_size: int) -> tuple[list, list, int]:
+    users, payments, skipped = [], [], 0
+    for key, value in records:
+        parsed = parse_user(key, value)
+        if parsed is None:
+            skipped += 1
+            continue
+        user, user_payments = parsed
+        users.append(user)
+        payments.extend(user_payments)
+        if len(users) >= batch_size:
+            break
+    return users, payments, skipped
+
+
+async def load_batch(source: str, offset: int, users: list[tuple], payments: list[tuple]) -> tuple[int, int]:
+    async with db.pool.acquire() as conn:
+        async with conn.transaction():
+            # Зсув і дані в одній транзакції, тож втрата останнього коміту при збої безпечна
+            await conn.execute("SET LOCAL synchronous_commit = off; SET LOCAL work_mem = '64MB'")
+            await conn.execute(STAGING_DDL)
+            await conn.copy_records_to_table('migrate_users', records=users)
+            await conn.copy_records_to_table('migrate_payments', records=payments)
+            inserted_users = await conn.fetchval(INSERT_USERS_SQL)
+            inserted_payments = await conn.fetchval(INSERT_PAYMENTS_SQL)
+            await conn.execute(SAVE_PROGRESS_SQL, source, offset, inserted_users, inserted_payments)
+    return inserted_users, inserted_payments
+
+
+async def migrate(path: str, batch_size: int = BATCH_SIZE, restart: bool = False) -> dict:
+    source = os.path.realpath(path)
+    size = os.path.getsize(path)
+    async with db.pool.acquire() as conn:
+        await conn.execute(PROGRESS_DDL)
+        row = await conn.fetchrow("SELECT * FROM json_migrations WHERE source=$1", source)
+        if row is not None and (restart or row['size'] != size):
+            if not restart:
+                logging.warning(f"{path} змінився з минулого запуску, починаємо спочатку")
+            await conn.execute("DELETE FROM json_migrations WHERE source=$1", source)
+            row = None
+        if row is None:
+            await conn.execute("INSERT INTO json_migrations(source, size) VALUES ($1, $2)", source, size)
+    if row is not None and row['finished_at'] is not None:
+        return {'done_before': True, 'users': row['users'], 'payments': row['payments']}
+
+    resumed_from = row['byte_offset'] if row is not None else 0
+    stats = {'done_before': False, 'users': 0, 'payments': 0, 'skipped': 0, 'resumed_from': resumed_from}
+    with open(path, 'rb') as f:
+        stream = JSONObjectStream(f, resume_offset=resumed_from)
+        records = iter(stream)
+        loading = None
+        try:
+            while True:
+                # Наступна пачка розбирається в потоці, поки база вантажить попередню
+                users, payments, skipped = await asyncio.to_thread(read_batch, records, batch_size)
+                offset = stream.offset
+                stats['skipped'] += skipped
+                if loading is not None:
+                    inserted_users, inserted_payments = await loading
+                    loading = None
+                    stats['users'] += inserted_users
+                    stats['payments'] += inserted_payments
+                    logging.info(f"Перенесено {stats['users']} користувачів, {stats['payments']} платежів")
+                if not users:
+                    break
+                loading = asyncio.create_task(load_batch(source, offset, users, payments))
+        finally:
+            if loading is not None:
+                # Помилка розбору: даємо вже відправленій пачці зафіксуватися
+                await asyncio.gather(loading, return_exceptions=True)
+
+    async with db.pool.acquire() as conn:
+        await conn.execute("UPDATE json_migrations SET finished_at=now() WHERE source=$1", source)
+    return stats
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', nargs='?', default='db.json')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='users per COPY batch')
+    parser.add_argument('--restart', action='store_true', help='ignore saved progress for this file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    await db.init_pool()
+    try:
+        started = time.perf_counter()
+        stats = await migrate(args.path, args.batch_size, args.restart)
+        elapsed = time.perf_counter() - started
+        if stats['done_before']:
+            print(f"already migrated: {stats['users']} users, {stats['payments']} payments (use --restart to rerun)")
+            return
+        print(
+            f"users inserted: {stats['users']}, payments inserted: {stats['payments']}, "
+            f"skipped records: {stats['skipped']}, resumed from byte {stats['resumed_from']}, "
+            f"{elapsed:.2f} s"
+        )
+    finally:
+        await db.close_pool()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,426 @@
+"""Версійні міграції схеми бази.
+
+Застосовані версії записуються в schema_version. Звичайний старт робить один
+запит max(version) через пул; лише коли схема відстає, відкривається окреме
+з'єднання з advisory lock, щоб кілька процесів при поступовому
+перезапуску не накочували міграції одночасно.
+
+Нова зміна схеми — нова функція в кінці MIGRATIONS; застосовані не змінюються.
+Міграції з transaction=False (CREATE INDEX CONCURRENTLY) виконуються поза
+транзакцією і мають бути ідемпотентними: збій між змінами і записом версії
+повторить їх при наступному старті.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+import asyncpg
+
+# Ключ pg_advisory_lock для накочування міграцій
+LOCK_KEY = 7_368_201_018
+LOCK_POLL_INTERVAL = 0.5
+
+VERSION_DDL = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    duration_ms INTEGER NOT NULL
+)
+"""
+
+RECORD_SQL = "INSERT INTO schema_version(version, name, duration_ms) VALUES ($1, $2, $3)"
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    apply: Callable[[asyncpg.Connection], Awaitable[None]]
+    transaction: bool = True
+
+
+async def _baseline(conn):
+    # Схема, яку раніше створював init_pool; IF NOT EXISTS — для вже наявних баз
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id BIGINT PRIMARY KEY,
+            game_id TEXT NOT NULL,
+            balance NUMERIC DEFAULT 0,
+            payments_count INTEGER NOT NULL DEFAULT 0,
+            payments_total NUMERIC NOT NULL DEFAULT 0
+        )
+        """
+    )
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS payments (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT REFERENCES users(user_id) ON DELETE CASCADE,
+            amount NUMERIC NOT NULL,
+            invoice_id BIGINT UNIQUE
+        )
+        """
+    )
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS payments_user_id_id_idx ON payments(user_id, id)"
+    )
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data JSONB NOT NULL DEFAULT '{}',
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+        """
+    )
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS fsm_states_updated_at_idx ON fsm_states(updated_at)"
+    )
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS items (
+            item_id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            price NUMERIC NOT NULL CHECK (price > 0),
+            stock INTEGER NOT NULL DEFAULT 0 CHECK (stock >= 0)
+        )
+        """
+    )
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS orders (
+            id BIGSERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+            item_id TEXT NOT NULL REFERENCES items(item_id),
+            price NUMERIC NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+        """
+    )
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS orders_user_id_id_idx ON orders(user_id, id)"
+    )
+    # Гарантія на рівні рядка: баланс не може стати від'ємним
+    await conn.execute(
+        """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM pg_constraint WHERE conname = 'users_balance_nonnegative'
+            ) THEN
+                ALTER TABLE users
+                    ADD CONSTRAINT users_balance_nonnegative CHECK (balance >= 0);
+            END IF;
+        END $$
+        """
+    )
+    await _add_payment_counters(conn)
+    # Користувачі, що заблокували бота: розсилки їх пропускають
+    await conn.execute(
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS is_blocked BOOLEAN NOT NULL DEFAULT false"
+    )
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id BIGSERIAL PRIMARY KEY,
+            text TEXT NOT NULL,
+            created_by BIGINT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            last_user_id BIGINT NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            blocked INTEGER NOT NULL DEFAULT 0,
+            heartbeat_at TIMESTAMPTZ,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            finished_at TIMESTAMPTZ
+        )
+        """
+    )
+
+
+async def _add_payment_counters(conn):
+    # Старі бази: додаємо лічильники поповнень і заповнюємо їх один раз
+    exists = await conn.fetchval(
+        """
+        SELECT EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'users' AND column_name = 'payments_count'
+        )
+        """
+    )
+    if exists:
+        return
+    await conn.execute(
+        """
+        ALTER TABLE users
+            ADD COLUMN payments_count INTEGER NOT NULL DEFAULT 0,
+            ADD COLUMN payments_total NUMERIC NOT NULL DEFAULT 0
+        """
+    )
+    await conn.execute(
+        """
+        UPDATE users u
+        SET payments_count = s.cnt, payments_total = s.total
+        FROM (
+            SELECT user_id, count(*) AS cnt, sum(amount) AS total
+            FROM payments GROUP BY user_id
+        ) s
+        WHERE u.user_id = s.user_id
+        """
+    )
+
+
+async def _payments_created_at(conn):
+    # Без значення за замовчуванням у ALTER ADD таблиця не переписується;
+    # старі платежі лишаються з NULL — їхній час невідомий
+    await conn.execute("ALTER TABLE payments ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ")
+    await conn.execute("ALTER TABLE payments ALTER COLUMN created_at SET DEFAULT now()")
+
+
+async def _payments_created_at_idx(conn):
+    await create_index_concurrently(conn, 'payments_created_at_idx', 'payments(created_at)')
+
+
+async def _listings(conn):
+    # Оголошення продавців. Таблиця нова, тож індекси будуються одразу в транзакції.
+    # Повнотекстовий пошук з конфігурацією simple: назви луту — суміш мов і
+    # позначень на кшталт "Mk14", стемінг тут лише шкодить
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS listings (
+            id BIGSERIAL PRIMARY KEY,
+            seller_id BIGINT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+            category TEXT NOT NULL,
+            title TEXT NOT NULL,
+            price NUMERIC NOT NULL CHECK (price > 0),
+            status TEXT NOT NULL DEFAULT 'active',
+            buyer_id BIGINT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            sold_at TIMESTAMPTZ,
+            search TSVECTOR GENERATED ALWAYS AS (to_tsvector('simple', title)) STORED
+        )
+        """
+    )
+    # Часткові індекси лише по активних: продані не заважають пошуку
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS listings_active_price_idx ON listings(price, id) WHERE status = 'active'"
+    )
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS listings_active_category_idx ON listings(category, price, id) WHERE status = 'active'"
+    )
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS listings_active_search_idx ON listings USING gin(search) WHERE status = 'active'"
+    )
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS listings_seller_id_idx ON listings(seller_id, id)"
+    )
+
+
+async def _support(conn):
+    # Черга звернень у підтримку: тікет на користувача і повідомлення, які
+    # воркери пересилають між користувачем та оператором
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS support_tickets (
+            id BIGSERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            operator_id BIGINT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            assigned_at TIMESTAMPTZ,
+            closed_at TIMESTAMPTZ
+        )
+        """
+    )
+    # Одне відкрите звернення на користувача
+    await conn.execute(
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS support_tickets_open_user_idx
+        ON support_tickets(user_id) WHERE status <> 'closed'
+        """
+    )
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS support_tickets_queued_idx ON support_tickets(id) WHERE status = 'queued'"
+    )
+    await conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS support_tickets_operator_idx
+        ON support_tickets(operator_id) WHERE status = 'assigned'
+        """
+    )
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS support_messages (
+            id BIGSERIAL PRIMARY KEY,
+            ticket_id BIGINT NOT NULL REFERENCES support_tickets(id) ON DELETE CASCADE,
+            sender TEXT NOT NULL,
+            text TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            relay_message_id BIGINT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            claimed_at TIMESTAMPTZ,
+            delivered_at TIMESTAMPTZ
+        )
+        """
+    )
+    await conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS support_messages_undelivered_idx
+        ON support_messages(ticket_id, id) WHERE status IN ('pending', 'sending')
+        """
+    )
+    await conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS support_messages_relay_idx
+        ON support_messages(relay_message_id) WHERE relay_message_id IS NOT NULL
+        """
+    )
+
+
+# Рядки зведень розбиті за user_id % STATS_SHARDS: паралельні платежі й
+# покупки різних користувачів не стають у чергу за одним рядком
+STATS_SHARDS = 16
+
+
+async def _analytics(conn):
+    # Дата реєстрації — для конверсії в перший платіж; у старих користувачів невідома
+    await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ")
+    await conn.execute("ALTER TABLE users ALTER COLUMN created_at SET DEFAULT now()")
+    # Денні зведення: оновлюються тими ж запитами, що пишуть users і payments.
+    # converted — користувачі, зареєстровані цього дня, що вже поповнили баланс
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            day DATE NOT NULL,
+            shard SMALLINT NOT NULL,
+            registrations INTEGER NOT NULL DEFAULT 0,
+            converted INTEGER NOT NULL DEFAULT 0,
+            topups INTEGER NOT NULL DEFAULT 0,
+            topup_total NUMERIC NOT NULL DEFAULT 0,
+            active_users INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, shard)
+        )
+        """
+    )
+    # Поточні підсумки для середнього балансу
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS stats_totals (
+            shard SMALLINT PRIMARY KEY,
+            users BIGINT NOT NULL DEFAULT 0,
+            balance NUMERIC NOT NULL DEFAULT 0
+        )
+        """
+    )
+    # Хто вже врахований в active_users за день; старші дні видаляються
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS user_activity (
+            day DATE NOT NULL,
+            user_id BIGINT NOT NULL,
+            PRIMARY KEY (day, user_id)
+        )
+        """
+    )
+    # Одноразове заповнення з наявних даних; далі лише інкрементально
+    await conn.execute(
+        f"""
+        INSERT INTO daily_stats(day, shard, topups, topup_total)
+        SELECT created_at::date, user_id % {STATS_SHARDS}, count(*), sum(amount)
+        FROM payments WHERE created_at IS NOT NULL
+        GROUP BY 1, 2
+        ON CONFLICT (day, shard) DO NOTHING
+        """
+    )
+    await conn.execute(
+        f"""
+        INSERT INTO stats_totals(shard, users, balance)
+        SELECT user_id % {STATS_SHARDS}, count(*), coalesce(sum(balance), 0)
+        FROM users GROUP BY 1
+        ON CONFLICT (shard) DO NOTHING
+        """
+    )
+
+
+MIGRATIONS = [
+    Migration(1, 'baseline', _baseline),
+    Migration(2, 'payments_created_at', _payments_created_at),
+    Migration(3, 'payments_created_at_idx', _payments_created_at_idx, transaction=False),
+    Migration(4, 'listings', _listings),
+    Migration(5, 'support', _support),
+    Migration(6, 'analytics', _analytics),
+]
+LATEST = MIGRATIONS[-1].version
+
+
+async def create_index_concurrently(conn, name: str, definition: str):
+    """CREATE INDEX CONCURRENTLY, що не блокує запис у таблицю.
+
+    Перерваний CONCURRENTLY лишає невалідний індекс — його перебудовуємо.
+    """
+    valid = await conn.fetchval(
+        """
+        SELECT i.indisvalid FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = $1 AND pg_table_is_visible(c.oid)
+        """,
+        name,
+    )
+    if valid:
+        return
+    if valid is not None:
+        await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    await conn.execute(f"CREATE INDEX CONCURRENTLY {name} ON {definition}")
+
+
+async def current_version(conn) -> int:
+    try:
+        return await conn.fetchval("SELECT coalesce(max(version), 0) FROM schema_version")
+    except asyncpg.UndefinedTableError:
+        return 0
+
+
+async def upgrade(pool: asyncpg.Pool, connect_params: dict, timeout: float | None = None) -> list[int]:
+    """Накочує незастосовані міграції; повертає їхні версії."""
+    async with pool.acquire() as conn:
+        if await current_version(conn) >= LATEST:
+            return []
+
+    # Окреме з'єднання: сесійний lock не має потрапити в пул, а довгі
+    # міграції не мають упиратися в command_timeout пулу
+    conn = await asyncpg.connect(**connect_params, command_timeout=timeout)
+    applied = []
+    try:
+        # Не блокуючий pg_advisory_lock, а опитування: процес, що чекає в
+        # запиті, тримає знімок, і CREATE INDEX CONCURRENTLY власника lock
+        # чекав би на нього — взаємне блокування
+        while not await conn.fetchval("SELECT pg_try_advisory_lock($1)", LOCK_KEY):
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+        # DDL під lock: паралельні CREATE TABLE IF NOT EXISTS конфліктують
+        await conn.execute(VERSION_DDL)
+        version = await current_version(conn)
+        for migration in MIGRATIONS:
+            if migration.version <= version:
+                continue
+            started = time.perf_counter()
+            if migration.transaction:
+                async with conn.transaction():
+                    await migration.apply(conn)
+                    duration_ms = int((time.perf_counter() - started) * 1000)
+                    await conn.execute(RECORD_SQL, migration.version, migration.name, duration_ms)
+            else:
+                await migration.apply(conn)
+                duration_ms = int((time.perf_counter() - started) * 1000)
+                await conn.execute(RECORD_SQL, migration.version, migration.name, duration_ms)
+            logging.info(f"Міграція {migration.version} ({migration.name}) за {duration_ms} мс")
+            applied.append(migration.version)
+    finally:
+        # Закриття з'єднання знімає і advisory lock
+        await conn.close()
+    return applied
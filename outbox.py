@@ -0,0 +1,232 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+from aiogram import methods
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+import metrics
+
+# Методи, що створюють чи змінюють повідомлення в чаті — саме на них діють ліміти Telegram.
+# Решта (getUpdates, answerCallbackQuery, setWebhook...) йде напряму.
+QUEUED_METHODS = (
+    methods.SendMessage,
+    methods.SendSticker,
+    methods.SendPhoto,
+    methods.SendDocument,
+    methods.SendAnimation,
+    methods.SendVideo,
+    methods.SendMediaGroup,
+    methods.CopyMessage,
+    methods.ForwardMessage,
+    methods.EditMessageText,
+    methods.EditMessageReplyMarkup,
+    methods.EditMessageCaption,
+    methods.EditMessageMedia,
+)
+# Редагування одного повідомлення, з яких має сенс надсилати лише останнє
+COALESCED_METHODS = (
+    methods.EditMessageText,
+    methods.EditMessageReplyMarkup,
+    methods.EditMessageCaption,
+    methods.EditMessageMedia,
+)
+
+QUEUE_DEPTH = metrics.Gauge('outbox_queue_depth', 'Telegram requests waiting in the send queue')
+SEND_SECONDS = metrics.Histogram('outbox_send_seconds', 'Time from enqueue to Telegram response', ('method',))
+COALESCED = metrics.Counter('outbox_coalesced_total', 'Edits replaced by a newer edit of the same message')
+RETRY_AFTER = metrics.Counter('outbox_retry_after_total', 'Flood-control (429) responses from Telegram')
+
+
+class TokenBucket:
+    """Відро токенів з резервуванням: reserve() повертає, скільки чекати до свого слоту.
+
+    Токени можуть іти в мінус — так запити стають у чергу за часом приходу без блокувань.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        self._refill()
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def take(self) -> bool:
+        """Бере токен, якщо він є, без черги; False — ліміт вичерпано."""
+        self._refill()
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def refill_time(self) -> float:
+        """Скільки секунд до повного відра."""
+        self._refill()
+        return (self.burst - self.tokens) / self.rate
+
+
+@dataclass
+class Job:
+    method: methods.TelegramMethod
+    make_request: object
+    bot: object
+    futures: list = field(default_factory=list)
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class ChatQueue:
+    def __init__(self, rate: float, burst: float):
+        self.jobs: deque[Job] = deque()
+        self.bucket = TokenBucket(rate, burst)
+        self.wakeup = asyncio.Event()
+        self.task: asyncio.Task | None = None
+
+
+class Outbox(BaseRequestMiddleware):
+    """Черга вихідних запитів до Telegram (middleware сесії бота).
+
+    Повідомлення кожного чату надсилаються по черзі з лімітом chat_rate,
+    усі разом — не швидше за global_rate. На 429 чат чекає retry_after і
+    повторює запит. Якщо в черзі вже є редагування того ж повідомлення,
+    воно замінюється новим, і обидва виклики отримують результат останнього.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30,
+        chat_rate: float = 1,
+        chat_burst: float = 5,
+        max_retries: int = 3,
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._chats: dict[int | str, ChatQueue] = {}
+        self._closing = False
+        QUEUE_DEPTH.set_function(self.depth)
+
+    def depth(self) -> int:
+        return sum(len(chat.jobs) for chat in self._chats.values())
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, 'chat_id', None)
+        if chat_id is None or not isinstance(method, QUEUED_METHODS):
+            return await make_request(bot, method)
+
+        future = asyncio.get_running_loop().create_future()
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = ChatQueue(self.chat_rate, self.chat_burst)
+        if not self._coalesce(chat, method, future):
+            chat.jobs.append(Job(method, make_request, bot, [future]))
+        chat.wakeup.set()
+        if chat.task is None:
+            chat.task = asyncio.create_task(self._worker(chat_id, chat))
+        return await future
+
+    def _coalesce(self, chat: ChatQueue, method, future) -> bool:
+        if not isinstance(method, COALESCED_METHODS):
+            return False
+        for job in chat.jobs:
+            if type(job.method) is type(method) and getattr(job.method, 'message_id', None) == method.message_id:
+                job.method = method
+                job.futures.append(future)
+                COALESCED.inc()
+                return True
+        return False
+
+    async def _worker(self, chat_id, chat: ChatQueue):
+        while True:
+            if not chat.jobs:
+                if self._closing:
+                    del self._chats[chat_id]
+                    return
+                # Чекаємо нових запитів, поки відро чату не наповниться, потім звільняємо пам'ять
+                chat.wakeup.clear()
+                try:
+                    await asyncio.wait_for(chat.wakeup.wait(), chat.bucket.refill_time())
+                except asyncio.TimeoutError:
+                    if not chat.jobs:
+                        del self._chats[chat_id]
+                        return
+                continue
+
+            delay = chat.bucket.reserve()
+            if delay:
+                # Поки чекаємо, перший запит ще в черзі і може бути замінений новішим редагуванням
+                await asyncio.sleep(delay)
+            job = chat.jobs.popleft()
+            try:
+                delay = self.global_bucket.reserve()
+                if delay:
+                    await asyncio.sleep(delay)
+                await self._send(job)
+            except asyncio.CancelledError:
+                self._cancel(job)
+                raise
+
+    async def _send(self, job: Job):
+        attempt = 0
+        while True:
+            try:
+                result = await job.make_request(job.bot, job.method)
+            except TelegramRetryAfter as e:
+                RETRY_AFTER.inc()
+                attempt += 1
+                if attempt > self.max_retries:
+                    self._resolve(job, exception=e)
+                    return
+                logging.warning(f"Telegram 429, повтор через {e.retry_after} с: {type(job.method).__name__}")
+                await asyncio.sleep(e.retry_after)
+            except Exception as e:
+                self._resolve(job, exception=e)
+                return
+            else:
+                self._resolve(job, result=result)
+                return
+
+    def _resolve(self, job: Job, result=None, exception: BaseException | None = None):
+        SEND_SECONDS.observe(time.perf_counter() - job.enqueued_at, type(job.method).__name__)
+        for future in job.futures:
+            if future.done():
+                # Викликач уже скасований
+                continue
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+
+    def _cancel(self, job: Job):
+        for future in job.futures:
+            future.cancel()
+
+    async def close(self, timeout: float = 10):
+        """Дає черзі дописатися до timeout секунд, решту скасовує."""
+        self._closing = True
+        tasks = []
+        for chat in self._chats.values():
+            chat.wakeup.set()
+            if chat.task is not None:
+                tasks.append(chat.task)
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for chat in self._chats.values():
+            for job in chat.jobs:
+                self._cancel(job)
+        self._chats.clear()
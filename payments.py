@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+
+import db
+
+# Скільки інвойсів CryptoPay віддає за один getInvoices
+INVOICES_PER_REQUEST = 1000
+
+
+@dataclass
+class PendingInvoice:
+    invoice_id: int
+    user_id: int
+    chat_id: int
+    amount: float
+    created_at: float
+    url: str = ''
+
+
+def make_payload(user_id: int, amount: float) -> str:
+    return f"{user_id}:{amount}"
+
+
+def parse_payload(payload: str | None):
+    """Повертає (user_id, amount) з payload інвойсу або None."""
+    try:
+        user_id, amount = payload.split(':')
+        return int(user_id), float(amount)
+    except (AttributeError, ValueError):
+        return None
+
+
+class InvoicePoller:
+    """Один фоновий цикл, що перевіряє всі незакриті інвойси пачками.
+
+    З poll=False інвойси не опитуються (оплати приходять через вебхук),
+    цикл лише прибирає прострочені.
+    """
+
+    def __init__(self, bot, crypto, interval: float = 3, timeout: float = 90, reply_markup=None, poll: bool = True, history_limit: int = 10):
+        self.bot = bot
+        self.crypto = crypto
+        self.interval = interval
+        self.timeout = timeout
+        self.reply_markup = reply_markup
+        self.poll = poll
+        self.history_limit = history_limit
+        self.pending: dict[int, PendingInvoice] = {}
+        # user_id -> інвойс: PaymentGuardMiddleware шукає його на кожне оновлення
+        self._by_user: dict[int, PendingInvoice] = {}
+        self._task: asyncio.Task | None = None
+
+    def add(self, invoice_id: int, user_id: int, chat_id: int, amount: float, url: str = ''):
+        self.pending[invoice_id] = self._by_user[user_id] = PendingInvoice(
+            invoice_id=invoice_id,
+            user_id=user_id,
+            chat_id=chat_id,
+            amount=amount,
+            created_at=time.monotonic(),
+            url=url,
+        )
+
+    def pending_for_user(self, user_id: int) -> PendingInvoice | None:
+        """Неоплачений інвойс користувача, якщо він ще чекає оплати."""
+        return self._by_user.get(user_id)
+
+    def discard(self, invoice_id: int):
+        """Прибирає інвойс з реєстру (зараховано чи прострочено)."""
+        pending = self.pending.pop(invoice_id, None)
+        if pending is not None and self._by_user.get(pending.user_id) is pending:
+            del self._by_user[pending.user_id]
+
+    def expires_in(self, pending: PendingInvoice) -> float:
+        return max(0.0, pending.created_at + self.timeout - time.monotonic())
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.tick()
+            except Exception as e:
+                logging.error(f"Помилка перевірки оплати: {e}")
+
+    async def tick(self):
+        if not self.pending:
+            return
+        if not self.poll:
+            await self._expire()
+            return
+        invoice_ids = list(self.pending)
+        for i in range(0, len(invoice_ids), INVOICES_PER_REQUEST):
+            chunk = invoice_ids[i:i + INVOICES_PER_REQUEST]
+            result = await self.crypto.get_invoices(invoice_ids=chunk, count=len(chunk))
+            for invoice in result or []:
+                if invoice.status != 'paid':
+                    continue
+                try:
+                    await self.confirm(invoice.invoice_id)
+                except Exception as e:
+                    logging.error(f"Помилка зарахування інвойсу {invoice.invoice_id}: {e}")
+        await self._expire()
+
+    async def confirm(self, invoice_id: int):
+        pending = self.pending.get(invoice_id)
+        if pending is None:
+            return
+        await self.credit(pending.user_id, pending.chat_id, pending.amount, invoice_id)
+
+    async def handle_paid(self, invoice):
+        """Зарахування оплаченого інвойсу, що прийшов через вебхук."""
+        parsed = parse_payload(invoice.payload)
+        if parsed is None:
+            logging.warning(f"Інвойс {invoice.invoice_id} без коректного payload")
+            return
+        user_id, amount = parsed
+        pending = self.pending.get(invoice.invoice_id)
+        chat_id = pending.chat_id if pending else user_id
+        await self.credit(user_id, chat_id, amount, invoice.invoice_id)
+
+    async def credit(self, user_id: int, chat_id: int, amount: float, invoice_id: int):
+        inserted = await db.add_payment(user_id, amount, invoice_id)
+        # Прибираємо з реєстру лише після успішного запису в базу
+        self.discard(invoice_id)
+        if not inserted:
+            # Інвойс уже зараховано раніше (повтор вебхука чи опитування)
+            return
+        user_data = await db.get_user_with_payments(user_id, limit=self.history_limit)
+        await self.bot.send_message(
+            chat_id,
+            f"✅ Оплата успішна!\nВаш новий баланс: {user_data['balance']}",
+            reply_markup=self.reply_markup,
+        )
+        payment_history = "\n".join([f"Поповнення: {p['amount']} USDT" for p in user_data['payments']])
+        await self.bot.send_message(
+            chat_id,
+            f"Історія поповнень:\n{payment_history}",
+            reply_markup=self.reply_markup,
+        )
+
+    async def _expire(self):
+        deadline = time.monotonic() - self.timeout
+        expired = [p for p in self.pending.values() if p.created_at < deadline]
+        for pending in expired:
+            self.discard(pending.invoice_id)
+            try:
+                await self.bot.send_message(
+                    pending.chat_id,
+                    "⏳ Час очікування вичерпано. Якщо ви вже оплатили — спробуйте пізніше /start",
+                )
+            except Exception as e:
+                logging.error(f"Помилка сповіщення про прострочений інвойс {pending.invoice_id}: {e}")
@@ -0,0 +1,203 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Mapping
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+
+import db
+
+# Один запит на всю пачку: оновлюємо існуючі рядки, решту вставляємо.
+# has_state=false означає "стан не змінювався", data IS NULL — "дані не змінювались".
+# Рядок, який інший процес вставив уже після початку запиту, потрапляє в
+# ON CONFLICT: там теж пишемо лише змінене цією пачкою, а не '{}' з INSERT.
+FLUSH_SQL = """
+WITH t AS (
+    SELECT * FROM unnest($1::text[], $2::text[], $3::bool[], $4::jsonb[])
+        AS t(key, state, has_state, data)
+),
+upd AS (
+    UPDATE fsm_states f
+    SET state = CASE WHEN t.has_state THEN t.state ELSE f.state END,
+        data = COALESCE(t.data, f.data),
+        updated_at = now()
+    FROM t
+    WHERE f.key = t.key
+    RETURNING f.key
+)
+INSERT INTO fsm_states(key, state, data)
+SELECT key, state, COALESCE(data, '{}'::jsonb) FROM t
+WHERE key NOT IN (SELECT key FROM upd)
+ON CONFLICT (key) DO UPDATE
+SET state = CASE WHEN (SELECT has_state FROM t WHERE t.key = EXCLUDED.key) THEN EXCLUDED.state ELSE fsm_states.state END,
+    data = COALESCE((SELECT data FROM t WHERE t.key = EXCLUDED.key), fsm_states.data),
+    updated_at = now()
+"""
+
+FETCH_SQL = "SELECT state, data FROM fsm_states WHERE key=$1"
+
+COUNT_STATES_SQL = "SELECT state, count(*) FROM fsm_states WHERE state IS NOT NULL GROUP BY state"
+
+SWEEP_SQL = """
+DELETE FROM fsm_states WHERE key IN (
+    SELECT key FROM fsm_states
+    WHERE updated_at < now() - make_interval(secs => $1)
+    LIMIT $2
+)
+"""
+
+SWEEP_BATCH = 10000
+
+
+class PostgresStorage(BaseStorage):
+    """FSM-сховище в таблиці fsm_states (стан і дані в одному рядку).
+
+    Записи буферизуються і скидаються в базу однією пачкою раз на
+    flush_interval секунд; читання бачать ще не скинуті записи цього процесу.
+    Інший процес побачить зміну не пізніше ніж через flush_interval.
+    """
+
+    def __init__(
+        self,
+        flush_interval: float = 0.05,
+        state_ttl: float = 7 * 24 * 3600,
+        sweep_interval: float = 3600,
+        counts_ttl: float = 60,
+    ):
+        self.flush_interval = flush_interval
+        self.state_ttl = state_ttl
+        self.sweep_interval = sweep_interval
+        self.counts_ttl = counts_ttl
+        self._counts: dict[str, int] = {}
+        self._counted_at: float | None = None
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        # key -> {'state': ..., 'data': ...}, лише змінені поля
+        self._pending: dict[str, dict] = {}
+        self._flushing: dict[str, dict] = {}
+        self._flush_lock = asyncio.Lock()
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._flush_loop()),
+                asyncio.create_task(self._sweep_loop()),
+            ]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        await self.flush()
+
+    def _key(self, key: StorageKey) -> str:
+        return self.key_builder.build(key)
+
+    def _buffered(self, key: str, field: str):
+        for buffer in (self._pending, self._flushing):
+            changes = buffer.get(key)
+            if changes is not None and field in changes:
+                return True, changes[field]
+        return False, None
+
+    async def _fetch(self, key: str):
+        async with db.pool.acquire() as conn:
+            return await conn.fetchrow(FETCH_SQL, key)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        self._pending.setdefault(self._key(key), {})['state'] = state
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        found, state = self._buffered(self._key(key), 'state')
+        if found:
+            return state
+        row = await self._fetch(self._key(key))
+        return row['state'] if row else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+        self._pending.setdefault(self._key(key), {})['data'] = data.copy()
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        found, data = self._buffered(self._key(key), 'data')
+        if found:
+            return data.copy()
+        row = await self._fetch(self._key(key))
+        return json.loads(row['data']) if row else {}
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            self._flushing, self._pending = self._pending, {}
+            keys, states, has_states, datas = [], [], [], []
+            for key, changes in self._flushing.items():
+                keys.append(key)
+                states.append(changes.get('state'))
+                has_states.append('state' in changes)
+                datas.append(json.dumps(changes['data']) if 'data' in changes else None)
+            try:
+                async with db.pool.acquire() as conn:
+                    await conn.execute(FLUSH_SQL, keys, states, has_states, datas)
+            except Exception:
+                # Повертаємо в буфер те, що не перезаписали новіші зміни
+                for key, changes in self._flushing.items():
+                    merged = dict(changes)
+                    merged.update(self._pending.get(key, {}))
+                    self._pending[key] = merged
+                raise
+            finally:
+                self._flushing = {}
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Помилка запису FSM-станів: {e}")
+
+    async def count_states(self) -> dict[str, int]:
+        """Кількість збережених станів за назвою (для метрик).
+
+        GROUP BY проходить усю таблицю, тож результат живе counts_ttl секунд
+        і частіші збори метрик отримують збережене значення.
+        """
+        now = time.monotonic()
+        if self._counted_at is None or now - self._counted_at >= self.counts_ttl:
+            async with db.pool.acquire() as conn:
+                rows = await conn.fetch(COUNT_STATES_SQL)
+            self._counts = {row['state']: row['count'] for row in rows}
+            self._counted_at = now
+        return dict(self._counts)
+
+    async def sweep(self) -> int:
+        """Видаляє стани, що не змінювались довше за state_ttl."""
+        deleted = 0
+        while True:
+            async with db.pool.acquire() as conn:
+                result = await conn.execute(SWEEP_SQL, float(self.state_ttl), SWEEP_BATCH)
+            count = int(result.split()[-1])
+            deleted += count
+            if count < SWEEP_BATCH:
+                return deleted
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                deleted = await self.sweep()
+                if deleted:
+                    logging.info(f"Видалено застарілих FSM-станів: {deleted}")
+            except Exception as e:
+                logging.error(f"Помилка очищення FSM-станів: {e}")
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import time
+from decimal import ROUND_UP, Decimal
+
+import metrics
+
+# Валюта балансу: курси перераховуються відносно неї
+BASE_ASSET = 'USDT'
+# Точність суми інвойсу; округлюємо вгору, щоб оплата покривала зарахування
+ASSET_PRECISION = Decimal('0.00000001')
+
+REFRESH_ERRORS = metrics.Counter('exchange_rates_refresh_errors_total', 'Failed exchange rate refreshes')
+STALE = metrics.Counter('exchange_rates_stale_total', 'Conversions refused because rates were stale')
+
+
+class StaleRatesError(Exception):
+    """Курсу немає або він старший за max_age — конвертувати не можна."""
+
+
+class RateCache:
+    """Курси CryptoPay у пам'яті, які оновлює фонова задача.
+
+    Хендлери читають лише цей словник і ніколи не чекають на API. Якщо
+    оновлення зупинилися довше ніж на max_age секунд, конвертація
+    відмовляє, а не бере застарілий курс.
+    """
+
+    def __init__(self, crypto, assets: list[str], interval: float = 60, max_age: float = 300):
+        self.crypto = crypto
+        self.assets = assets
+        self.interval = interval
+        self.max_age = max_age
+        # Скільки USDT коштує одиниця активу
+        self.rates: dict[str, Decimal] = {}
+        self.updated_at: float | None = None
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                REFRESH_ERRORS.inc()
+                logging.error(f"Помилка оновлення курсів: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def refresh(self):
+        usd = {}
+        for rate in await self.crypto.get_exchange_rates():
+            if rate.is_valid and rate.target == 'USD':
+                usd[rate.source] = Decimal(str(rate.rate))
+        base = usd.get(BASE_ASSET)
+        if not base:
+            raise ValueError(f'No {BASE_ASSET}/USD rate in response')
+        self.rates = {asset: usd[asset] / base for asset in self.assets if asset in usd}
+        self.updated_at = time.monotonic()
+
+    def age(self) -> float:
+        return time.monotonic() - self.updated_at if self.updated_at is not None else float('inf')
+
+    def rate(self, asset: str) -> Decimal:
+        if asset == BASE_ASSET:
+            return Decimal(1)
+        rate = self.rates.get(asset)
+        if rate is None or self.age() > self.max_age:
+            STALE.inc()
+            raise StaleRatesError(asset)
+        return rate
+
+    def to_asset(self, amount, asset: str) -> Decimal:
+        """Скільки активу треба оплатити, щоб отримати amount USDT."""
+        return (Decimal(str(amount)) / self.rate(asset)).quantize(ASSET_PRECISION, rounding=ROUND_UP)
+
+    def quotes(self, amount) -> dict[str, Decimal]:
+        """Суми до оплати в кожному активі зі свіжим курсом."""
+        quotes = {}
+        for asset in self.assets:
+            try:
+                quotes[asset] = self.to_asset(amount, asset)
+            except StaleRatesError:
+                continue
+        return quotes
@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+import db
+import metrics
+from payments import INVOICES_PER_REQUEST, parse_payload
+
+CREDITED = metrics.Counter('reconcile_credited_total', 'Paid invoices credited by reconciliation')
+SKIPPED = metrics.Counter('reconcile_skipped_total', 'Paid invoices reconciliation could not credit', ('reason',))
+RUN_SECONDS = metrics.Histogram('reconcile_run_seconds', 'Duration of one reconciliation pass')
+
+
+class Reconciler:
+    """Періодично звіряє оплачені інвойси CryptoPay з таблицею payments.
+
+    Ловить оплати, які не зарахував ні poller (час очікування вийшов,
+    процес перезапустився), ні вебхук. Сторінки getInvoices(status='paid')
+    читаються від новіших до старіших, поки не скінчиться lookback.
+    """
+
+    def __init__(
+        self,
+        bot,
+        crypto,
+        poller=None,
+        interval: float = 300,
+        lookback: float = 7 * 24 * 3600,
+        max_pages: int = 50,
+        page_concurrency: int = 4,
+        notify: bool = True,
+    ):
+        self.bot = bot
+        self.crypto = crypto
+        self.poller = poller
+        self.interval = interval
+        self.lookback = lookback
+        self.max_pages = max_pages
+        self.page_concurrency = page_concurrency
+        self.notify = notify
+        self._task: asyncio.Task | None = None
+        self._notify_tasks: set[asyncio.Task] = set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._notify_tasks):
+            task.cancel()
+
+    async def _run(self):
+        while True:
+            try:
+                credited = await self.run_once()
+                if credited:
+                    logging.info(f"Звірка оплат: зараховано {credited} пропущених інвойсів")
+            except Exception as e:
+                logging.error(f"Помилка звірки оплат: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _fetch_page(self, page: int) -> list:
+        result = await self.crypto.get_invoices(
+            status='paid',
+            offset=page * INVOICES_PER_REQUEST,
+            count=INVOICES_PER_REQUEST,
+        )
+        return result or []
+
+    async def run_once(self) -> int:
+        """Один прохід звірки; повертає кількість зарахованих інвойсів."""
+        started = time.perf_counter()
+        since = datetime.now(timezone.utc) - timedelta(seconds=self.lookback)
+        credited = 0
+        page = 0
+        while page < self.max_pages:
+            # Кілька сторінок паралельно; зсув від нових оплат дає лише повтори, не пропуски
+            pages = range(page, min(page + self.page_concurrency, self.max_pages))
+            results = await asyncio.gather(*(self._fetch_page(p) for p in pages))
+            done = False
+            for invoices in results:
+                recent = [i for i in invoices if i.paid_at is None or i.paid_at >= since]
+                credited += await self._credit_missing(recent)
+                if len(invoices) < INVOICES_PER_REQUEST or len(recent) < len(invoices):
+                    done = True
+                    break
+            if done:
+                break
+            page += len(pages)
+        RUN_SECONDS.observe(time.perf_counter() - started)
+        return credited
+
+    async def _credit_missing(self, invoices: list) -> int:
+        if not invoices:
+            return 0
+        by_id = {invoice.invoice_id: invoice for invoice in invoices}
+        missing = await db.find_missing_invoices(list(by_id))
+        rows = []
+        for invoice_id in missing:
+            parsed = parse_payload(by_id[invoice_id].payload)
+            if parsed is None:
+                # Інвойс створено не ботом або до появи payload
+                SKIPPED.inc('no_payload')
+                continue
+            user_id, amount = parsed
+            rows.append((user_id, amount, invoice_id))
+        if not rows:
+            return 0
+
+        credited = await db.add_payments(rows)
+        CREDITED.inc(amount=len(credited))
+        unknown = len(rows) - len(credited)
+        if unknown:
+            # Невідомий користувач або інвойс саме зарахував poller
+            SKIPPED.inc('not_credited', amount=unknown)
+        if self.poller is not None:
+            for row in credited:
+                self.poller.discard(row['invoice_id'])
+        if self.notify and credited:
+            task = asyncio.create_task(self._notify_users(credited))
+            self._notify_tasks.add(task)
+            task.add_done_callback(self._notify_tasks.discard)
+        return len(credited)
+
+    async def _notify_users(self, credited: list[dict]):
+        # Темп надсилання тримає черга повідомлень бота
+        results = await asyncio.gather(
+            *(
+                self.bot.send_message(
+                    row['user_id'],
+                    f"✅ Оплату за рахунком №{row['invoice_id']} зараховано: {row['amount']} USDT\n"
+                    f"Ваш баланс: {row['balance']}",
+                )
+                for row in credited
+            ),
+            return_exceptions=True,
+        )
+        for row, result in zip(credited, results):
+            if isinstance(result, Exception):
+                logging.warning(f"Не вдалося повідомити {row['user_id']} про зарахування: {result}")
@@ -0,0 +1,89 @@
+import gzip
+import json
+import logging
+import queue
+import threading
+import time
+
+from aiogram import BaseMiddleware
+
+import metrics
+
+RECORDED = metrics.Counter('updates_recorded_total', 'Incoming updates written for replay', ('result',))
+
+
+def open_recording(path: str, mode: str):
+    """Запис з суфіксом .gz стиснений; кожне відкриття на дозапис — новий gzip-член."""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def read_recording(path: str):
+    """Повертає (unix-час, апдейт) з файлу; обрізаний хвіст після падіння пропускає."""
+    with open_recording(path, 'r') as f:
+        try:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Недописаний останній рядок
+                    continue
+                yield entry['t'], entry['u']
+        except EOFError:
+            # gzip-член без кінцевого маркера: процес упав до закриття файлу
+            return
+
+
+class UpdateRecorder(BaseMiddleware):
+    """Зовнішній middleware на update: дописує кожен вхідний апдейт у файл для tools/replay.
+
+    Рядок на апдейт: {"t": unix-час, "u": апдейт без порожніх полів}.
+    Стоїть першим, тож у запис потрапляють і апдейти, які потім відкине
+    антиспам. На циклі подій апдейт лише кладеться в чергу; model_dump,
+    json і запис — у фоновому потоці, як і логи. Якщо потік не встигає,
+    апдейти не записуються, а обробка не чекає.
+    """
+
+    def __init__(self, path: str, queue_size: int = 100000, flush_interval: float = 1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(queue_size)
+        self._thread = threading.Thread(target=self._run, name='update-recorder', daemon=True)
+        self._thread.start()
+        self.closed = False
+
+    async def __call__(self, handler, event, data):
+        if not self.closed:
+            try:
+                # Сам апдейт, без серіалізації: model_dump робить потік-записувач
+                self._queue.put_nowait((time.time(), event))
+            except queue.Full:
+                RECORDED.inc('dropped')
+        return await handler(event, data)
+
+    def _run(self):
+        with open_recording(self.path, 'a') as f:
+            while True:
+                try:
+                    item = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    f.flush()
+                    continue
+                if item is None:
+                    break
+                try:
+                    update = item[1].model_dump(mode='json', exclude_none=True, by_alias=True)
+                    f.write(json.dumps({'t': round(item[0], 3), 'u': update}, ensure_ascii=False, separators=(',', ':')))
+                    f.write('\n')
+                    RECORDED.inc('written')
+                except Exception as e:
+                    logging.error(f"Не вдалося записати апдейт: {e}")
+
+    def close(self):
+        """Дописує чергу й закриває файл; повторний виклик нічого не робить."""
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.put(None)
+        self._thread.join()
@@ -0,0 +1,319 @@
+import asyncio
+import html
+import logging
+import time
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+import db
+import metrics
+
+QUEUE_WAIT = metrics.Histogram(
+    'support_queue_wait_seconds', 'Time from a new ticket to operator assignment',
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600),
+)
+HANDLING = metrics.Histogram(
+    'support_handling_seconds', 'Time from operator assignment to ticket close',
+    buckets=(30, 60, 120, 300, 600, 1800, 3600, 7200, 21600, 86400),
+)
+RELAY = metrics.Histogram('support_relay_seconds', 'Time from a support message to its delivery', ('sender',))
+RELAYED = metrics.Counter('support_messages_total', 'Relayed support messages by result', ('result',))
+
+# Повідомлення в наявне відкрите звернення або нове звернення; без рядка у
+# відповіді — паралельний запит саме створив звернення, варто повторити
+SUBMIT_SQL = """
+WITH existing AS (
+    SELECT id FROM support_tickets WHERE user_id = $1 AND status <> 'closed'
+),
+created AS (
+    INSERT INTO support_tickets(user_id)
+    SELECT $1 WHERE NOT EXISTS (SELECT 1 FROM existing)
+    ON CONFLICT (user_id) WHERE status <> 'closed' DO NOTHING
+    RETURNING id
+),
+ticket AS (
+    SELECT id FROM existing UNION ALL SELECT id FROM created
+)
+INSERT INTO support_messages(ticket_id, sender, text)
+SELECT id, 'user', $2 FROM ticket
+RETURNING ticket_id, EXISTS (SELECT 1 FROM created) AS created
+"""
+SUBMIT_ATTEMPTS = 5
+
+REPLY_SQL = """
+INSERT INTO support_messages(ticket_id, sender, text)
+SELECT id, 'operator', $3 FROM support_tickets
+WHERE id = $1 AND operator_id = $2 AND status = 'assigned'
+RETURNING ticket_id
+"""
+
+# Найменш завантажений оператор бере найстаріше звернення з черги. Кілька
+# воркерів можуть одночасно перевищити ліміт оператора на одне звернення.
+ASSIGN_SQL = """
+WITH operator AS (
+    SELECT o.id
+    FROM unnest($1::bigint[]) AS o(id)
+    LEFT JOIN support_tickets t ON t.operator_id = o.id AND t.status = 'assigned'
+    GROUP BY o.id
+    HAVING count(t.id) < $2
+    ORDER BY count(t.id), random()
+    LIMIT 1
+),
+ticket AS (
+    SELECT id FROM support_tickets
+    WHERE status = 'queued'
+    ORDER BY id
+    FOR UPDATE SKIP LOCKED
+    LIMIT 1
+),
+assigned AS (
+    UPDATE support_tickets t
+    SET status = 'assigned', operator_id = operator.id, assigned_at = now()
+    FROM operator, ticket
+    WHERE t.id = ticket.id
+    RETURNING t.id, t.created_at, t.assigned_at
+),
+notice AS (
+    INSERT INTO support_messages(ticket_id, sender, text)
+    SELECT id, 'system', $3 FROM assigned
+)
+SELECT id, extract(epoch FROM assigned_at - created_at) AS waited FROM assigned
+"""
+
+# Найстаріше недоставлене повідомлення звернення, якщо попереднє з того ж
+# звернення не в дорозі: так порядок зберігається при кількох воркерах
+CLAIM_SQL = """
+UPDATE support_messages m
+SET status = 'sending', attempts = m.attempts + 1, claimed_at = now()
+FROM support_tickets t
+WHERE m.id = (
+    SELECT m2.id FROM support_messages m2
+    JOIN support_tickets t2 ON t2.id = m2.ticket_id AND t2.status <> 'queued'
+    WHERE m2.status = 'pending'
+      AND (m2.claimed_at IS NULL OR m2.claimed_at < now() - make_interval(secs => $1))
+      AND m2.id = (
+          SELECT min(m3.id) FROM support_messages m3
+          WHERE m3.ticket_id = m2.ticket_id AND m3.status IN ('pending', 'sending')
+      )
+    ORDER BY m2.id
+    FOR UPDATE OF m2 SKIP LOCKED
+    LIMIT 1
+)
+AND t.id = m.ticket_id
+RETURNING m.id, m.ticket_id, m.sender, m.text, m.attempts,
+          extract(epoch FROM now() - m.created_at) AS age, t.user_id, t.operator_id
+"""
+
+DELIVERED_SQL = """
+UPDATE support_messages
+SET status = 'delivered', delivered_at = now(), relay_message_id = $2
+WHERE id = $1
+"""
+
+# Невдала спроба: повтор пізніше або 'failed', коли спроби вичерпано
+RETRY_SQL = """
+UPDATE support_messages
+SET status = CASE WHEN attempts >= $2 THEN 'failed' ELSE 'pending' END
+WHERE id = $1
+"""
+
+# Повідомлення, які взяв воркер процесу, що впав
+RECOVER_SQL = """
+UPDATE support_messages SET status = 'pending'
+WHERE status = 'sending' AND claimed_at < now() - make_interval(secs => $1)
+"""
+
+CLOSE_SQL = """
+WITH closed AS (
+    UPDATE support_tickets SET status = 'closed', closed_at = now()
+    WHERE status <> 'closed' AND {condition}
+    RETURNING id, user_id, operator_id, extract(epoch FROM closed_at - assigned_at) AS handled
+),
+dropped AS (
+    -- Відповіді оператора ще доставляються, а оператору нові повідомлення вже ні до чого
+    UPDATE support_messages SET status = 'dropped'
+    WHERE ticket_id IN (SELECT id FROM closed) AND status = 'pending' AND sender = 'user'
+)
+SELECT * FROM closed
+"""
+CLOSE_BY_USER_SQL = CLOSE_SQL.format(condition="user_id = $1")
+CLOSE_BY_OPERATOR_SQL = CLOSE_SQL.format(condition="id = $2 AND operator_id = $1")
+
+RELAY_TICKET_SQL = """
+SELECT m.ticket_id FROM support_messages m
+JOIN support_tickets t ON t.id = m.ticket_id
+WHERE m.relay_message_id = $2 AND t.operator_id = $1 AND t.status = 'assigned'
+LIMIT 1
+"""
+
+COUNT_SQL = "SELECT status, count(*) FROM support_tickets WHERE status <> 'closed' GROUP BY status"
+
+
+class SupportDesk:
+    """Черга звернень у підтримку в Postgres з фіксованим пулом воркерів.
+
+    Хендлери лише записують повідомлення (один INSERT) і будять воркерів,
+    тож сплеск звернень не займає ні хендлери магазину, ні більше ніж
+    workers з'єднань пулу. Воркери призначають звернення операторам і
+    пересилають повідомлення в обидва боки; кілька процесів бота ділять
+    чергу через FOR UPDATE SKIP LOCKED.
+    """
+
+    def __init__(
+        self,
+        bot,
+        operators: list[int],
+        workers: int = 4,
+        max_tickets: int = 5,
+        poll_interval: float = 2,
+        max_attempts: int = 3,
+        retry_delay: float = 5,
+    ):
+        self.bot = bot
+        self.operators = list(operators)
+        self.workers = workers
+        self.max_tickets = max_tickets
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, user_id: int, text: str) -> tuple[int, bool]:
+        """Повідомлення користувача в чергу; повертає (№ звернення, чи воно нове)."""
+        async with db.pool.acquire() as conn:
+            # Порожньо, лише якщо паралельний запит щойно створив або закрив
+            # звернення; наступна спроба вже його бачить
+            for _ in range(SUBMIT_ATTEMPTS):
+                row = await conn.fetchrow(SUBMIT_SQL, user_id, text)
+                if row is not None:
+                    break
+            else:
+                raise RuntimeError(f"Support ticket for user {user_id} kept changing, message not saved")
+        self._wakeup.set()
+        return row['ticket_id'], row['created']
+
+    async def reply(self, operator_id: int, ticket_id: int, text: str) -> bool:
+        async with db.pool.acquire() as conn:
+            ok = await conn.fetchval(REPLY_SQL, ticket_id, operator_id, text)
+        self._wakeup.set()
+        return ok is not None
+
+    async def ticket_for_relay(self, operator_id: int, message_id: int) -> int | None:
+        """Звернення, повідомлення якого оператор отримав з цим message_id."""
+        async with db.pool.acquire() as conn:
+            return await conn.fetchval(RELAY_TICKET_SQL, operator_id, message_id)
+
+    async def close_by_user(self, user_id: int):
+        async with db.pool.acquire() as conn:
+            row = await conn.fetchrow(CLOSE_BY_USER_SQL, user_id)
+        return self._closed(row)
+
+    async def close_by_operator(self, operator_id: int, ticket_id: int):
+        async with db.pool.acquire() as conn:
+            row = await conn.fetchrow(CLOSE_BY_OPERATOR_SQL, operator_id, ticket_id)
+        return self._closed(row)
+
+    def _closed(self, row):
+        if row is None:
+            return None
+        if row['handled'] is not None:
+            HANDLING.observe(float(row['handled']))
+        return dict(row)
+
+    async def counts(self) -> dict:
+        if db.pool is None:
+            return {}
+        async with db.pool.acquire() as conn:
+            rows = await conn.fetch(COUNT_SQL)
+        return {row['status']: row['count'] for row in rows}
+
+    async def _worker(self):
+        while True:
+            # Скидаємо до роботи: сигнал, що прийде під час кроку, не загубиться
+            self._wakeup.clear()
+            try:
+                busy = await self._step()
+            except Exception as e:
+                logging.error(f"Помилка воркера підтримки: {e}")
+                busy = False
+            if busy:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                # Тиша — заодно повертаємо повідомлення, застряглі в 'sending'
+                try:
+                    async with db.pool.acquire() as conn:
+                        await conn.execute(RECOVER_SQL, float(self.retry_delay * 12))
+                except Exception as e:
+                    logging.error(f"Помилка воркера підтримки: {e}")
+
+    async def _step(self) -> bool:
+        assigned = await self._assign() if self.operators else False
+        delivered = await self._deliver()
+        return assigned or delivered
+
+    async def _assign(self) -> bool:
+        async with db.pool.acquire() as conn:
+            row = await conn.fetchrow(
+                ASSIGN_SQL,
+                self.operators,
+                self.max_tickets,
+                '👤 Оператор підключився до вашого звернення',
+            )
+        if row is None:
+            return False
+        QUEUE_WAIT.observe(float(row['waited']))
+        return True
+
+    async def _deliver(self) -> bool:
+        async with db.pool.acquire() as conn:
+            message = await conn.fetchrow(CLAIM_SQL, float(self.retry_delay))
+        if message is None:
+            return False
+        # Бот шле з parse_mode HTML: "<" чи "&" у тексті людини інакше дає BadRequest
+        # і повідомлення губиться як недоставне. Системні тексти — наші, їх не чіпаємо
+        if message['sender'] == 'user':
+            chat_id = message['operator_id']
+            text = (
+                f"🆘 Звернення №{message['ticket_id']} від {message['user_id']}:\n{html.escape(message['text'])}\n\n"
+                f"Відповідайте реплаєм на це повідомлення. Закрити: /close {message['ticket_id']}"
+            )
+        elif message['sender'] == 'operator':
+            chat_id = message['user_id']
+            text = f"💬 Підтримка:\n{html.escape(message['text'])}"
+        else:
+            chat_id = message['user_id']
+            text = message['text']
+        started = time.perf_counter()
+        try:
+            sent = await self.bot.send_message(chat_id, text)
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Отримувач недоступний — повтори не допоможуть
+            logging.warning(f"Підтримка: не вдалося доставити повідомлення {message['id']}: {e}")
+            async with db.pool.acquire() as conn:
+                await conn.execute(RETRY_SQL, message['id'], 0)
+            RELAYED.inc('failed')
+            return True
+        except Exception as e:
+            logging.warning(f"Підтримка: повтор повідомлення {message['id']}: {e}")
+            async with db.pool.acquire() as conn:
+                await conn.execute(RETRY_SQL, message['id'], self.max_attempts)
+            RELAYED.inc('retry')
+            return True
+        async with db.pool.acquire() as conn:
+            await conn.execute(DELIVERED_SQL, message['id'], sent.message_id)
+        RELAYED.inc('delivered')
+        RELAY.observe(float(message['age']) + time.perf_counter() - started, message['sender'])
+        return True
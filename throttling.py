@@ -0,0 +1,100 @@
+import time
+
+from aiogram import BaseMiddleware, types
+from aiogram.dispatcher.flags import get_flag
+
+import metrics
+from cache import TTLCache
+from outbox import TokenBucket
+
+THROTTLED = metrics.Counter('bot_throttled_total', 'Updates dropped before reaching a handler', ('reason',))
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Зовнішній middleware: ліміт апдейтів на користувача й захист від повторних натискань.
+
+    Стоїть до фільтрів і хендлерів, тож відкинутий апдейт не чіпає ні FSM,
+    ні базу. Повідомлення понад ліміт мовчки ігноруються, на callback
+    відповідаємо, щоб на кнопці в клієнта зник індикатор завантаження.
+    """
+
+    def __init__(self, rate: float = 2, burst: float = 8, debounce: float = 0.7, maxsize: int = 100000):
+        self.rate = rate
+        self.burst = burst
+        self.debounce = debounce
+        # Відро, що простояло burst / rate секунд, знову повне — його можна просто забути
+        self.buckets = TTLCache(maxsize, burst / rate if rate else 0)
+        self.presses = TTLCache(maxsize, debounce)
+
+    def _allowed(self, user_id: int) -> bool:
+        if not self.rate:
+            return True
+        bucket = self.buckets.get(user_id)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst)
+        allowed = bucket.take()
+        self.buckets.set(user_id, bucket)
+        return allowed
+
+    def _repeated(self, callback: types.CallbackQuery) -> bool:
+        if not self.debounce:
+            return False
+        message_id = callback.message.message_id if callback.message else callback.inline_message_id
+        key = (callback.from_user.id, message_id, callback.data)
+        if self.presses.get(key) is not None:
+            return True
+        self.presses.set(key, time.monotonic())
+        return False
+
+    async def __call__(self, handler, event, data):
+        user = data.get('event_from_user')
+        if user is None:
+            return await handler(event, data)
+        if isinstance(event, types.CallbackQuery):
+            if self._repeated(event):
+                THROTTLED.inc('debounce')
+                await event.answer()
+                return None
+            if not self._allowed(user.id):
+                THROTTLED.inc('rate_limit')
+                await event.answer('⏳ Забагато запитів, зачекайте кілька секунд')
+                return None
+        elif not self._allowed(user.id):
+            THROTTLED.inc('rate_limit')
+            return None
+        return await handler(event, data)
+
+
+class PaymentGuardMiddleware(BaseMiddleware):
+    """Внутрішній middleware: не більше одного створення інвойсу на користувача.
+
+    Діє на хендлери з прапорцем payment. Поки інвойс створюється, повторні
+    суми відкидаються; поки попередній інвойс чекає оплати, користувач
+    отримує посилання на нього замість нового.
+    """
+
+    def __init__(self, poller):
+        self.poller = poller
+        self.in_flight: set[int] = set()
+
+    async def __call__(self, handler, event, data):
+        if not get_flag(data, 'payment'):
+            return await handler(event, data)
+        user_id = event.from_user.id
+        if user_id in self.in_flight:
+            THROTTLED.inc('payment_in_flight')
+            await event.answer('⏳ Рахунок уже створюється, зачекайте')
+            return None
+        pending = self.poller.pending_for_user(user_id)
+        if pending is not None:
+            THROTTLED.inc('payment_pending')
+            await event.answer(
+                f"У вас уже є неоплачений рахунок на {pending.amount} USDT: {pending.url}\n"
+                f"Новий можна створити після його оплати або через {self.poller.expires_in(pending):.0f} с"
+            )
+            return None
+        self.in_flight.add(user_id)
+        try:
+            return await handler(event, data)
+        finally:
+            self.in_flight.discard(user_id)
@@ -0,0 +1,141 @@
+"""Бенчмарк розсилки на фейковому Telegram.
+
+Створює користувачів (частина з них "заблокувала" бота), запускає
+розсилку, перериває її на півдорозі, відновлює новим Broadcaster і
+перевіряє, що кожен отримав повідомлення, дублікатів не більше пачки,
+а заблоковані позначені й пропускаються наступною розсилкою.
+
+    python -m tools.bench_broadcast --users 200000 --blocked 0.05
+"""
+import argparse
+import asyncio
+import random
+import resource
+import time
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiohttp import web
+
+import db
+from broadcast import Broadcaster
+from tools.cleanup import delete_users
+from tools.fake_telegram import FakeTelegram
+
+USER_BASE = 9_400_000_000_000
+ADMIN_ID = USER_BASE - 1
+
+
+async def cleanup(users: int):
+    async with db.pool.acquire() as conn:
+        await conn.execute("DELETE FROM broadcasts WHERE created_by=$1", ADMIN_ID)
+    await delete_users(USER_BASE, USER_BASE + users)
+
+
+async def run_broadcast(broadcaster: Broadcaster, broadcast_id: int):
+    broadcaster.start(broadcast_id)
+    task = broadcaster._tasks.get(broadcast_id)
+    if task is not None:
+        await task
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200000)
+    parser.add_argument('--blocked', type=float, default=0.05, help='share of users who blocked the bot')
+    parser.add_argument('--rate', type=float, default=1e9, help='broadcast messages per second')
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--interrupt-after', type=float, default=3, help='seconds before simulated restart')
+    parser.add_argument('--port', type=int, default=8093)
+    args = parser.parse_args()
+
+    fake = FakeTelegram()
+    runner = web.AppRunner(fake.app())
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', args.port).start()
+    session = AiohttpSession(api=TelegramAPIServer.from_base(f'http://127.0.0.1:{args.port}'), limit=args.concurrency)
+    bot = Bot(token='1:fake', session=session)
+
+    await db.init_pool()
+    try:
+        await cleanup(args.users)
+        async with db.pool.acquire() as conn:
+            await conn.copy_records_to_table(
+                'users',
+                records=((USER_BASE + i, 'bench') for i in range(args.users)),
+                columns=('user_id', 'game_id'),
+            )
+        def is_bench_user(chat_id: int) -> bool:
+            # Розсилка йде всім користувачам бази, рахуємо лише створених тут
+            return USER_BASE <= chat_id < USER_BASE + args.users
+
+        fake.blocked = {USER_BASE + i for i in range(args.users) if random.random() < args.blocked}
+
+        def make_broadcaster():
+            return Broadcaster(bot, rate=args.rate, concurrency=args.concurrency, batch_size=args.batch_size)
+
+        broadcaster = make_broadcaster()
+        async with db.pool.acquire() as conn:
+            broadcast_id = await conn.fetchval(
+                "INSERT INTO broadcasts(text, created_by) VALUES ('bench', $1) RETURNING id", ADMIN_ID
+            )
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(run_broadcast(broadcaster, broadcast_id), args.interrupt_after)
+        except asyncio.TimeoutError:
+            await broadcaster.stop()
+        interrupted_at = sum(len(v) for k, v in fake.sent.items() if is_bench_user(k))
+        async with db.pool.acquire() as conn:
+            checkpoint = await conn.fetchval("SELECT last_user_id FROM broadcasts WHERE id=$1", broadcast_id)
+        # "Перезапуск": новий екземпляр підхоплює незавершену розсилку
+        await run_broadcast(make_broadcaster(), broadcast_id)
+        elapsed = time.perf_counter() - started
+
+        recipients = [c for c in fake.sent if is_bench_user(c)]
+        deliveries = sum(len(fake.sent[c]) for c in recipients)
+        duplicates = deliveries - len(recipients)
+        async with db.pool.acquire() as conn:
+            row = await conn.fetchrow("SELECT * FROM broadcasts WHERE id=$1", broadcast_id)
+            marked = await conn.fetchval(
+                "SELECT count(*) FROM users WHERE user_id >= $1 AND user_id < $2 AND is_blocked",
+                USER_BASE,
+                USER_BASE + args.users,
+            )
+        expected = args.users - len(fake.blocked)
+        print(f"users: {args.users}, blocked the bot: {len(fake.blocked)}")
+        print(f"interrupted after {interrupted_at} deliveries, resumed after user #{max(checkpoint - USER_BASE + 1, 0)}")
+        print(f"delivered {deliveries} in {elapsed:.2f} s ({deliveries / elapsed:.0f} msg/s), duplicates: {duplicates}")
+        print(f"peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+        fake.sent.clear()
+        second = make_broadcaster()
+        async with db.pool.acquire() as conn:
+            second_id = await conn.fetchval(
+                "INSERT INTO broadcasts(text, created_by) VALUES ('bench 2', $1) RETURNING id", ADMIN_ID
+            )
+        await run_broadcast(second, second_id)
+        second_attempts = sum(len(v) for k, v in fake.sent.items() if is_bench_user(k))
+
+        checks = {
+            'every active user reached': len(recipients) == expected,
+            'duplicates within one batch': duplicates <= args.batch_size,
+            'broadcast marked done': row['status'] == 'done',
+            'blocked users marked': marked == len(fake.blocked),
+            'admin notified': bool(fake.sent.get(ADMIN_ID)),
+            'next broadcast skips blocked': second_attempts == expected,
+        }
+        for name, ok in checks.items():
+            print(f"{'OK  ' if ok else 'FAIL'} {name}")
+        await cleanup(args.users)
+        if not all(checks.values()):
+            raise SystemExit(1)
+    finally:
+        await db.close_pool()
+        await bot.session.close()
+        await runner.cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+"""Порівняння затримки FSM-сховищ: MemoryStorage проти PostgresStorage.
+
+Кожне "оновлення" повторює типовий хендлер: get_state (FSM middleware),
+get_data, update_data і set_state. Потрібна локальна база з config.py.
+
+    python -m tools.bench_fsm_storage --users 1000 --updates 20000 --concurrency 100
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+import db
+from pg_storage import PostgresStorage
+
+BOT_ID = 1
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def run(storage, users: int, updates: int, concurrency: int):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_update(i: int):
+        user_id = i % users + 1
+        key = StorageKey(bot_id=BOT_ID, chat_id=user_id, user_id=user_id)
+        context = FSMContext(storage=storage, key=key)
+        async with semaphore:
+            started = time.perf_counter()
+            await context.get_state()
+            data = await context.get_data()
+            await context.update_data(cabinet_message_id=data.get('cabinet_message_id', 0) + 1)
+            await context.set_state('Shop:balance')
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_update(i) for i in range(updates)))
+    elapsed = time.perf_counter() - started
+    return {
+        'updates_per_s': updates / elapsed,
+        'mean_ms': statistics.mean(latencies) * 1000,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def report(name, result):
+    print(
+        f"{name:<10} {result['updates_per_s']:>10.0f} upd/s  "
+        f"mean {result['mean_ms']:.3f} ms  p50 {result['p50_ms']:.3f}  "
+        f"p95 {result['p95_ms']:.3f}  p99 {result['p99_ms']:.3f}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--updates', type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--flush-interval', type=float, default=0.05)
+    args = parser.parse_args()
+
+    memory = await run(MemoryStorage(), args.users, args.updates, args.concurrency)
+    report('memory', memory)
+
+    await db.init_pool()
+    storage = PostgresStorage(flush_interval=args.flush_interval)
+    storage.start()
+    try:
+        postgres = await run(storage, args.users, args.updates, args.concurrency)
+    finally:
+        await storage.close()
+        async with db.pool.acquire() as conn:
+            await conn.execute("DELETE FROM fsm_states WHERE key LIKE $1", f'fsm:{BOT_ID}:%')
+        await db.close_pool()
+    report('postgres', postgres)
+    print(f"overhead per update: {postgres['mean_ms'] - memory['mean_ms']:.3f} ms (mean)")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
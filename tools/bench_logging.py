@@ -0,0 +1,109 @@
+"""Бенчмарк вартості логування на циклі подій.
+
+Імітує CryptoPay, що падає: concurrency задач пишуть logging.exception
+з traceback. Порівнює звичайний StreamHandler (старий basicConfig) з
+logs.setup_logging (черга, потік-записувач, ліміт повторів). Логи йдуть у
+файл --output; --sink-delay додає затримку кожному запису, як повільний диск
+чи збирач логів. Міряє час одного виклику й затримку тікера циклу подій.
+
+    python -m tools.bench_logging --records 20000 --sink-delay 0.0005
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+
+import logs
+
+
+class SlowFile:
+    """Файл, кожен запис у який триває delay секунд."""
+
+    def __init__(self, path: str, delay: float):
+        self.file = open(path, 'w', encoding='utf-8')
+        self.delay = delay
+
+    def write(self, text: str):
+        if self.delay:
+            time.sleep(self.delay)
+        return self.file.write(text)
+
+    def flush(self):
+        self.file.flush()
+
+
+def quantiles(samples: list[float]) -> str:
+    ordered = sorted(samples)
+    q = lambda p: ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1e6
+    return f"p50 {q(0.5):8.1f} us, p99 {q(0.99):9.1f} us, max {ordered[-1] * 1e6:9.1f} us"
+
+
+async def failing_call():
+    raise ConnectionError('CryptoPay is unavailable')
+
+
+async def run(records: int, concurrency: int) -> tuple[list[float], list[float]]:
+    calls, lag = [], []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lag.append(time.perf_counter() - started - 0.001)
+
+    async def worker(n: int):
+        for i in range(n):
+            logs.user_id_var.set(i)
+            try:
+                await failing_call()
+            except Exception as e:
+                started = time.perf_counter()
+                logging.exception(f"Помилка перевірки інвойсу {i}: {e}")
+                calls.append(time.perf_counter() - started)
+            await asyncio.sleep(0)
+
+    ticker_task = asyncio.create_task(ticker())
+    await asyncio.gather(*(worker(records // concurrency) for _ in range(concurrency)))
+    done.set()
+    await ticker_task
+    return calls, lag
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--sink-delay', type=float, default=0.0005, help='seconds per written record')
+    parser.add_argument('--burst', type=int, default=10, help='errors per code line per minute, 0 disables')
+    parser.add_argument('--output', default='bench_logging.log')
+    args = parser.parse_args()
+
+    sink = SlowFile(args.output, args.sink_delay)
+    stderr = sys.stderr
+
+    logging.basicConfig(level=logging.INFO, stream=sink, force=True)
+    started = time.perf_counter()
+    calls, lag = asyncio.run(run(args.records, args.concurrency))
+    print(f"StreamHandler   {time.perf_counter() - started:6.2f} s")
+    print(f"  logging call: {quantiles(calls)}")
+    print(f"  loop lag:     {quantiles(lag)}")
+
+    sys.stderr = sink
+    try:
+        listener = logs.setup_logging(queue_size=10000, burst=args.burst)
+        started = time.perf_counter()
+        calls, lag = asyncio.run(run(args.records, args.concurrency))
+        elapsed = time.perf_counter() - started
+        logs.stop_listener(listener)
+    finally:
+        sys.stderr = stderr
+    dropped = {reason: int(count) for (reason,), count in logs.DROPPED.values.items()}
+    print(f"setup_logging   {elapsed:6.2f} s, dropped {dropped}")
+    print(f"  logging call: {quantiles(calls)}")
+    print(f"  loop lag:     {quantiles(lag)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""Бенчмарк пошуку й пагінації ринку гравців.
+
+Створює продавців і оголошення, порівнює час першої та глибокої сторінки
+з пагінацією за ключем і з OFFSET, перевіряє, що прохід усіма сторінками
+вперед і назад дає кожне оголошення рівно раз, а одне оголошення при
+паралельних покупках продається лише одному покупцю, а зустрічні
+покупки двох гравців не впираються в deadlock, а "<" і "&" у назві
+не ламають HTML-розмітку повідомлень.
+
+    python -m tools.bench_market --listings 50000
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from decimal import Decimal
+
+import db
+import market
+from tools.cleanup import delete_users
+from tools.fake_telegram import parse_html
+
+USER_BASE = 9_500_000_000_000
+WORDS = ['Mk14', 'JS9', 'M416', 'AKM', 'Кобра', 'шолом', 'броня', 'золотий', 'приціл', 'глушник', 'рюкзак', 'аптечка']
+
+
+async def cleanup(users: int):
+    async with db.pool.acquire() as conn:
+        await conn.execute(
+            "DELETE FROM listings WHERE seller_id >= $1 AND seller_id < $2",
+            USER_BASE,
+            USER_BASE + users,
+        )
+    await delete_users(USER_BASE, USER_BASE + users)
+
+
+async def timed(fn, repeat: int = 20) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+async def walk(page_size: int, backward: bool = False, **filters) -> list[int]:
+    """Проходить усі сторінки так, як це робить бот кнопками ◀️/▶️."""
+    seen = []
+    rows = await db.search_listings(**filters, limit=page_size)
+    if backward:
+        # Дійти до кінця, потім іти назад
+        while len(rows) > page_size:
+            last = rows[page_size - 1]
+            rows = await db.search_listings(**filters, cursor=(last['price'], last['id']), limit=page_size)
+        seen = [row['id'] for row in rows]
+        cursor = (rows[0]['price'], rows[0]['id'])
+        while True:
+            rows = await db.search_listings(**filters, cursor=cursor, direction='before', limit=page_size)
+            more = len(rows) > page_size
+            rows = rows[-page_size:]
+            seen = [row['id'] for row in rows] + seen
+            if not more:
+                break
+            cursor = (rows[0]['price'], rows[0]['id'])
+        return seen
+    while True:
+        page = rows[:page_size]
+        seen.extend(row['id'] for row in page)
+        if len(rows) <= page_size:
+            return seen
+        rows = await db.search_listings(**filters, cursor=(page[-1]['price'], page[-1]['id']), limit=page_size)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sellers', type=int, default=1000)
+    parser.add_argument('--listings', type=int, default=50000)
+    parser.add_argument('--page-size', type=int, default=8)
+    parser.add_argument('--buyers', type=int, default=50, help='concurrent buyers of one listing')
+    args = parser.parse_args()
+
+    await db.init_pool()
+    users = args.sellers + args.buyers
+    try:
+        await cleanup(users)
+        async with db.pool.acquire() as conn:
+            await conn.copy_records_to_table(
+                'users',
+                records=[(USER_BASE + i, 'bench', Decimal(100)) for i in range(users)],
+                columns=('user_id', 'game_id', 'balance'),
+            )
+            categories = list(market.CATEGORIES)
+            started = time.perf_counter()
+            await conn.copy_records_to_table(
+                'listings',
+                records=[
+                    (
+                        USER_BASE + random.randrange(args.sellers),
+                        random.choice(categories),
+                        ' '.join(random.sample(WORDS, 2)),
+                        Decimal(random.randrange(1, 50000)) / 100,
+                    )
+                    for _ in range(args.listings)
+                ],
+                columns=('seller_id', 'category', 'title', 'price'),
+            )
+            await conn.execute("ANALYZE listings")
+            print(f"inserted {args.listings} listings in {time.perf_counter() - started:.2f} s")
+
+        query, _ = market.parse_search('mk14')
+        cases = {
+            'all': {},
+            'category': {'category': 'weapons'},
+            'search': {'query': query},
+            'search + category + price': {'query': query, 'category': 'weapons', 'max_price': Decimal(250)},
+        }
+        print(f"{'filter':28} {'page 1 ms':>10} {'deep keyset ms':>15} {'deep offset ms':>15} {'rows':>7}")
+        ok = True
+        for name, filters in cases.items():
+            ids = await walk(args.page_size, **filters)
+            back = await walk(args.page_size, backward=True, **filters)
+            ok &= len(ids) == len(set(ids)) and ids == back
+            async with db.pool.acquire() as conn:
+                expected = await conn.fetchval(
+                    "SELECT count(*) FROM listings WHERE status='active' AND seller_id >= $1 AND seller_id < $2"
+                    + (" AND category = $3" if 'category' in filters else " AND $3::text IS NULL")
+                    + (" AND search @@ to_tsquery('simple', $4)" if 'query' in filters else " AND $4::text IS NULL")
+                    + (" AND price <= $5" if 'max_price' in filters else " AND $5::numeric IS NULL"),
+                    USER_BASE,
+                    USER_BASE + args.sellers,
+                    filters.get('category'),
+                    filters.get('query'),
+                    filters.get('max_price'),
+                )
+            # Локальна база може мати й справжні оголошення — вони теж у проході
+            ok &= len(ids) >= expected
+            depth = (len(ids) // args.page_size) * args.page_size - args.page_size
+            deep = ids[max(depth, 0) - 1] if depth > 0 else None
+            listing = await db.get_listing(deep) if deep else None
+            cursor = (listing['price'], listing['id']) if listing else None
+
+            first = await timed(lambda: db.search_listings(**filters, limit=args.page_size))
+            keyset = await timed(lambda: db.search_listings(**filters, cursor=cursor, limit=args.page_size))
+
+            conditions = ["status = 'active'"]
+            params = []
+            for column, value in filters.items():
+                params.append(value)
+                if column == 'query':
+                    conditions.append(f"search @@ to_tsquery('simple', ${len(params)})")
+                elif column == 'max_price':
+                    conditions.append(f"price <= ${len(params)}")
+                else:
+                    conditions.append(f"{column} = ${len(params)}")
+            offset_sql = (
+                f"SELECT id FROM listings WHERE {' AND '.join(conditions)} "
+                f"ORDER BY price, id OFFSET {max(depth, 0)} LIMIT {args.page_size + 1}"
+            )
+
+            async def offset_page():
+                async with db.pool.acquire() as conn:
+                    await conn.fetch(offset_sql, *params)
+
+            offset = await timed(offset_page)
+            print(f"{name:28} {first:10.2f} {keyset:15.2f} {offset:15.2f} {len(ids):7}")
+
+        async with db.pool.acquire() as conn:
+            plan = await conn.fetch(
+                "EXPLAIN SELECT id FROM listings WHERE status = 'active' AND category = 'weapons' "
+                "AND (price, id) > (100, 1) ORDER BY price, id LIMIT 9"
+            )
+        print('plan: ' + plan[0][0].strip() + ' / ' + plan[1][0].strip())
+
+        # Паралельні покупки одного оголошення
+        listing_id = await db.create_listing(USER_BASE, 'other', 'bench race', Decimal(10))
+        results = await asyncio.gather(*(
+            db.buy_listing(USER_BASE + args.sellers + i, listing_id) for i in range(args.buyers)
+        ))
+        sold = [r for r in results if r['status'] == 'ok']
+
+        # Зустрічні покупки: пари покупців одночасно купують оголошення одне одного
+        cross = []
+        for i in range(0, args.buyers - 1, 2):
+            a, b = USER_BASE + args.sellers + i, USER_BASE + args.sellers + i + 1
+            for _ in range(5):
+                cross.append((a, await db.create_listing(b, 'other', 'bench cross', Decimal(1))))
+                cross.append((b, await db.create_listing(a, 'other', 'bench cross', Decimal(1))))
+        crossed = await asyncio.gather(*(db.buy_listing(buyer, lid) for buyer, lid in cross), return_exceptions=True)
+        failed = [r for r in crossed if isinstance(r, Exception) or r['status'] != 'ok']
+        if failed:
+            print(f"cross buys failed: {len(failed)} of {len(cross)}, e.g. {failed[0]!r}")
+
+        # Назва з розміткою: теги прибирає parse_title, решту екранує listing_text
+        title = market.parse_title('<b>Mk14</b>  a & b <i')
+        markup_id = await db.create_listing(USER_BASE, 'other', title, Decimal(1))
+        shown = parse_html(market.listing_text(await db.get_listing(markup_id)))
+        async with db.pool.acquire() as conn:
+            total = await conn.fetchval(
+                "SELECT sum(balance) FROM users WHERE user_id >= $1 AND user_id < $2",
+                USER_BASE,
+                USER_BASE + users,
+            )
+        checks = {
+            'pages cover every listing once, forward and back': ok,
+            'one listing sold once': len(sold) == 1,
+            'cross buys without deadlocks': not failed,
+            'markup in titles shown as text': title == 'Mk14 a & b <i' and bool(shown) and shown.startswith(title + '\n'),
+            'balances conserved': total == Decimal(100) * users,
+        }
+        for name, passed in checks.items():
+            print(f"{'OK  ' if passed else 'FAIL'} {name}")
+        await cleanup(users)
+        if not all(checks.values()):
+            raise SystemExit(1)
+    finally:
+        await db.close_pool()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,121 @@
+"""Бенчмарк і перевірка перенесення db.json разом зі зведеннями /stats.
+
+Генерує db.json з users користувачами (по payments платежів у кожного),
+переносить його migrate_json.migrate і перевіряє, що перенесені лише
+додались до підсумків користувачів і балансів, а денні зведення не змінились
+ні після перенесення, ні після перерахунку db.rebuild_daily_stats: дата
+старих платежів невідома, і в /stats вони не мають з'явитися як поповнення
+сьогодні. Повторний запуск з --restart нічого не дублює.
+
+    python -m tools.bench_migrate --users 20000 --payments 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+import db
+import migrate_json
+from tools.cleanup import delete_users
+
+USER_BASE = 9_200_000_000_000
+INVOICE_BASE = 9_200_000_000_000
+
+
+async def daily_today() -> tuple:
+    async with db.pool.acquire() as conn:
+        return tuple(await conn.fetchrow(
+            """
+            SELECT coalesce(sum(registrations), 0), coalesce(sum(converted), 0),
+                   coalesce(sum(topups), 0), coalesce(sum(topup_total), 0)
+            FROM daily_stats WHERE day >= current_date - 1
+            """
+        ))
+
+
+async def totals() -> tuple:
+    async with db.pool.acquire() as conn:
+        return tuple(await conn.fetchrow(
+            "SELECT coalesce(sum(users), 0), coalesce(sum(balance), 0) FROM stats_totals"
+        ))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--payments', type=int, default=3, help='payments per user')
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.json')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(
+            {
+                str(USER_BASE + i): {
+                    'game_id': str(random.randrange(10**9)),
+                    'balance': random.randrange(0, 10000) / 100,
+                    'payments': [
+                        {'amount': random.randrange(1, 1000) / 100, 'invoice_id': INVOICE_BASE + i * args.payments + k}
+                        for k in range(args.payments)
+                    ],
+                }
+                for i in range(args.users)
+            },
+            f,
+        )
+
+    await db.init_pool()
+    try:
+        await delete_users(USER_BASE, USER_BASE + args.users)
+        daily_before, totals_before = await daily_today(), await totals()
+
+        started = time.perf_counter()
+        stats = await migrate_json.migrate(path, restart=True)
+        elapsed = time.perf_counter() - started
+        print(f"migrated {stats['users']} users, {stats['payments']} payments in {elapsed:.2f} s")
+
+        daily_after_import, totals_after = await daily_today(), await totals()
+        await db.rebuild_daily_stats()
+        daily_after_rebuild = await daily_today()
+        rerun = await migrate_json.migrate(path, restart=True)
+
+        async with db.pool.acquire() as conn:
+            balance, dated = await conn.fetchrow(
+                """
+                SELECT (SELECT sum(balance) FROM users WHERE user_id >= $1 AND user_id < $2),
+                       (SELECT count(*) FROM payments WHERE user_id >= $1 AND user_id < $2 AND created_at IS NOT NULL)
+                """,
+                USER_BASE,
+                USER_BASE + args.users,
+            )
+        checks = {
+            'every user and payment imported': (stats['users'], stats['payments']) == (args.users, args.users * args.payments),
+            'users and balance added to totals': (
+                totals_after[0] - totals_before[0] == args.users and totals_after[1] - totals_before[1] == balance
+            ),
+            'imported payments have no date': dated == 0,
+            'daily stats unchanged by import': daily_after_import == daily_before,
+            'daily stats unchanged by rebuild': daily_after_rebuild == daily_before,
+            'rerun inserts nothing': (rerun['users'], rerun['payments']) == (0, 0),
+        }
+        for name, ok in checks.items():
+            print(f"{'OK  ' if ok else 'FAIL'} {name}")
+
+        async with db.pool.acquire() as conn:
+            await conn.execute("DELETE FROM json_migrations WHERE source = $1", os.path.realpath(path))
+            # Окремим запитом: каскад з users видаляв би платежі по одному користувачу
+            await conn.execute(
+                "DELETE FROM payments WHERE user_id >= $1 AND user_id < $2", USER_BASE, USER_BASE + args.users
+            )
+        await delete_users(USER_BASE, USER_BASE + args.users)
+        if not all(checks.values()):
+            raise SystemExit(1)
+    finally:
+        os.remove(path)
+        await db.close_pool()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
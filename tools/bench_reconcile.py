@@ -0,0 +1,113 @@
+"""Бенчмарк звірки оплат на фейковому CryptoPay.
+
+Створює користувачів і оплачені інвойси, частину з яких уже зараховано,
+запускає один прохід Reconciler і перевіряє, що пропущені інвойси
+зараховані рівно один раз, а повторний прохід нічого не змінює.
+
+    python -m tools.bench_reconcile --users 2000 --invoices 20000 --missed 0.5
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from aiocryptopay import AioCryptoPay
+from aiohttp import web
+
+import db
+from payments import make_payload
+from reconcile import Reconciler
+from tools.cleanup import delete_users
+from tools.fake_cryptopay import FakeCryptoPay
+
+USER_BASE = 9_300_000_000_000
+INVOICE_BASE = 9_300_000_000_000
+
+
+async def cleanup(users: int):
+    await delete_users(USER_BASE, USER_BASE + users)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--invoices', type=int, default=20000, help='paid invoices at the fake CryptoPay')
+    parser.add_argument('--missed', type=float, default=0.5, help='share of paid invoices not yet credited')
+    parser.add_argument('--port', type=int, default=8092)
+    args = parser.parse_args()
+
+    fake = FakeCryptoPay(pay_delay=None, first_invoice_id=INVOICE_BASE)
+    runner = web.AppRunner(fake.app())
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', args.port).start()
+    crypto = AioCryptoPay(token='fake', network=f'http://127.0.0.1:{args.port}')
+
+    await db.init_pool()
+    try:
+        await cleanup(args.users)
+        async with db.pool.acquire() as conn:
+            await conn.executemany(
+                "INSERT INTO users(user_id, game_id) VALUES ($1, 'bench')",
+                [(USER_BASE + i,) for i in range(args.users)],
+            )
+
+        credited_before = []
+        expected = {}
+        for _ in range(args.invoices):
+            user_id = USER_BASE + random.randrange(args.users)
+            amount = random.choice((1.0, 2.5, 5.0, 10.0))
+            invoice = fake.create(amount, payload=make_payload(user_id, amount))
+            fake.pay(invoice['invoice_id'])
+            expected[user_id] = expected.get(user_id, 0) + amount
+            if random.random() >= args.missed:
+                credited_before.append((user_id, amount, invoice['invoice_id']))
+        # Уже зараховані poller'ом чи вебхуком
+        for i in range(0, len(credited_before), 5000):
+            await db.add_payments(credited_before[i:i + 5000])
+        missed = args.invoices - len(credited_before)
+
+        reconciler = Reconciler(None, crypto, max_pages=args.invoices // 1000 + 2, notify=False)
+        started = time.perf_counter()
+        credited = await reconciler.run_once()
+        elapsed = time.perf_counter() - started
+        print(f"paid invoices: {args.invoices}, missed: {missed}")
+        print(f"credited {credited} in {elapsed:.2f} s ({credited / elapsed:.0f} invoices/s), "
+              f"{fake.calls['getInvoices']} getInvoices calls")
+
+        started = time.perf_counter()
+        again = await reconciler.run_once()
+        print(f"second pass credited {again} in {time.perf_counter() - started:.2f} s")
+
+        async with db.pool.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT user_id, balance, payments_count FROM users WHERE user_id >= $1 AND user_id < $2",
+                USER_BASE,
+                USER_BASE + args.users,
+            )
+            payments = await conn.fetchval(
+                "SELECT count(*) FROM payments WHERE user_id >= $1 AND user_id < $2",
+                USER_BASE,
+                USER_BASE + args.users,
+            )
+        checks = {
+            'all missed invoices credited': credited == missed,
+            'second pass is a no-op': again == 0,
+            'one payment per invoice': payments == args.invoices,
+            'balances match paid totals': all(
+                abs(float(r['balance']) - expected.get(r['user_id'], 0)) < 1e-6 for r in rows
+            ),
+            'payment counters match': sum(r['payments_count'] for r in rows) == args.invoices,
+        }
+        for name, ok in checks.items():
+            print(f"{'OK  ' if ok else 'FAIL'} {name}")
+        await cleanup(args.users)
+        if not all(checks.values()):
+            raise SystemExit(1)
+    finally:
+        await crypto.close()
+        await db.close_pool()
+        await runner.cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,196 @@
+"""Бенчмарк і перевірка зведень /stats.
+
+Додає history платежів в обхід зведень (лише щоб таблиці були великими),
+потім паралельно реєструє users користувачів і проводить через db.*
+платежі (з повторами інвойсів), пакетні зарахування, покупки й
+активність. Перевіряє, що прирости в daily_stats і stats_totals
+збігаються з порахованими по сирих таблицях, і порівнює час db.get_stats
+з тими ж агрегатами по payments і users. Наприкінці прибирає своїх
+користувачів разом з їхнім внеском у зведення.
+
+    python -m tools.bench_stats --history 1000000 --users 2000
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import db
+from tools.cleanup import delete_users
+
+USER_BASE = 9_900_000_000_000
+ITEM_ID = 'bench_stats'
+
+# Те, що /stats показує, але по сирих таблицях
+RAW_SQL = [
+    """
+    SELECT created_at::date AS day, count(*), sum(amount) FROM payments
+    WHERE created_at > current_date - 7 GROUP BY 1
+    """,
+    """
+    SELECT count(*) FILTER (WHERE payments_count > 0), count(*) FROM users
+    WHERE created_at > current_date - 7
+    """,
+    "SELECT count(*), avg(balance) FROM users",
+]
+
+
+async def timed(fn, repeat: int = 10) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+async def cleanup(users: int, history: int):
+    async with db.pool.acquire() as conn:
+        await conn.execute(
+            "DELETE FROM orders WHERE user_id >= $1 AND user_id < $2",
+            USER_BASE,
+            USER_BASE + users + history,
+        )
+        await conn.execute("DELETE FROM items WHERE item_id = $1", ITEM_ID)
+        # Окремим запитом: каскад з users видаляв би платежі по одному користувачу
+        await conn.execute(
+            "DELETE FROM payments WHERE user_id >= $1 AND user_id < $2",
+            USER_BASE,
+            USER_BASE + users + history,
+        )
+    await delete_users(USER_BASE, USER_BASE + users + history)
+
+
+async def snapshot() -> dict:
+    async with db.pool.acquire() as conn:
+        today = await conn.fetchrow(
+            """
+            SELECT coalesce(sum(registrations), 0) AS registrations, coalesce(sum(converted), 0) AS converted,
+                   coalesce(sum(topups), 0) AS topups, coalesce(sum(topup_total), 0) AS topup_total,
+                   coalesce(sum(active_users), 0) AS active_users
+            FROM daily_stats WHERE day = current_date
+            """
+        )
+        totals = await conn.fetchrow(
+            "SELECT coalesce(sum(users), 0) AS users, coalesce(sum(balance), 0) AS balance FROM stats_totals"
+        )
+    return {**dict(today), **dict(totals)}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--history', type=int, default=1000000, help='payments added around the rollups')
+    parser.add_argument('--users', type=int, default=2000, help='users going through db.*')
+    args = parser.parse_args()
+
+    await db.init_pool()
+    history_users = max(args.history // 20, 1)
+    try:
+        await cleanup(args.users, history_users)
+        async with db.pool.acquire() as conn:
+            started = time.perf_counter()
+            now = datetime.now(timezone.utc)
+            await conn.copy_records_to_table(
+                'users',
+                records=[
+                    (USER_BASE + args.users + i, 'bench', Decimal(random.randrange(0, 10000)) / 100, now - timedelta(days=random.randrange(365)))
+                    for i in range(history_users)
+                ],
+                columns=('user_id', 'game_id', 'balance', 'created_at'),
+            )
+            first_invoice = await conn.fetchval("SELECT coalesce(max(invoice_id), 0) + 1 FROM payments")
+            # Частинами: один COPY на мільйон рядків упирається в command_timeout пулу
+            for chunk in range(0, args.history, 100000):
+                await conn.copy_records_to_table(
+                    'payments',
+                    records=[
+                        (
+                            USER_BASE + args.users + random.randrange(history_users),
+                            Decimal(random.randrange(100, 10000)) / 100,
+                            first_invoice + i,
+                            now - timedelta(seconds=random.randrange(365 * 86400)),
+                        )
+                        for i in range(chunk, min(chunk + 100000, args.history))
+                    ],
+                    columns=('user_id', 'amount', 'invoice_id', 'created_at'),
+                )
+            await conn.execute("ANALYZE users; ANALYZE payments")
+            await conn.execute("INSERT INTO items(item_id, title, price, stock) VALUES ($1, 'bench', 1, 1000000)", ITEM_ID)
+            print(f"history: {args.history} payments of {history_users} users in {time.perf_counter() - started:.1f} s")
+
+        before = await snapshot()
+        invoice = first_invoice + args.history
+        payers = args.users // 2
+
+        async def user_flow(i: int):
+            user_id = USER_BASE + i
+            await db.create_user(user_id, 'bench')
+            await db.create_user(user_id, 'bench')
+            if i < payers:
+                # Повтор того самого інвойсу (вебхук + опитування) не рахується двічі
+                await db.add_payment(user_id, 5, invoice + i)
+                await db.add_payment(user_id, 5, invoice + i)
+                await db.purchase(user_id, ITEM_ID)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user_flow(i) for i in range(args.users)))
+        batch = [(USER_BASE + i, 2, invoice + args.users + i) for i in range(payers - 10, args.users)]
+        await asyncio.gather(db.add_payments(batch), db.add_payments(batch))
+        await asyncio.gather(*(
+            db.record_activity([USER_BASE + i for i in range(k, args.users, 4)] * 2) for k in range(4)
+        ))
+        print(f"{args.users} users through db.* in {time.perf_counter() - started:.2f} s")
+
+        after = await snapshot()
+        async with db.pool.acquire() as conn:
+            raw = await conn.fetchrow(
+                """
+                SELECT count(p.id) AS topups, coalesce(sum(p.amount), 0) AS topup_total,
+                       count(DISTINCT p.user_id) AS converted
+                FROM payments p
+                WHERE p.user_id >= $1 AND p.user_id < $2
+                """,
+                USER_BASE,
+                USER_BASE + args.users,
+            )
+            balance = await conn.fetchval(
+                "SELECT sum(balance) FROM users WHERE user_id >= $1 AND user_id < $2",
+                USER_BASE,
+                USER_BASE + args.users,
+            )
+        delta = {key: after[key] - before[key] for key in after}
+        checks = {
+            'registrations': delta['registrations'] == args.users,
+            'users total': delta['users'] == args.users,
+            'top-ups count': delta['topups'] == raw['topups'],
+            'top-ups volume': delta['topup_total'] == raw['topup_total'],
+            'converted': delta['converted'] == raw['converted'],
+            'balance total': delta['balance'] == balance,
+            'active users': delta['active_users'] == args.users,
+        }
+
+        stats_ms = await timed(lambda: db.get_stats(7))
+
+        async def raw_stats():
+            async with db.pool.acquire() as conn:
+                for sql in RAW_SQL:
+                    await conn.fetch(sql)
+
+        raw_ms = await timed(raw_stats, repeat=3)
+        print(f"db.get_stats: {stats_ms:.2f} ms, same aggregates over raw tables: {raw_ms:.1f} ms")
+        print(f"deltas: {delta}")
+        for name, ok in checks.items():
+            print(f"{'OK  ' if ok else 'FAIL'} {name}")
+
+        await cleanup(args.users, history_users)
+        if not all(checks.values()):
+            raise SystemExit(1)
+    finally:
+        await db.close_pool()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,196 @@
+"""Бенчмарк черги підтримки на фейковому Telegram.
+
+Сплеск звернень: users користувачів одночасно пишуть по messages
+повідомлень. Паралельно міряється запит магазину (get_user), щоб побачити,
+чи черга не гальмує хендлери. Фейкові оператори відповідають на кожне
+звернення, щойно отримали всі його повідомлення, і закривають його.
+Перевіряє, що кожне повідомлення доставлено рівно раз і в порядку
+надсилання, а відповіді операторів дійшли до користувачів. Тексти містять
+"<" і "&": бот шле з parse_mode HTML, як main.py, і вони мають дійти як є.
+
+    python -m tools.bench_support --users 500 --messages 3 --operators 5
+"""
+import argparse
+import asyncio
+import re
+import time
+
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.enums import ParseMode
+from aiohttp import web
+
+import db
+from support import SupportDesk
+from tools.cleanup import delete_users
+from tools.fake_telegram import FakeTelegram
+
+USER_BASE = 9_700_000_000_000
+OPERATOR_BASE = USER_BASE - 1000
+_RELAYED = re.compile(r'Звернення №(\d+) від (\d+):\nmsg (\d+) (.*)\n')
+# Текст, що ламає HTML-розмітку, якщо його не екранувати
+MARKUP = 'ціна < 5 & <b>знижка'
+
+
+async def cleanup(users: int):
+    async with db.pool.acquire() as conn:
+        await conn.execute(
+            "DELETE FROM support_tickets WHERE user_id >= $1 AND user_id < $2",
+            USER_BASE,
+            USER_BASE + users,
+        )
+    await delete_users(USER_BASE, USER_BASE + users)
+
+
+def quantiles(samples: list[float]) -> str:
+    ordered = sorted(samples)
+    q = lambda p: ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+    return f"p50 {q(0.5):.1f} ms, p99 {q(0.99):.1f} ms"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--messages', type=int, default=3, help='messages per user')
+    parser.add_argument('--operators', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--max-tickets', type=int, default=5)
+    parser.add_argument('--port', type=int, default=8096)
+    args = parser.parse_args()
+
+    fake = FakeTelegram()
+    runner = web.AppRunner(fake.app())
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', args.port).start()
+    bot = Bot(
+        token='1:fake',
+        session=AiohttpSession(api=TelegramAPIServer.from_base(f'http://127.0.0.1:{args.port}')),
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+    )
+    operators = [OPERATOR_BASE + i for i in range(args.operators)]
+
+    await db.init_pool()
+    desk = SupportDesk(bot, operators, workers=args.workers, max_tickets=args.max_tickets, poll_interval=0.2)
+    try:
+        await cleanup(args.users)
+        async with db.pool.acquire() as conn:
+            await conn.executemany(
+                "INSERT INTO users(user_id, game_id) VALUES ($1, 'bench')",
+                [(USER_BASE + i,) for i in range(args.users)],
+            )
+
+        # Запит магазину до сплеску — база для порівняння
+        baseline = []
+        for i in range(200):
+            started = time.perf_counter()
+            await db.get_user(USER_BASE + i % args.users)
+            baseline.append(time.perf_counter() - started)
+
+        desk.start()
+        total = args.users * args.messages
+        submit_latency, shop_latency = [], []
+        handled: set[int] = set()
+        peak_per_operator = 0
+        done = asyncio.Event()
+
+        async def user(i: int):
+            for k in range(args.messages):
+                started = time.perf_counter()
+                await desk.submit(USER_BASE + i, f'msg {k} {MARKUP}')
+                submit_latency.append(time.perf_counter() - started)
+
+        async def shop():
+            i = 0
+            while not done.is_set():
+                started = time.perf_counter()
+                db.user_cache.clear()
+                await db.get_user(USER_BASE + i % args.users)
+                shop_latency.append(time.perf_counter() - started)
+                i += 1
+                await asyncio.sleep(0.005)
+
+        async def operator_loop():
+            nonlocal peak_per_operator
+            while len(handled) < args.users:
+                for operator_id in operators:
+                    relayed = {}
+                    for text in fake.sent.get(operator_id, []):
+                        match = _RELAYED.search(text or '')
+                        if match:
+                            relayed.setdefault(int(match[1]), []).append(int(match[3]))
+                    open_tickets = [t for t in relayed if t not in handled]
+                    peak_per_operator = max(peak_per_operator, len(open_tickets))
+                    for ticket_id in open_tickets:
+                        if len(relayed[ticket_id]) == args.messages:
+                            await desk.reply(operator_id, ticket_id, f'Вирішено, {MARKUP}')
+                            await desk.close_by_operator(operator_id, ticket_id)
+                            handled.add(ticket_id)
+                await asyncio.sleep(0.05)
+
+        started = time.perf_counter()
+        shop_task = asyncio.create_task(shop())
+        await asyncio.gather(*(user(i) for i in range(args.users)))
+        burst = time.perf_counter() - started
+        await asyncio.wait_for(operator_loop(), timeout=120)
+        # Відповіді операторів доставляються вже після закриття
+        for _ in range(200):
+            replies = sum(
+                1 for i in range(args.users)
+                if any(t and t.startswith('💬 Підтримка') for t in fake.sent.get(USER_BASE + i, []))
+            )
+            if replies == args.users:
+                break
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - started
+        done.set()
+        await shop_task
+
+        print(f"{total} messages from {args.users} users submitted in {burst:.2f} s ({total / burst:.0f} msg/s)")
+        print(f"all tickets handled in {elapsed:.2f} s by {args.operators} operators, {args.workers} workers")
+        print(f"submit latency: {quantiles(submit_latency)}")
+        print(f"shop query latency: before {quantiles(baseline)}, during burst {quantiles(shop_latency)}")
+
+        per_ticket = {}
+        markup_kept = True
+        for operator_id in operators:
+            for text in fake.sent.get(operator_id, []):
+                match = _RELAYED.search(text or '')
+                if match:
+                    per_ticket.setdefault(int(match[1]), []).append(int(match[3]))
+                    markup_kept &= match[4] == MARKUP
+        markup_kept &= all(
+            f'💬 Підтримка:\nВирішено, {MARKUP}' in fake.sent.get(USER_BASE + i, []) for i in range(args.users)
+        )
+        async with db.pool.acquire() as conn:
+            stuck = await conn.fetchval(
+                """
+                SELECT count(*) FROM support_messages m JOIN support_tickets t ON t.id = m.ticket_id
+                WHERE t.user_id >= $1 AND t.user_id < $2 AND m.status NOT IN ('delivered')
+                """,
+                USER_BASE,
+                USER_BASE + args.users,
+            )
+        checks = {
+            'every message relayed once': sum(len(v) for v in per_ticket.values()) == total,
+            'order kept within a ticket': all(v == list(range(args.messages)) for v in per_ticket.values()),
+            'every user got the reply': replies == args.users,
+            'nothing left undelivered': stuck == 0,
+            '"<" and "&" relayed as text': markup_kept,
+            'operator load near the cap': peak_per_operator <= args.max_tickets + args.workers,
+        }
+        for name, ok in checks.items():
+            print(f"{'OK  ' if ok else 'FAIL'} {name}")
+        await cleanup(args.users)
+        if not all(checks.values()):
+            raise SystemExit(1)
+    finally:
+        await desk.stop()
+        await db.close_pool()
+        await bot.session.close()
+        await runner.cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
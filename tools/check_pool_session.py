@@ -0,0 +1,123 @@
+"""Перевірка інваріанту ShopConnection: пул-з'єднання без сесійного стану.
+
+ShopConnection не скидає сесію при поверненні в пул (RESET ALL, UNLISTEN *,
+pg_advisory_unlock_all()), тож усе сесійне має жити на окремих з'єднаннях.
+Скрипт накочує міграції на порожню тимчасову базу (потрібне право CREATE
+DATABASE) і стежить у pg_locks, яке з'єднання тримає lock міграцій, а потім
+проганяє кілька db.* на робочій базі з увімкненим LISTEN і перевіряє, що
+жодне з'єднання пулу не тримає advisory lock, LISTEN, SET чи тимчасових
+таблиць.
+
+    python -m tools.check_pool_session
+"""
+import asyncio
+import os
+
+import asyncpg
+
+import db
+import migrations
+
+USER_ID = 9_600_000_000_000
+
+SESSION_STATE_SQL = """
+SELECT (SELECT count(*) FROM pg_locks WHERE locktype = 'advisory' AND pid = pg_backend_pid()) AS advisory_locks,
+       (SELECT count(*) FROM pg_listening_channels()) AS listening,
+       (SELECT count(*) FROM pg_settings WHERE source = 'session') AS settings,
+       (SELECT count(*) FROM pg_class WHERE relnamespace = pg_my_temp_schema()) AS temp_relations
+"""
+
+# Ключ bigint лежить у pg_locks як classid (старші 32 біти) і objid
+MIGRATION_LOCK_SQL = """
+SELECT pid FROM pg_locks
+WHERE locktype = 'advisory' AND granted AND objsubid = 1
+  AND (classid::bigint << 32 | objid::bigint) = $1
+"""
+
+
+async def pooled_state(pool: asyncpg.Pool) -> tuple[set[int], list[dict]]:
+    """pid і сесійний стан кожного з'єднання пулу."""
+    size = pool.get_size()
+    conns = [await pool.acquire() for _ in range(size)]
+    try:
+        pids = {await conn.fetchval("SELECT pg_backend_pid()") for conn in conns}
+        states = [dict(await conn.fetchrow(SESSION_STATE_SQL)) for conn in conns]
+    finally:
+        for conn in conns:
+            await pool.release(conn)
+    return pids, states
+
+
+def clean(states: list[dict]) -> bool:
+    return all(not any(state.values()) for state in states)
+
+
+async def check_migration_lock() -> dict:
+    name = f"shop_check_pool_{os.getpid()}"
+    params = {**db._connection_params(), 'database': name}
+    admin = await asyncpg.connect(**db._connection_params())
+    await admin.execute(f'CREATE DATABASE "{name}"')
+    try:
+        pool = await asyncpg.create_pool(
+            **params, min_size=2, max_size=2, max_inactive_connection_lifetime=0, connection_class=db.ShopConnection
+        )
+        blocker = await asyncpg.connect(**params)
+        monitor = await asyncpg.connect(**params)
+        try:
+            pool_pids, _ = await pooled_state(pool)
+            # Тримаємо lock, поки upgrade не почне його опитувати, щоб монітор
+            # устиг побачити, на якому з'єднанні lock буде взято
+            await blocker.execute("SELECT pg_advisory_lock($1)", migrations.LOCK_KEY)
+            upgrade = asyncio.create_task(migrations.upgrade(pool, params))
+            await asyncio.sleep(migrations.LOCK_POLL_INTERVAL / 2)
+            blocker_pid = await blocker.fetchval("SELECT pg_backend_pid()")
+            await blocker.execute("SELECT pg_advisory_unlock($1)", migrations.LOCK_KEY)
+            lock_pids = set()
+            while not upgrade.done():
+                lock_pids.update(row['pid'] for row in await monitor.fetch(MIGRATION_LOCK_SQL, migrations.LOCK_KEY))
+            applied = upgrade.result()
+            lock_pids.discard(blocker_pid)
+            pids_after, states = await pooled_state(pool)
+        finally:
+            await blocker.close()
+            await monitor.close()
+            await pool.close()
+    finally:
+        await admin.execute(f'DROP DATABASE IF EXISTS "{name}"')
+        await admin.close()
+    print(f"applied {len(applied)} migrations; lock held by {sorted(lock_pids)}, pool {sorted(pool_pids | pids_after)}")
+    return {
+        'every migration applied to an empty database': applied == [m.version for m in migrations.MIGRATIONS],
+        'migration lock observed': bool(lock_pids),
+        'migration lock taken outside the pool': not lock_pids & (pool_pids | pids_after),
+        'pool connections clean after upgrade': clean(states),
+    }
+
+
+async def check_pool() -> dict:
+    await db.init_pool()
+    try:
+        await db.enable_pg_invalidation()
+        await db.get_user(USER_ID)
+        await db.invalidate_user(USER_ID)
+        await db.get_stats()
+        _, states = await pooled_state(db.pool)
+        listening = await db._listen_conn.fetchval("SELECT count(*) FROM pg_listening_channels()")
+    finally:
+        await db.close_pool()
+    return {
+        'LISTEN on its own connection': listening == 1,
+        'pool connections clean after db.* calls': clean(states),
+    }
+
+
+async def main():
+    checks = {**await check_migration_lock(), **await check_pool()}
+    for name, ok in checks.items():
+        print(f"{'OK  ' if ok else 'FAIL'} {name}")
+    if not all(checks.values()):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,16 @@
+"""Прибирання за інструментами в tools/.
+
+Тестові користувачі проходять через ті самі запити, що й справжні, тож
+лишають слід у daily_stats, stats_totals і user_activity. Простого DELETE
+з users мало: після нього зведення перераховуються з того, що лишилося.
+"""
+import db
+
+
+async def delete_users(first: int, last: int):
+    """Видаляє користувачів first <= user_id < last (з платежами й замовленнями) і їхній внесок у зведення."""
+    async with db.pool.acquire() as conn:
+        await conn.execute("DELETE FROM user_activity WHERE user_id >= $1 AND user_id < $2", first, last)
+        await conn.execute("DELETE FROM users WHERE user_id >= $1 AND user_id < $2", first, last)
+    await db.rebuild_stats_totals()
+    await db.rebuild_daily_stats()
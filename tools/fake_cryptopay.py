@@ -0,0 +1,171 @@
+"""Локальний фейковий CryptoPay для офлайн-перевірок.
+
+Надсилає підписане оновлення invoice_paid на вебхук бота:
+
+    python -m tools.fake_cryptopay send --user-id 123 --amount 5 --invoice-id 1001
+
+Або піднімає фейковий API (createInvoice, getInvoices, getExchangeRates), на який можна
+направити AioCryptoPay через network='http://127.0.0.1:8091':
+
+    python -m tools.fake_cryptopay serve --port 8091 --pay-delay 2
+"""
+import argparse
+import asyncio
+import itertools
+import json
+from collections import Counter
+from datetime import datetime, timezone
+
+import aiohttp
+from aiohttp import web
+
+from config import CRYPTO_TOKEN, CRYPTO_WEBHOOK_PORT, CRYPTO_WEBHOOK_PATH
+from cryptopay_webhook import SIGNATURE_HEADER, sign_body
+from payments import make_payload
+
+_update_ids = iter(range(1, 1 << 62))
+
+# Курси до USD, які віддає getExchangeRates
+USD_RATES = {'USDT': 1.0, 'TON': 3.2, 'BTC': 65000.0, 'ETH': 3100.0, 'USDC': 1.0}
+
+
+def make_invoice(invoice_id: int, amount: float, status: str = 'paid', payload: str | None = None, asset: str = 'USDT') -> dict:
+    now = datetime.now(timezone.utc).isoformat()
+    invoice = {
+        'invoice_id': invoice_id,
+        'hash': f'IV{invoice_id}',
+        'currency_type': 'crypto',
+        'asset': asset,
+        'amount': str(amount),
+        'bot_invoice_url': f'https://t.me/CryptoBot?start=IV{invoice_id}',
+        'web_app_invoice_url': f'https://app.send.tg/invoices/IV{invoice_id}',
+        'mini_app_invoice_url': f'https://t.me/CryptoBot/app?startapp=invoice-IV{invoice_id}',
+        'status': status,
+        'created_at': now,
+        'allow_comments': True,
+        'allow_anonymous': True,
+        'payload': payload,
+    }
+    if status == 'paid':
+        invoice['paid_at'] = now
+        invoice['paid_asset'] = asset
+        invoice['paid_amount'] = str(amount)
+    return invoice
+
+
+def make_paid_update(invoice: dict) -> str:
+    return json.dumps({
+        'update_id': next(_update_ids),
+        'update_type': 'invoice_paid',
+        'request_date': datetime.now(timezone.utc).isoformat(),
+        'payload': invoice,
+    })
+
+
+class FakeCryptoPay:
+    """Фейковий CryptoPay API: інвойси стають оплаченими через pay_delay секунд.
+
+    pay_delay=None — інвойси лишаються активними, доки їх не оплатять через pay().
+    """
+
+    def __init__(self, pay_delay: float | None = 0.0, first_invoice_id: int = 1):
+        self.pay_delay = pay_delay
+        self.invoices: dict[int, dict] = {}
+        self.calls = Counter()
+        self.usd_rates = dict(USD_RATES)
+        self._ids = itertools.count(first_invoice_id)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route('*', '/api/{method}', self.handle)
+        return app
+
+    def create(self, amount: float, asset: str = 'USDT', payload: str | None = None) -> dict:
+        invoice = make_invoice(next(self._ids), amount, status='active', payload=payload, asset=asset)
+        self.invoices[invoice['invoice_id']] = invoice
+        return invoice
+
+    def pay(self, invoice_id: int):
+        invoice = self.invoices[invoice_id]
+        if invoice['status'] != 'paid':
+            paid = make_invoice(invoice_id, float(invoice['amount']), payload=invoice['payload'], asset=invoice['asset'])
+            paid['created_at'] = invoice['created_at']
+            self.invoices[invoice_id] = paid
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        params = request.query
+        self.calls[method] += 1
+        if method == 'createInvoice':
+            invoice = self.create(float(params['amount']), params.get('asset', 'USDT'), params.get('payload'))
+            if self.pay_delay == 0:
+                self.pay(invoice['invoice_id'])
+            elif self.pay_delay is not None:
+                asyncio.get_running_loop().call_later(self.pay_delay, self.pay, invoice['invoice_id'])
+            result = self.invoices[invoice['invoice_id']]
+        elif method == 'getInvoices':
+            result = {'items': self._select(params)}
+        elif method == 'getExchangeRates':
+            result = [
+                {'is_valid': True, 'is_crypto': True, 'is_fiat': False, 'source': asset, 'target': 'USD', 'rate': str(rate)}
+                for asset, rate in self.usd_rates.items()
+            ]
+        else:
+            return web.json_response({'ok': False, 'error': {'code': 405, 'name': 'METHOD_NOT_FOUND'}})
+        return web.json_response({'ok': True, 'result': result})
+
+    def _select(self, params) -> list[dict]:
+        if 'invoice_ids' in params:
+            ids = [int(i) for i in params['invoice_ids'].split(',') if i]
+            items = [self.invoices[i] for i in ids if i in self.invoices]
+        else:
+            # Як і справжній API — від новіших до старіших
+            items = [self.invoices[i] for i in sorted(self.invoices, reverse=True)]
+        if 'status' in params:
+            items = [i for i in items if i['status'] == params['status']]
+        offset = int(params.get('offset', 0))
+        count = int(params.get('count', 100))
+        return items[offset:offset + count]
+
+
+async def send_update(session: aiohttp.ClientSession, url: str, body: str, token: str = CRYPTO_TOKEN) -> int:
+    headers = {SIGNATURE_HEADER: sign_body(token, body), 'Content-Type': 'application/json'}
+    async with session.post(url, data=body, headers=headers) as response:
+        return response.status
+
+
+async def send(args):
+    invoice = make_invoice(args.invoice_id, args.amount, payload=make_payload(args.user_id, args.amount))
+    body = make_paid_update(invoice)
+    async with aiohttp.ClientSession() as session:
+        for _ in range(args.repeat):
+            status = await send_update(session, args.url, body, token=args.token)
+            print(f'invoice {args.invoice_id}: HTTP {status}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake CryptoPay')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = sub.add_parser('serve', help='run a fake CryptoPay API')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8091)
+    serve_parser.add_argument('--pay-delay', type=float, default=0.0, help='seconds until a new invoice is paid')
+
+    send_parser = sub.add_parser('send', help='send a signed invoice_paid update')
+    send_parser.add_argument('--url', default=f'http://127.0.0.1:{CRYPTO_WEBHOOK_PORT}{CRYPTO_WEBHOOK_PATH}')
+    send_parser.add_argument('--user-id', type=int, required=True)
+    send_parser.add_argument('--amount', type=float, required=True)
+    send_parser.add_argument('--invoice-id', type=int, required=True)
+    send_parser.add_argument('--repeat', type=int, default=1, help='resend to check idempotency')
+    send_parser.add_argument('--token', default=CRYPTO_TOKEN, help='signing token (use a wrong one to check rejection)')
+
+    args = parser.parse_args()
+    if args.command == 'send':
+        asyncio.run(send(args))
+    elif args.command == 'serve':
+        web.run_app(FakeCryptoPay(pay_delay=args.pay_delay).app(), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
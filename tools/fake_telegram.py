@@ -0,0 +1,127 @@
+"""Локальний фейковий Telegram Bot API для навантажувальних тестів.
+
+Відповідає на методи, якими користується бот, правдоподібними об'єктами
+і рахує виклики. Бот направляється сюди через TelegramAPIServer.from_base.
+
+    python -m tools.fake_telegram --port 8090
+"""
+import argparse
+import asyncio
+import html
+import json
+import re
+import time
+from collections import Counter, defaultdict
+
+from aiohttp import web
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'ShopBot', 'username': 'shop_bot'}
+
+# Теги й сутності, які Telegram приймає з parse_mode HTML
+_HTML_TAG = re.compile(r'</?(b|strong|i|em|u|ins|s|strike|del|code|pre|a|tg-spoiler|blockquote)(\s[^<>]*)?>')
+_HTML_ENTITY = re.compile(r'&(lt|gt|amp|quot|#\d+|#x[0-9a-fA-F]+);')
+
+
+def parse_html(text: str) -> str | None:
+    """Текст, як його покаже Telegram, або None, якщо Telegram відхилить розмітку."""
+    plain = _HTML_TAG.sub('', text)
+    if '<' in plain or '&' in _HTML_ENTITY.sub('', plain):
+        return None
+    return html.unescape(plain)
+
+
+class FakeTelegram:
+    def __init__(self, latency: float = 0.0):
+        # Штучна затримка відповіді, щоб імітувати мережу до api.telegram.org
+        self.latency = latency
+        self.calls = Counter()
+        self.sent = defaultdict(list)
+        self.waiters = []
+        self._message_ids = defaultdict(int)
+        # Чати, що заблокували бота: надсилання в них повертає 403
+        self.blocked: set[int] = set()
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route('*', '/bot{token}/{method}', self.handle)
+        return app
+
+    def _message(self, chat_id: int, text: str | None = None, message_id: int | None = None) -> dict:
+        if message_id is None:
+            self._message_ids[chat_id] += 1
+            message_id = self._message_ids[chat_id]
+        message = {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+        }
+        if text is not None:
+            message['text'] = text
+        return message
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        if request.content_type == 'application/json':
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        chat_id = int(params.get('chat_id', 0) or 0)
+        text = params.get('text')
+        if chat_id in self.blocked:
+            return web.json_response(
+                {'ok': False, 'error_code': 403, 'description': 'Forbidden: bot was blocked by the user'},
+                status=403,
+            )
+        if text is not None and params.get('parse_mode') == 'HTML':
+            text = parse_html(text)
+            if text is None:
+                return web.json_response(
+                    {'ok': False, 'error_code': 400, 'description': "Bad Request: can't parse entities"},
+                    status=400,
+                )
+        if method in ('sendMessage', 'sendSticker'):
+            result = self._message(chat_id, text)
+            self._record(chat_id, text)
+        elif method == 'editMessageText':
+            result = self._message(chat_id, text, int(params['message_id']))
+            self._record(chat_id, text)
+        elif method == 'getMe':
+            result = BOT_USER
+        else:
+            # answerCallbackQuery, setWebhook, deleteWebhook, ...
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    def _record(self, chat_id: int, text: str | None):
+        self.sent[chat_id].append(text)
+        for waiter in list(self.waiters):
+            want_chat, prefix, future = waiter
+            if want_chat == chat_id and text and text.startswith(prefix) and not future.done():
+                future.set_result(time.perf_counter())
+                self.waiters.remove(waiter)
+
+    def wait_for_text(self, chat_id: int, prefix: str) -> asyncio.Future:
+        """Future з часом (perf_counter), коли в чат прийде текст з prefix."""
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append((chat_id, prefix, future))
+        return future
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Telegram Bot API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency', type=float, default=0.0)
+    args = parser.parse_args()
+    fake = FakeTelegram(latency=args.latency)
+    web.run_app(fake.app(), host=args.host, port=args.port)
+    print(json.dumps(fake.calls))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+"""Навантажувальний тест: N користувачів проходять основні сценарії main.py.
+
+/start -> введення ігрового ID -> "🖥 Головне меню" -> topup -> сума ->
+оплачений інвойс -> навігація buy_loot. Бот працює проти локальних
+фейкових Telegram Bot API і CryptoPay, база — з config.py.
+
+    python -m tools.loadtest --users 1000 --concurrency 200 --output before.json
+    python -m tools.loadtest --users 1000 --concurrency 200 --output after.json --baseline before.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import platform
+import statistics
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+import db
+import main as shop
+from outbox import TokenBucket
+from tools.cleanup import delete_users
+from tools.fake_cryptopay import FakeCryptoPay
+from tools.fake_telegram import FakeTelegram
+
+# Діапазон user_id, що не перетинається з реальними Telegram id
+USER_BASE = 9_100_000_000_000
+LOOT_NAVIGATION = ('buy_loot', '6_level', 'mk14_6', '6_level', 'buy_loot', 'gold_stuff', 'buy_loot', 'back_to_cabinet')
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1_000_000)
+
+
+class HandlerTimer(BaseMiddleware):
+    """Внутрішній middleware: час виконання кожного хендлера за його ім'ям."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def __call__(self, handler, event, data):
+        name = data['handler'].callback.__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.errors[name] += 1
+            raise
+        finally:
+            self.samples[name].append(time.perf_counter() - started)
+
+
+def _user(user_id: int) -> User:
+    return User(id=user_id, is_bot=False, first_name=f'user{user_id}')
+
+
+def text_update(user_id: int, text: str) -> Update:
+    return Update(
+        update_id=next(_update_ids),
+        message=Message(
+            message_id=next(_message_ids),
+            date=datetime.now(),
+            chat=Chat(id=user_id, type='private'),
+            from_user=_user(user_id),
+            text=text,
+        ),
+    )
+
+
+def callback_update(user_id: int, data: str, message_id: int) -> Update:
+    return Update(
+        update_id=next(_update_ids),
+        callback_query=CallbackQuery(
+            id=str(next(_update_ids)),
+            from_user=_user(user_id),
+            chat_instance=str(user_id),
+            data=data,
+            message=Message(
+                message_id=message_id,
+                date=datetime.now(),
+                chat=Chat(id=user_id, type='private'),
+                text='menu',
+            ),
+        ),
+    )
+
+
+def summarize(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+
+    def q(p):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000
+
+    return {
+        'count': len(ordered),
+        'mean_ms': statistics.mean(ordered) * 1000,
+        'p50_ms': q(0.50),
+        'p95_ms': q(0.95),
+        'p99_ms': q(0.99),
+        'max_ms': ordered[-1] * 1000,
+    }
+
+
+async def cleanup(users: int):
+    await delete_users(USER_BASE, USER_BASE + users)
+
+
+async def run(args) -> dict:
+    fake_tg = FakeTelegram(latency=args.telegram_latency)
+    fake_cp = FakeCryptoPay(pay_delay=args.pay_delay, first_invoice_id=USER_BASE)
+    runners = []
+    for app, port in ((fake_tg.app(), args.telegram_port), (fake_cp.app(), args.crypto_port)):
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', port).start()
+        runners.append(runner)
+
+    shop.bot.session.api = TelegramAPIServer.from_base(f'http://127.0.0.1:{args.telegram_port}')
+    shop.crypto.network = f'http://127.0.0.1:{args.crypto_port}'
+    shop.poller.interval = args.poll_interval
+    if not args.outbox_limits:
+        # Фейк не має flood control; без цього звіт міряє ліміти Telegram, а не код
+        shop.outbox.global_bucket = TokenBucket(1e9, 1e9)
+        shop.outbox.chat_rate = shop.outbox.chat_burst = 1e9
+    if not args.throttle:
+        # Скрипт шле апдейти швидше за живу людину — антиспам відкинув би частину сценарію
+        shop.throttling.rate = 0
+        shop.throttling.debounce = 0
+
+    timer = HandlerTimer()
+    shop.dp.message.middleware(timer)
+    shop.dp.callback_query.middleware(timer)
+
+    await db.init_pool()
+    await db.sync_items(shop.catalog.item_rows())
+    await cleanup(args.users)
+    await shop.on_startup()
+    await shop.rates.refresh()
+
+    confirmations = []
+    failures = defaultdict(int)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    updates = 0
+
+    async def feed(update: Update):
+        nonlocal updates
+        updates += 1
+        await shop.dp.feed_update(shop.bot, update)
+
+    async def user_flow(i: int):
+        user_id = USER_BASE + i
+        async with semaphore:
+            await feed(text_update(user_id, '/start'))
+            await feed(text_update(user_id, f'5{i:010d}'))
+            await feed(text_update(user_id, '🖥 Головне меню'))
+            cabinet_id = fake_tg._message_ids[user_id]
+            await feed(callback_update(user_id, 'topup', cabinet_id))
+
+            paid = fake_tg.wait_for_text(user_id, '✅ Оплата успішна')
+            sent_at = time.perf_counter()
+            await feed(text_update(user_id, str(args.amount)))
+            await feed(callback_update(user_id, f'{shop.PAY_ASSET_PREFIX}{args.asset}', fake_tg._message_ids[user_id]))
+            try:
+                confirmations.append(await asyncio.wait_for(paid, args.payment_timeout) - sent_at)
+            except asyncio.TimeoutError:
+                failures['payment_timeout'] += 1
+
+            await feed(text_update(user_id, '🖥 Головне меню'))
+            cabinet_id = fake_tg._message_ids[user_id]
+            for data in LOOT_NAVIGATION:
+                await feed(callback_update(user_id, data, cabinet_id))
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(user_flow(i) for i in range(args.users)), return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    for result in results:
+        if isinstance(result, Exception):
+            failures[type(result).__name__] += 1
+
+    # Активність пишеться раз на хвилину: спершу дописуємо, потім прибираємо
+    await shop.activity.stop()
+    await cleanup(args.users)
+    await shop.on_shutdown()
+    await shop.bot.session.close()
+    for runner in runners:
+        await runner.cleanup()
+
+    return {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'params': vars(args),
+        'elapsed_s': elapsed,
+        'updates': updates,
+        'updates_per_s': updates / elapsed,
+        'failures': dict(failures),
+        'handler_errors': dict(timer.errors),
+        'handlers': {name: summarize(samples) for name, samples in sorted(timer.samples.items())},
+        'payment_confirmation': summarize(confirmations) if confirmations else None,
+        'telegram_calls': dict(fake_tg.calls),
+        'cryptopay_calls': dict(fake_cp.calls),
+    }
+
+
+def print_report(report: dict, baseline: dict | None):
+    print(f"{report['updates']} updates in {report['elapsed_s']:.2f} s = {report['updates_per_s']:.0f} upd/s")
+    if report['failures']:
+        print(f"failures: {report['failures']}")
+    rows = dict(report['handlers'])
+    if report['payment_confirmation']:
+        rows['(payment confirmation)'] = report['payment_confirmation']
+    print(f"{'handler':<28}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stats in rows.items():
+        line = f"{name:<28}{stats['count']:>8}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}"
+        base = (baseline or {}).get('handlers', {}).get(name)
+        if name == '(payment confirmation)' and baseline:
+            base = baseline.get('payment_confirmation')
+        if base:
+            line += f"   p95 {stats['p95_ms'] - base['p95_ms']:+.2f} ms"
+        print(line)
+    if baseline:
+        print(f"throughput: {report['updates_per_s'] - baseline['updates_per_s']:+.0f} upd/s vs baseline")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=200, help='users active at once')
+    parser.add_argument('--amount', type=float, default=1.0)
+    parser.add_argument('--asset', default='USDT', help='asset to pay invoices in')
+    parser.add_argument('--pay-delay', type=float, default=0.0, help='seconds until fake CryptoPay marks an invoice paid')
+    parser.add_argument('--poll-interval', type=float, default=0.5)
+    parser.add_argument('--payment-timeout', type=float, default=30)
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help='artificial Bot API latency, seconds')
+    parser.add_argument('--outbox-limits', action='store_true', help='keep production send-queue rate limits')
+    parser.add_argument('--throttle', action='store_true', help='keep per-user anti-spam limits')
+    parser.add_argument('--telegram-port', type=int, default=8090)
+    parser.add_argument('--crypto-port', type=int, default=8091)
+    parser.add_argument('--output', default='loadtest.json')
+    parser.add_argument('--baseline', help='previous --output file to compare with')
+    args = parser.parse_args()
+
+    # Журнал кожного апдейту й HTTP-запиту фейків сам по собі з'їдає цикл подій
+    logging.getLogger('aiogram.event').setLevel(logging.WARNING)
+    logging.getLogger('aiohttp.access').setLevel(logging.WARNING)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    report = await run(args)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print_report(report, baseline)
+    print(f"results written to {args.output}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,394 @@
+"""Відтворення записаних апдейтів (UPDATES_RECORD_PATH) проти фейкових Telegram і CryptoPay.
+
+Апдейти подаються в dp з тими ж інтервалами, що й у записі, поділеними на
+--speed (0 — без пауз). Id користувачів і чатів переносяться в діапазон
+REPLAY_BASE, щоб не чіпати реальні рядки бази; --keep-ids лишає їх як є
+(лише для окремої бази). Звіт — як у tools.loadtest, тож --baseline
+порівнює прогони різних комітів.
+
+Профілювання за хендлерами:
+  --profile cprofile  cProfile на кожен хендлер, файли <хендлер>.prof у
+                      --profile-dir; апдейти обробляються по одному, бо
+                      cProfile не вміє ділити час між задачами
+  --profile sample    потік знімає стек циклу подій кожні --sample-interval
+                      секунд і приписує його хендлеру, що виконується;
+                      результат — samples.folded для flamegraph/speedscope
+
+    python -m tools.replay updates.jsonl.gz --speed 10 --output replay.json
+    python -m tools.replay updates.jsonl.gz --speed 0 --profile sample --baseline replay.json
+"""
+import argparse
+import asyncio
+import cProfile
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.client.telegram import TelegramAPIServer
+
+import db
+import main as shop
+from outbox import TokenBucket
+from recorder import read_recording
+from tools.cleanup import delete_users
+from tools.fake_cryptopay import FakeCryptoPay
+from tools.fake_telegram import FakeTelegram
+from tools.loadtest import HandlerTimer, print_report, summarize
+
+REPLAY_BASE = 9_800_000_000_000
+# Об'єкти апдейту, в яких id — це користувач або приватний чат
+ID_KEYS = ('from', 'chat', 'user', 'sender_chat')
+
+
+class IdMapper:
+    """Замінює id користувачів і чатів на REPLAY_BASE + n, однаково в усіх апдейтах."""
+
+    def __init__(self):
+        self.ids: dict[int, int] = {}
+
+    def map(self, value):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                if key in ID_KEYS and isinstance(item, dict) and isinstance(item.get('id'), int):
+                    item['id'] = self.ids.setdefault(item['id'], REPLAY_BASE + len(self.ids))
+                self.map(item)
+        elif isinstance(value, list):
+            for item in value:
+                self.map(item)
+        return value
+
+
+class HandlerProfiler(BaseMiddleware):
+    """Внутрішній middleware: окремий cProfile на кожен хендлер."""
+
+    def __init__(self):
+        self.profiles: dict[str, cProfile.Profile] = {}
+
+    async def __call__(self, handler, event, data):
+        name = data['handler'].callback.__name__
+        profile = self.profiles.setdefault(name, cProfile.Profile())
+        profile.enable()
+        try:
+            return await handler(event, data)
+        finally:
+            profile.disable()
+
+    def dump(self, directory: str, top: int) -> dict:
+        report = {}
+        for name, profile in sorted(self.profiles.items()):
+            path = os.path.join(directory, f'{name}.prof')
+            profile.dump_stats(path)
+            stats = pstats.Stats(profile)
+            rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:top]
+            report[name] = {
+                'file': path,
+                'total_s': stats.total_tt,
+                'top_self': [
+                    {'function': pstats.func_std_string(func), 'calls': nc, 'self_s': tt, 'cumulative_s': ct}
+                    for func, (cc, nc, tt, ct, callers) in rows
+                ],
+            }
+        return report
+
+
+class StackSampler:
+    """Потік, що періодично знімає стек циклу подій і приписує його хендлеру.
+
+    Хендлер впізнається за кодом його функції в стеку; зовнішній з них —
+    той, що викликав dp. Стек без хендлера — робота циклу, middleware,
+    фонових задач і фейків.
+    """
+
+    OUTSIDE = '(outside handlers)'
+
+    def __init__(self, handler_codes: dict, interval: float):
+        self.handler_codes = handler_codes
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.stacks = Counter()
+        self.skipped = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack, handler, depth = [], None, 0
+            try:
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    if code in self.handler_codes:
+                        handler, depth = self.handler_codes[code], len(stack)
+                    frame = frame.f_back
+            except AttributeError:
+                # Стек чужого потоку змінився під час обходу — пропускаємо вибірку
+                self.skipped += 1
+                continue
+            if handler is not None:
+                stack = stack[:depth]
+            stack.append(handler or self.OUTSIDE)
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump(self, directory: str, top: int) -> dict:
+        path = os.path.join(directory, 'samples.folded')
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        per_handler = Counter()
+        leaves = defaultdict(Counter)
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')
+            per_handler[frames[0]] += count
+            leaves[frames[0]][frames[-1]] += count
+        total = sum(per_handler.values()) or 1
+        return {
+            'file': path,
+            'samples': total,
+            'skipped': self.skipped,
+            'handlers': {
+                name: {
+                    'share': count / total,
+                    'top_self': [{'function': leaf, 'samples': n} for leaf, n in leaves[name].most_common(top)],
+                }
+                for name, count in per_handler.most_common()
+            },
+        }
+
+
+def sender_id(update: dict) -> int | None:
+    for value in update.values():
+        if isinstance(value, dict) and isinstance(value.get('from'), dict):
+            return value['from'].get('id')
+    return None
+
+
+def handler_codes(dispatcher) -> dict:
+    return {
+        handler.callback.__code__: handler.callback.__name__
+        for router in dispatcher.chain_tail
+        for name, observer in router.observers.items()
+        # На update висить службовий _listen_update самого Dispatcher
+        if name != 'update'
+        for handler in observer.handlers
+        if hasattr(handler.callback, '__code__')
+    }
+
+
+async def cleanup(users: int):
+    await delete_users(REPLAY_BASE, REPLAY_BASE + users)
+
+
+async def run(args) -> dict:
+    mapper = IdMapper()
+    entries = []
+    for recorded_at, update in read_recording(args.recording):
+        entries.append((recorded_at, update if args.keep_ids else mapper.map(update)))
+        if args.limit and len(entries) >= args.limit:
+            break
+    if not entries:
+        raise SystemExit(f'{args.recording}: no updates')
+
+    if shop.recorder is not None:
+        # Відтворене не повинне потрапити назад у запис
+        shop.recorder.close()
+
+    fake_tg = FakeTelegram(latency=args.telegram_latency)
+    fake_cp = FakeCryptoPay(pay_delay=args.pay_delay, first_invoice_id=REPLAY_BASE)
+    runners = []
+    for app, port in ((fake_tg.app(), args.telegram_port), (fake_cp.app(), args.crypto_port)):
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', port).start()
+        runners.append(runner)
+
+    shop.bot.session.api = TelegramAPIServer.from_base(f'http://127.0.0.1:{args.telegram_port}')
+    shop.crypto.network = f'http://127.0.0.1:{args.crypto_port}'
+    if not args.outbox_limits:
+        shop.outbox.global_bucket = TokenBucket(1e9, 1e9)
+        shop.outbox.chat_rate = shop.outbox.chat_burst = 1e9
+    if args.speed != 1 and not args.throttle:
+        # Пришвидшений запис перевищив би ліміти, яких живі користувачі не досягали
+        shop.throttling.rate = 0
+        shop.throttling.debounce = 0
+
+    timer = HandlerTimer()
+    shop.dp.message.middleware(timer)
+    shop.dp.callback_query.middleware(timer)
+    profiler = sampler = None
+    concurrency = args.concurrency
+    if args.profile == 'cprofile':
+        profiler = HandlerProfiler()
+        shop.dp.message.middleware(profiler)
+        shop.dp.callback_query.middleware(profiler)
+        concurrency = 1
+
+    await db.init_pool()
+    await db.sync_items(shop.catalog.item_rows())
+    if not args.keep_ids:
+        await cleanup(len(mapper.ids))
+    await shop.on_startup()
+    if len(shop.PAYMENT_ASSETS) > 1:
+        await shop.rates.refresh()
+
+    if args.profile == 'sample':
+        sampler = StackSampler(handler_codes(shop.dp), args.sample_interval)
+        sampler.start()
+
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = Counter()
+    lag = []
+
+    # Користувач -> задача його попереднього апдейту. Наступний апдейт
+    # користувач надіслав, уже побачивши відповідь на попередній, тож
+    # апдейти одного користувача обробляються по черзі, різних — паралельно.
+    previous_task: dict[int, asyncio.Task] = {}
+
+    async def feed(update: dict, previous: asyncio.Task | None):
+        if previous is not None:
+            await asyncio.wait([previous])
+        async with semaphore:
+            try:
+                await shop.dp.feed_raw_update(shop.bot, update)
+            except Exception as e:
+                failures[type(e).__name__] += 1
+
+    tasks = []
+    first = previous = entries[0][0]
+    started = time.perf_counter()
+    offset = 0.0
+    for recorded_at, update in entries:
+        # Довгі паузи (нічні години, перезапуски) стискаються до --max-gap
+        offset += min(recorded_at - previous, args.max_gap)
+        previous = recorded_at
+        if args.speed:
+            delay = started + offset / args.speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            lag.append(max(-delay, 0))
+        user_id = sender_id(update)
+        task = asyncio.create_task(feed(update, previous_task.get(user_id)))
+        if user_id is not None:
+            previous_task[user_id] = task
+        tasks.append(task)
+        if concurrency == 1:
+            await task
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    if sampler is not None:
+        sampler.stop()
+    os.makedirs(args.profile_dir, exist_ok=True)
+    profile = None
+    if profiler is not None:
+        profile = profiler.dump(args.profile_dir, args.top)
+    elif sampler is not None:
+        profile = sampler.dump(args.profile_dir, args.top)
+
+    # Активність пишеться раз на хвилину: спершу дописуємо, потім прибираємо
+    await shop.activity.stop()
+    if not args.keep_ids:
+        await cleanup(len(mapper.ids))
+    await shop.on_shutdown()
+    await shop.bot.session.close()
+    for runner in runners:
+        await runner.cleanup()
+
+    return {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'params': vars(args),
+        'recording': {
+            'updates': len(entries),
+            'users': len(mapper.ids) if not args.keep_ids else None,
+            'span_s': entries[-1][0] - first,
+        },
+        'elapsed_s': elapsed,
+        'updates': len(entries),
+        'updates_per_s': len(entries) / elapsed,
+        'schedule_lag': summarize(lag) if lag else None,
+        'failures': dict(failures),
+        'handler_errors': dict(timer.errors),
+        'handlers': {name: summarize(samples) for name, samples in sorted(timer.samples.items())},
+        'payment_confirmation': None,
+        'profile': profile,
+        'telegram_calls': dict(fake_tg.calls),
+        'cryptopay_calls': dict(fake_cp.calls),
+    }
+
+
+def print_profile(profile: dict | None, mode: str | None):
+    if not profile:
+        return
+    if mode == 'cprofile':
+        for name, stats in profile.items():
+            top = stats['top_self'][0] if stats['top_self'] else None
+            line = f"{name:<28}{stats['total_s'] * 1000:>10.1f} ms"
+            if top:
+                line += f"   top: {top['function']} {top['self_s'] * 1000:.1f} ms"
+            print(line)
+        print(f"profiles written to {os.path.dirname(next(iter(profile.values()))['file'])}")
+        return
+    print(f"{profile['samples']} samples")
+    for name, stats in profile['handlers'].items():
+        top = stats['top_self'][0]['function'] if stats['top_self'] else ''
+        print(f"{name:<28}{stats['share'] * 100:>6.1f}%   top: {top}")
+    print(f"folded stacks written to {profile['file']}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('recording', help='file written by UPDATES_RECORD_PATH')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed multiplier, 0 = no pauses')
+    parser.add_argument('--max-gap', type=float, default=5.0, help='longest pause kept from the recording, seconds')
+    parser.add_argument('--limit', type=int, default=0, help='replay only the first N updates')
+    parser.add_argument('--concurrency', type=int, default=shop.MAX_CONCURRENT_UPDATES or 100)
+    parser.add_argument('--keep-ids', action='store_true', help='do not remap user ids (scratch database only)')
+    parser.add_argument('--profile', choices=('cprofile', 'sample'))
+    parser.add_argument('--sample-interval', type=float, default=0.005)
+    parser.add_argument('--profile-dir', default='replay_profile')
+    parser.add_argument('--top', type=int, default=10, help='functions per handler in the report')
+    parser.add_argument('--pay-delay', type=float, default=0.0, help='seconds until fake CryptoPay marks an invoice paid')
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help='artificial Bot API latency, seconds')
+    parser.add_argument('--outbox-limits', action='store_true', help='keep production send-queue rate limits')
+    parser.add_argument('--throttle', action='store_true', help='keep anti-spam limits when --speed is not 1')
+    parser.add_argument('--telegram-port', type=int, default=8094)
+    parser.add_argument('--crypto-port', type=int, default=8095)
+    parser.add_argument('--output', default='replay.json')
+    parser.add_argument('--baseline', help='previous --output file to compare with')
+    args = parser.parse_args()
+
+    logging.getLogger('aiogram.event').setLevel(logging.WARNING)
+    logging.getLogger('aiohttp.access').setLevel(logging.WARNING)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    report = await run(args)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print_report(report, baseline)
+    if report['schedule_lag']:
+        print(f"schedule lag p99 {report['schedule_lag']['p99_ms']:.1f} ms")
+    print_profile(report['profile'], args.profile)
+    print(f"results written to {args.output}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,104 @@
+"""Стрес-тест покупок: багато покупців б'ються за один "гарячий" товар.
+
+Створює тимчасовий товар і покупців у локальній базі з config.py,
+запускає конкурентні db.purchase, звіряє склад, баланси й замовлення
+і прибирає за собою.
+
+    python -m tools.stress_purchase --buyers 500 --attempts 4 --stock 1000
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+from decimal import Decimal
+
+import db
+from tools.cleanup import delete_users
+
+ITEM_ID = 'stress_test_item'
+# Діапазон user_id, що не перетинається з реальними Telegram id
+USER_BASE = 9_000_000_000_000
+
+
+async def setup(buyers: int, balance: float, price: float, stock: int):
+    await cleanup(buyers)
+    async with db.pool.acquire() as conn:
+        await conn.execute(
+            "INSERT INTO items(item_id, title, price, stock) VALUES ($1, 'stress', $2, $3)",
+            ITEM_ID,
+            price,
+            stock,
+        )
+        await conn.executemany(
+            "INSERT INTO users(user_id, game_id, balance) VALUES ($1, 'stress', $2)",
+            [(USER_BASE + i, balance) for i in range(buyers)],
+        )
+
+
+async def cleanup(buyers: int):
+    async with db.pool.acquire() as conn:
+        await conn.execute("DELETE FROM orders WHERE item_id=$1", ITEM_ID)
+        await conn.execute("DELETE FROM items WHERE item_id=$1", ITEM_ID)
+    await delete_users(USER_BASE, USER_BASE + buyers)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--buyers', type=int, default=500)
+    parser.add_argument('--attempts', type=int, default=4, help='purchases each buyer tries')
+    parser.add_argument('--stock', type=int, default=1000)
+    parser.add_argument('--price', type=float, default=1.0)
+    parser.add_argument('--balance', type=float, default=3.0, help='starting balance of each buyer')
+    args = parser.parse_args()
+
+    await db.init_pool()
+    try:
+        await setup(args.buyers, args.balance, args.price, args.stock)
+
+        async def buyer(i: int):
+            return [await db.purchase(USER_BASE + i, ITEM_ID) for _ in range(args.attempts)]
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(buyer(i) for i in range(args.buyers)))
+        elapsed = time.perf_counter() - started
+
+        statuses = Counter(r['status'] for rs in results for r in rs)
+        attempts = args.buyers * args.attempts
+        print(f"attempts: {attempts} in {elapsed:.2f} s ({attempts / elapsed:.0f} attempts/s)")
+        print(f"purchases: {statuses['ok']} ({statuses['ok'] / elapsed:.0f} purchases/s)")
+        print(f"statuses: {dict(statuses)}")
+
+        async with db.pool.acquire() as conn:
+            stock = await conn.fetchval("SELECT stock FROM items WHERE item_id=$1", ITEM_ID)
+            orders, spent = await conn.fetchrow(
+                "SELECT count(*), COALESCE(sum(price), 0) FROM orders WHERE item_id=$1",
+                ITEM_ID,
+            )
+            negative, balance_sum = await conn.fetchrow(
+                """
+                SELECT count(*) FILTER (WHERE balance < 0), sum(balance)
+                FROM users WHERE user_id >= $1 AND user_id < $2
+                """,
+                USER_BASE,
+                USER_BASE + args.buyers,
+            )
+        await cleanup(args.buyers)
+
+        initial_balance = Decimal(str(args.balance)) * args.buyers
+        checks = {
+            'stock never negative': stock >= 0,
+            'orders == sold stock': orders == args.stock - stock,
+            'orders == ok purchases': orders == statuses['ok'],
+            'no negative balances': negative == 0,
+            'debits == order totals': initial_balance - balance_sum == spent,
+        }
+        for name, ok in checks.items():
+            print(f"{'OK  ' if ok else 'FAIL'} {name}")
+        if not all(checks.values()):
+            raise SystemExit(1)
+    finally:
+        await db.close_pool()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
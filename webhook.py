@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import signal
+
+from aiohttp import web
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """Обробляє не більше max_concurrent оновлень одночасно.
+
+    Коли всі слоти зайняті, відповідь Telegram затримується, і він сам
+    притримує наступні оновлення, замість того щоб вони копились у пам'яті.
+    """
+
+    def __init__(self, dispatcher, bot, max_concurrent: int, shutdown_timeout: float, **kwargs):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, **kwargs)
+        self.shutdown_timeout = shutdown_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def _handle_request_background(self, bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        await self._semaphore.acquire()
+        task = asyncio.create_task(self._feed_update(bot, update))
+        self._background_feed_update_tasks.add(task)
+        task.add_done_callback(self._background_feed_update_tasks.discard)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def _feed_update(self, bot, update: dict):
+        try:
+            await self._background_feed_update(bot=bot, update=update)
+        finally:
+            self._semaphore.release()
+
+    async def close(self):
+        # Нові оновлення вже не приймаються — чекаємо хендлери, що працюють.
+        # Сесію бота закриваємо в on_cleanup, після shutdown диспетчера.
+        tasks = set(self._background_feed_update_tasks)
+        if not tasks:
+            return
+        logging.info(f"Очікування {len(tasks)} незавершених оновлень")
+        _, pending = await asyncio.wait(tasks, timeout=self.shutdown_timeout)
+        if pending:
+            logging.warning(f"{len(pending)} оновлень не завершились за {self.shutdown_timeout} с")
+            for task in pending:
+                task.cancel()
+
+
+async def run_webhook(
+    dp,
+    bot,
+    *,
+    base_url: str,
+    path: str,
+    host: str,
+    port: int,
+    secret: str | None = None,
+    max_concurrent: int = 100,
+    shutdown_timeout: float = 30,
+    setup_routes=None,
+):
+    """Запускає aiohttp-сервер для вебхука Telegram і працює до SIGINT/SIGTERM.
+
+    Порядок зупинки: закриття сокета -> очікування хендлерів ->
+    dp.shutdown (poller, crypto, db.pool) -> закриття сесії бота.
+    """
+    app = web.Application()
+    handler = BoundedRequestHandler(
+        dp,
+        bot,
+        max_concurrent=max_concurrent,
+        shutdown_timeout=shutdown_timeout,
+        secret_token=secret,
+    )
+    handler.register(app, path=path)
+    if setup_routes is not None:
+        setup_routes(app)
+    setup_application(app, dp, bot=bot)
+
+    async def close_bot_session(_app):
+        await bot.session.close()
+
+    app.on_cleanup.append(close_bot_session)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    await bot.set_webhook(
+        base_url.rstrip('/') + path,
+        secret_token=secret,
+        # Telegram дозволяє від 1 до 100 одночасних з'єднань
+        max_connections=max(1, min(max_concurrent, 100)),
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    logging.info(f"Вебхук слухає {host}:{port}{path}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()